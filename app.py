@@ -5,19 +5,37 @@ Interface Streamlit
 Execute com: streamlit run app.py
 """
 
+import importlib
+import threading
 import streamlit as st
-import polars as pl
 from datetime import datetime
+from pathlib import Path
+
+# Módulos do core são carregados no primeiro uso (core.<nome>): a tela de
+# login e a de boas-vindas não importam Polars, xlsxwriter nem o gerador demo
+import core
+from core import EXTENSOES_ACEITAS
+
+
+ARQUIVO_CSS = Path(__file__).parent / "assets" / "estilo.css"
+
+# Importados em segundo plano depois da primeira renderização
+MODULOS_PREAQUECIDOS = ["core.entrada", "core.cache_compartilhado", "core.pipeline"]
+
+
+@st.cache_resource
+def carregar_css() -> str:
+    """Folha de estilo lida uma vez por processo e reaproveitada a cada rerun"""
+    return f"<style>\n{ARQUIVO_CSS.read_text(encoding='utf-8')}</style>"
 
-# Importar módulos do core
-from core.leitor_sped import processar_sped_ecd, carregar_arquivo_upload
-from core.testes_auditoria import (
-    teste_saldos_invertidos, 
-    gerar_resumo_balancete,
-    get_emoji_severidade,
-)
-from core.exportador import exportar_relatorio_completo
-from dados_demo.demo_generator import gerar_dados_demonstracao
+
+@st.cache_resource
+def preaquecer_modulos() -> None:
+    """Importa os módulos pesados em uma thread, enquanto o usuário escolhe o arquivo"""
+    def importar():
+        for modulo in MODULOS_PREAQUECIDOS:
+            importlib.import_module(modulo)
+    threading.Thread(target=importar, daemon=True).start()
 
 
 # ============================================
@@ -84,60 +102,7 @@ check_password()
 
 
 # CSS Customizado
-st.markdown("""
-<style>
-    /* Cards de métricas */
-    .metric-card {
-        background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-        padding: 20px;
-        border-radius: 10px;
-        color: white;
-        text-align: center;
-        margin: 10px 0;
-    }
-    
-    .metric-card-red {
-        background: linear-gradient(135deg, #f093fb 0%, #f5576c 100%);
-    }
-    
-    .metric-card-yellow {
-        background: linear-gradient(135deg, #f6d365 0%, #fda085 100%);
-    }
-    
-    .metric-card-green {
-        background: linear-gradient(135deg, #11998e 0%, #38ef7d 100%);
-    }
-    
-    /* Header */
-    .main-header {
-        font-size: 2.5rem;
-        font-weight: 700;
-        color: #1a1a2e;
-        margin-bottom: 0;
-    }
-    
-    .sub-header {
-        color: #666;
-        font-size: 1.1rem;
-        margin-top: 0;
-    }
-    
-    /* Tabela de achados */
-    .achado-critico {
-        background-color: #fee2e2 !important;
-        border-left: 4px solid #dc2626 !important;
-    }
-    
-    .achado-atencao {
-        background-color: #fef3c7 !important;
-        border-left: 4px solid #f59e0b !important;
-    }
-    
-    /* Esconder o menu hamburger e footer do Streamlit */
-    #MainMenu {visibility: hidden;}
-    footer {visibility: hidden;}
-</style>
-""", unsafe_allow_html=True)
+st.markdown(carregar_css(), unsafe_allow_html=True)
 
 
 # ============================================
@@ -146,10 +111,26 @@ st.markdown("""
 if "dados_carregados" not in st.session_state:
     st.session_state.dados_carregados = False
     st.session_state.empresa = None
-    st.session_state.df_plano = None
-    st.session_state.df_saldos = None
-    st.session_state.achados = []
+    # Referência à escrituração no cache compartilhado entre sessões
+    st.session_state.dados = None
     st.session_state.stats = {}
+    # Relatório consolidado da última auditoria de portfólio
+    st.session_state.portfolio = None
+
+
+# Chave da escrituração de demonstração no cache compartilhado (não é um
+# hash de conteúdo: publicada como não persistente, nunca vai para o disco)
+HASH_DEMONSTRACAO = "demonstracao"
+
+
+def carregar_achados(referencia):
+    """Achados da escrituração: reaproveita os de outra sessão ou executa o teste"""
+    dados = referencia.dados
+    if dados.achados is not None:
+        return dados.achados
+    achados = core.executar_testes(referencia.hash_conteudo, dados.df_saldos, dados.df_plano)
+    core.obter_cache_compartilhado().anexar_achados(referencia.hash_conteudo, achados)
+    return achados
 
 
 # ============================================
@@ -164,9 +145,9 @@ with st.sidebar:
     
     # Opção 1: Upload de arquivo
     arquivo_upload = st.file_uploader(
-        "Arquivo SPED ECD (.txt)",
-        type=["txt"],
-        help="Selecione o arquivo SPED ECD exportado do sistema contábil"
+        "Arquivo SPED ECD (.txt, .zip, .gz, .zst)",
+        type=EXTENSOES_ACEITAS,
+        help="Selecione o arquivo SPED ECD exportado do sistema contábil (pode estar compactado; um .zip pode conter várias ECDs)"
     )
     
     st.markdown("**ou**")
@@ -174,17 +155,19 @@ with st.sidebar:
     # Opção 2: Dados de demonstração
     if st.button("🎭 Usar Dados Demo", use_container_width=True, type="secondary"):
         with st.spinner("Gerando dados de demonstração..."):
-            empresa, df_plano, df_saldos = gerar_dados_demonstracao()
+            cache = core.obter_cache_compartilhado()
+            referencia = cache.obter(HASH_DEMONSTRACAO)
+            if referencia is None:
+                from dados_demo.demo_generator import gerar_dados_demonstracao
+                empresa, df_plano, df_saldos = gerar_dados_demonstracao()
+                referencia = cache.publicar(HASH_DEMONSTRACAO, empresa, df_plano, df_saldos, persistente=False)
             
-            st.session_state.empresa = empresa
-            st.session_state.df_plano = df_plano
-            st.session_state.df_saldos = df_saldos
+            st.session_state.empresa = referencia.dados.empresa
+            st.session_state.dados = referencia
             st.session_state.dados_carregados = True
             
-            # Executar teste
-            achados, stats = teste_saldos_invertidos(df_saldos)
-            st.session_state.achados = achados
-            st.session_state.stats = stats
+            # Executar teste (ou reaproveitar achados já calculados)
+            st.session_state.stats = core.estatisticas_achados(carregar_achados(referencia))
             
         st.success("✅ Dados demo carregados!")
         st.rerun()
@@ -193,24 +176,112 @@ with st.sidebar:
     if arquivo_upload is not None:
         if st.button("⚡ Processar Arquivo", use_container_width=True, type="primary"):
             with st.spinner("Processando arquivo SPED..."):
-                conteudo = carregar_arquivo_upload(arquivo_upload)
-                empresa, df_plano, df_saldos, status = processar_sped_ecd(conteudo)
+                armazem = core.ArmazemAuditoria()
+                cache = core.obter_cache_compartilhado()
+                exibido = None
+                qtd_processados = 0
                 
-                if "✅" in status:
-                    st.session_state.empresa = empresa
-                    st.session_state.df_plano = df_plano
-                    st.session_state.df_saldos = df_saldos
-                    st.session_state.dados_carregados = True
+                # Texto ou compactado (zip com uma ou mais ECDs, gzip, zstd), lido em streaming
+                for processado in core.processar_arquivos_sped(arquivo_upload, arquivo_upload.name):
+                    if "✅" not in processado.status:
+                        st.error(f"{processado.nome}: {processado.status}")
+                        continue
+                    
+                    # Mesma escrituração aberta por outra sessão: reaproveita a cópia em memória
+                    referencia = cache.publicar(
+                        processado.hash_conteudo,
+                        processado.empresa,
+                        processado.df_plano,
+                        processado.df_saldos,
+                    )
                     
                     # Executar teste
-                    achados, stats = teste_saldos_invertidos(df_saldos)
-                    st.session_state.achados = achados
-                    st.session_state.stats = stats
+                    achados = carregar_achados(referencia)
+                    stats = core.estatisticas_achados(achados)
+                    qtd_processados += 1
                     
-                    st.success(status)
+                    # Persistir no armazém local para consultas de portfólio
+                    if processado.empresa:
+                        try:
+                            armazem.gravar(processado.empresa, processado.df_plano, processado.df_saldos, achados)
+                        except (OSError, ValueError) as erro:
+                            st.warning(f"⚠️ Não foi possível gravar no armazém local: {erro}")
+                    
+                    if exibido is None:
+                        exibido = processado
+                        st.session_state.empresa = processado.empresa
+                        st.session_state.dados = referencia
+                        st.session_state.dados_carregados = True
+                        st.session_state.stats = stats
+                
+                if exibido is not None:
+                    if qtd_processados > 1:
+                        st.success(f"✅ {qtd_processados} escriturações processadas e gravadas no armazém")
+                    else:
+                        st.success(exibido.status)
                     st.rerun()
-                else:
-                    st.error(status)
+    
+    st.divider()
+    
+    # Opção 3: Portfólio (várias empresas de um grupo econômico)
+    st.markdown("### 📚 Portfólio")
+    arquivos_portfolio = st.file_uploader(
+        "ECDs do grupo econômico",
+        type=EXTENSOES_ACEITAS,
+        accept_multiple_files=True,
+        key="arquivos_portfolio",
+        help="Processadas em paralelo; gera um relatório consolidado com achados por empresa, totais e conciliação intercompany"
+    )
+    
+    if arquivos_portfolio and st.button("🏢 Auditar Portfólio", use_container_width=True):
+        import tempfile
+        
+        progresso = st.progress(0.0, text="Processando escriturações...")
+        
+        def atualizar_progresso(concluidos, total, nome):
+            progresso.progress(concluidos / total, text=f"{concluidos}/{total} · {nome}")
+        
+        # Os processos leem os arquivos do disco
+        with tempfile.TemporaryDirectory() as pasta:
+            caminhos = []
+            for indice, arquivo in enumerate(arquivos_portfolio):
+                caminho = Path(pasta) / f"{indice:03d}_{Path(arquivo.name).name}"
+                caminho.write_bytes(arquivo.getbuffer())
+                caminhos.append(caminho)
+            
+            resultado = core.auditar_portfolio(
+                caminhos,
+                armazem=core.ArmazemAuditoria(),
+                ao_concluir=atualizar_progresso,
+            )
+        
+        for empresa in resultado.empresas:
+            if not empresa.sucesso:
+                st.error(f"{empresa.nome}: {empresa.status}")
+        
+        intercompany = resultado.intercompany()
+        st.session_state.portfolio = {
+            "empresas": len(resultado.processadas),
+            "achados": sum(e.achados.height for e in resultado.processadas),
+            "pendencias": int((~intercompany["conciliado"]).sum()) if not intercompany.is_empty() else 0,
+            "segundos": resultado.segundos,
+            "excel": core.exportar_portfolio_excel(resultado).getvalue(),
+        }
+    
+    if st.session_state.portfolio:
+        portfolio = st.session_state.portfolio
+        st.success(
+            f"✅ {portfolio['empresas']} empresas · {portfolio['achados']} achados · "
+            f"{portfolio['pendencias']} pares intercompany divergentes "
+            f"({portfolio['segundos']:.1f}s)"
+        )
+        st.download_button(
+            label="⬇️ Relatório Consolidado",
+            data=portfolio["excel"],
+            file_name=f"audiper_portfolio_{datetime.now().strftime('%Y%m%d_%H%M')}.xlsx",
+            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+            use_container_width=True,
+        )
     
     st.divider()
     
@@ -220,9 +291,20 @@ with st.sidebar:
     **Versão:** MVP 1.0  
     **Testes disponíveis:**
     - ✅ Saldos Invertidos
+    - ✅ Centros de Custo
+    - ✅ Conciliação J100/J150
     - 🔜 Caixa Estourado
     - 🔜 Variação Horizontal
     """)
+    
+    # Métricas só depois da primeira carga (o cache já está importado)
+    if st.session_state.dados_carregados:
+        metricas_cache = core.obter_cache_compartilhado().metricas()
+        st.caption(
+            f"Cache compartilhado: {metricas_cache['entradas']} escriturações · "
+            f"{metricas_cache['bytes_residentes'] / 1024 ** 2:,.1f} MB · "
+            f"acerto {metricas_cache['taxa_acerto']:.0%}"
+        )
 
 
 # ============================================
@@ -244,7 +326,7 @@ if not st.session_state.dados_carregados:
         st.markdown("""
         ### Como usar:
         
-        1. **Faça upload** do arquivo SPED ECD (.txt) na barra lateral
+        1. **Faça upload** do arquivo SPED ECD (.txt ou compactado) na barra lateral
         2. Clique em **Processar Arquivo**
         3. Visualize os **achados de auditoria**
         4. **Exporte** o relatório em Excel
@@ -265,12 +347,14 @@ if not st.session_state.dados_carregados:
         | 🔜 Variação Horizontal | Compara ano atual vs anterior |
         """)
     
+    preaquecer_modulos()
     st.stop()
 
 
 # ============================================
 # DASHBOARD (quando há dados)
 # ============================================
+import polars as pl
 
 # Informações da Empresa
 empresa = st.session_state.empresa
@@ -289,8 +373,9 @@ if empresa:
 # Métricas dos Achados
 st.markdown("### 📊 Resumo da Auditoria")
 
+dados = st.session_state.dados.dados
 stats = st.session_state.stats
-achados = st.session_state.achados
+achados = dados.achados if dados.achados is not None else core.achados_vazios()
 
 col1, col2, col3, col4 = st.columns(4)
 
@@ -327,14 +412,35 @@ with col4:
 st.divider()
 
 
+# Materialidade (derivada do cubo de saldos, memorizado por escrituração)
+with st.expander("⚖️ Materialidade"):
+    percentual_global = st.number_input(
+        "Materialidade global (% do Ativo)",
+        min_value=0.1,
+        max_value=10.0,
+        value=1.0,
+        step=0.1,
+        help="Materialidade por natureza: percentual do total da natureza, limitada à global",
+    )
+    cubo = core.gerar_cubo_saldos(dados.df_saldos, dados.df_plano, chave=st.session_state.dados.hash_conteudo)
+    materialidade = core.calcular_materialidade(cubo, percentual_global=percentual_global / 100)
+    st.dataframe(
+        materialidade.tabela()
+        .with_columns(pl.col("materialidade").map_elements(core.formatar_moeda, return_dtype=pl.String))
+        .to_pandas(),
+        use_container_width=True,
+        hide_index=True,
+    )
+
+
 # Tabela de Achados
 st.markdown("### 🔍 Detalhamento dos Achados")
 
-if not achados:
+if achados.is_empty():
     st.success("✅ Nenhuma exceção encontrada! Todas as contas estão com saldos coerentes.")
 else:
     # Filtros
-    col1, col2 = st.columns([1, 3])
+    col1, col2, col3 = st.columns([1, 1, 2])
     
     with col1:
         filtro_severidade = st.selectbox(
@@ -343,13 +449,35 @@ else:
             index=0
         )
     
+    with col2:
+        quantidade = st.number_input(
+            "Exibir os mais materiais",
+            min_value=10,
+            max_value=1000,
+            value=50,
+            step=10,
+        )
+    
     # Aplicar filtro
     achados_filtrados = achados
     if filtro_severidade != "Todos":
-        achados_filtrados = [a for a in achados if a["severidade"] == filtro_severidade]
+        achados_filtrados = achados.filter(pl.col("severidade") == filtro_severidade)
+    total_filtrados = achados_filtrados.height
+    
+    # Só os N mais materiais (ordenação parcial), formatados para exibição
+    achados_filtrados = core.renderizar_achados(
+        core.principais_achados(achados_filtrados, materialidade, n=quantidade)
+    )
+    
+    with col3:
+        st.caption(
+            f"Exibindo {achados_filtrados.height} de {total_filtrados} achados, "
+            f"do mais material ao menos material (materialidade global: "
+            f"{core.formatar_moeda(materialidade.geral)})"
+        )
     
     # Exibir como cards
-    for achado in achados_filtrados:
+    for achado in achados_filtrados.iter_rows(named=True):
         severidade = achado["severidade"]
         emoji = achado["emoji"]
         cor = achado["cor"]
@@ -363,10 +491,21 @@ else:
             
             with col2:
                 st.markdown(f"**{achado['achado']}**")
-                st.caption(f"Esperado: {achado['saldo_esperado']} | Encontrado: {achado['saldo_encontrado']}")
+                if achado.get("centro_custo"):
+                    st.caption(f"Centro de custo: {achado['centro_custo']} | Período: {achado['periodo_fim']:%m/%Y}")
+                elif achado.get("valor_referencia") is not None:
+                    st.caption(
+                        f"Período: {achado['periodo_fim']:%m/%Y} | "
+                        f"Referência: {core.formatar_moeda(achado['valor_referencia'])}"
+                    )
+                elif achado.get("saldo_esperado"):
+                    st.caption(f"Esperado: {achado['saldo_esperado']} | Encontrado: {achado['saldo_encontrado']}")
+                elif achado.get("periodo_fim"):
+                    st.caption(f"Período: {achado['periodo_fim']:%m/%Y}")
                 
             with col3:
                 st.markdown(f"### {achado['valor_formatado']}")
+                st.caption(f"{abs(achado['valor'] or 0) / achado['materialidade']:.1f}× a materialidade")
             
             with st.expander("💡 Ver recomendação"):
                 st.info(achado["recomendacao"])
@@ -375,10 +514,11 @@ else:
     
     # Tabela alternativa (dados brutos)
     with st.expander("📋 Ver tabela completa"):
-        df_achados = pl.DataFrame(achados_filtrados).select([
+        df_achados = achados_filtrados.select([
             "cod_conta", "descricao", "natureza", 
             "saldo_esperado", "saldo_encontrado", 
-            "valor_formatado", "severidade", "achado"
+            "valor_formatado", "materialidade", "pontuacao",
+            pl.col("severidade").cast(pl.String), "achado"
         ])
         st.dataframe(
             df_achados.to_pandas(),
@@ -387,6 +527,47 @@ else:
         )
 
 
+# Centros de Custo (fatias lidas do cubo pré-calculado)
+cubo_cc = core.gerar_cubo_centros_custo(dados.df_saldos, dados.df_plano, chave=st.session_state.dados.hash_conteudo)
+centros = [c for c in cubo_cc.centros_custo if c]
+
+if centros:
+    st.divider()
+    st.markdown("### 🏭 Centros de Custo")
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        filtro_natureza = st.selectbox(
+            "Natureza",
+            options=["RESULTADO", "ATIVO", "PASSIVO", "PATRIMÔNIO LÍQUIDO"],
+            index=0,
+        )
+    with col2:
+        periodos_cc = cubo_cc.periodos
+        filtro_periodo = st.selectbox(
+            "Período",
+            options=periodos_cc,
+            index=len(periodos_cc) - 1 if periodos_cc else 0,
+            format_func=lambda p: p.strftime("%m/%Y"),
+        )
+    
+    st.dataframe(
+        cubo_cc.totais(periodo_fim=filtro_periodo, natureza=filtro_natureza)
+        .filter(pl.col("centro_custo") != "")
+        .select(["centro_custo", "contas", "debitos", "creditos", "saldo_final"])
+        .to_pandas(),
+        use_container_width=True,
+        hide_index=True,
+    )
+    
+    with st.expander("📋 Ver matriz conta × centro de custo"):
+        st.dataframe(
+            cubo_cc.matriz(periodo_fim=filtro_periodo, natureza=filtro_natureza).to_pandas(),
+            use_container_width=True,
+            hide_index=True,
+        )
+
+
 # Botão de Export
 st.divider()
 st.markdown("### 📥 Exportar Relatório")
@@ -396,11 +577,12 @@ col1, col2 = st.columns([1, 3])
 with col1:
     if st.button("📊 Gerar Excel Completo", type="primary", use_container_width=True):
         with st.spinner("Gerando relatório..."):
-            excel_buffer = exportar_relatorio_completo(
+            excel_buffer = core.exportar_relatorio_completo(
                 achados=achados,
-                df_saldos=st.session_state.df_saldos,
+                df_saldos=dados.df_saldos,
                 empresa_nome=empresa.nome if empresa else "N/A",
-                periodo=f"{empresa.data_inicio} a {empresa.data_fim}" if empresa else "N/A"
+                periodo=f"{empresa.data_inicio} a {empresa.data_fim}" if empresa else "N/A",
+                materialidade=materialidade,
             )
             
             st.download_button(
@@ -415,7 +597,8 @@ with col2:
     st.caption("""
     O relatório Excel contém:
     - **Resumo:** Dados da empresa e estatísticas
-    - **Achados:** Lista completa de exceções encontradas  
+    - **Materialidade:** Global e por natureza
+    - **Achados:** Lista completa de exceções, das mais materiais às menos materiais  
     - **Balancete:** Todos os saldos processados
     """)
 
@@ -0,0 +1,144 @@
+"""
+Benchmark de Inicialização do App
+Audiper - Sistema de Auditoria Digital
+
+Mede, em interpretadores novos (como em um contêiner recém-criado), o tempo
+até a primeira renderização útil do app.py:
+
+- streamlit: apenas o import do Streamlit (piso do framework);
+- login: primeira execução do script, tela de senha;
+- boas_vindas: usuário autenticado e sem dados (sidebar e página inicial).
+
+Cada cenário roda em um processo novo pelo AppTest do Streamlit. Também são
+listados os módulos pesados já carregados ao fim da renderização; exportador,
+gerador demo e testes devem ficar para o primeiro uso (Polars pode aparecer
+em boas_vindas por causa do pré-aquecimento em segundo plano).
+
+Uso:
+    python benchmarks/tempo_inicializacao.py --repeticoes 5 --alvo-ms 2000
+
+Sai com código 1 se a mediana de login ou boas_vindas passar do alvo.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict, List
+
+
+RAIZ = Path(__file__).resolve().parent.parent
+APP = RAIZ / "app.py"
+
+ALVO_MS = int(os.environ.get("AUDIPER_ALVO_INICIALIZACAO_MS", "2000"))
+
+MODULOS_PESADOS = [
+    "polars",
+    "xlsxwriter",
+    "zstandard",
+    "core.exportador",
+    "core.centros_custo",
+    "core.demonstracoes",
+    "dados_demo.demo_generator",
+]
+
+_SCRIPT_IMPORT = """
+import json, sys, time
+inicio = time.perf_counter()
+import streamlit
+print(json.dumps({"segundos": time.perf_counter() - inicio, "excecoes": [], "modulos": []}))
+"""
+
+_SCRIPT_APP = """
+import json, sys, time
+inicio = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+app = AppTest.from_file(%(app)r, default_timeout=120)
+if %(autenticado)r:
+    app.session_state["autenticado"] = True
+app.run()
+decorrido = time.perf_counter() - inicio
+print(json.dumps({
+    "segundos": decorrido,
+    "excecoes": [str(e.value) for e in app.exception],
+    "modulos": [m for m in %(pesados)r if m in sys.modules],
+}))
+"""
+
+CENARIOS = {
+    "streamlit": _SCRIPT_IMPORT,
+    "login": _SCRIPT_APP % {"app": str(APP), "autenticado": False, "pesados": MODULOS_PESADOS},
+    "boas_vindas": _SCRIPT_APP % {"app": str(APP), "autenticado": True, "pesados": MODULOS_PESADOS},
+}
+
+
+def medir(script: str) -> Dict:
+    """Executa o script em um interpretador novo e devolve a medição (JSON)"""
+
+    ambiente = dict(os.environ)
+    ambiente["PYTHONPATH"] = os.pathsep.join(filter(None, [str(RAIZ), ambiente.get("PYTHONPATH")]))
+
+    resultado = subprocess.run(
+        [sys.executable, "-c", script],
+        cwd=RAIZ,
+        env=ambiente,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(resultado.stdout.strip().splitlines()[-1])
+
+
+def executar(repeticoes: int) -> Dict[str, Dict]:
+    """Mediana, mínimo e máximo (ms) de cada cenário"""
+
+    relatorio = {}
+    for nome, script in CENARIOS.items():
+        medicoes: List[Dict] = [medir(script) for _ in range(repeticoes)]
+        tempos = [m["segundos"] * 1000 for m in medicoes]
+        relatorio[nome] = {
+            "mediana_ms": statistics.median(tempos),
+            "minimo_ms": min(tempos),
+            "maximo_ms": max(tempos),
+            "modulos": medicoes[-1]["modulos"],
+            "excecoes": medicoes[-1]["excecoes"],
+        }
+    return relatorio
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Tempo até a primeira renderização do app.py")
+    parser.add_argument("--repeticoes", type=int, default=5)
+    parser.add_argument("--alvo-ms", type=int, default=ALVO_MS)
+    parser.add_argument("--json", action="store_true", help="Imprime o relatório em JSON")
+    args = parser.parse_args()
+
+    relatorio = executar(args.repeticoes)
+
+    if args.json:
+        print(json.dumps(relatorio, indent=2))
+    else:
+        print(f"{'cenário':<12} {'mediana':>9} {'mínimo':>9} {'máximo':>9}  módulos pesados carregados")
+        for nome, r in relatorio.items():
+            modulos = ", ".join(r["modulos"]) or "-"
+            print(f"{nome:<12} {r['mediana_ms']:>7.0f}ms {r['minimo_ms']:>7.0f}ms {r['maximo_ms']:>7.0f}ms  {modulos}")
+            for excecao in r["excecoes"]:
+                print(f"    exceção: {excecao}")
+
+    acima = [
+        nome for nome in ("login", "boas_vindas")
+        if relatorio[nome]["mediana_ms"] > args.alvo_ms or relatorio[nome]["excecoes"]
+    ]
+    if acima:
+        print(f"❌ Acima do alvo de {args.alvo_ms} ms (ou com exceção): {', '.join(acima)}")
+        return 1
+
+    print(f"✅ Primeira renderização dentro do alvo de {args.alvo_ms} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
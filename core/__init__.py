@@ -1,36 +1,211 @@
 """
 Core - Módulo de Lógica de Negócio
 Audiper - Sistema de Auditoria Digital
+
+Os submódulos são carregados sob demanda: `import core` não importa Polars,
+xlsxwriter nem os demais submódulos; `from core import X` carrega apenas o
+submódulo que define X.
+
+Com orçamento de memória (AUDIPER_MEMORIA_MB), o diretório de descarga do
+engine streaming é criado e exportado em POLARS_TEMP_DIR aqui, antes de
+qualquer submódulo importar o Polars.
 """
 
-from .leitor_sped import (
-    processar_sped_ecd,
-    carregar_arquivo_upload,
-    DadosEmpresa,
-)
-
-from .testes_auditoria import (
-    teste_saldos_invertidos,
-    gerar_resumo_balancete,
-    get_emoji_severidade,
-    get_cor_severidade,
-    formatar_moeda,
-)
-
-from .exportador import (
-    exportar_achados_excel,
-    exportar_relatorio_completo,
-)
-
-__all__ = [
-    "processar_sped_ecd",
-    "carregar_arquivo_upload", 
-    "DadosEmpresa",
-    "teste_saldos_invertidos",
-    "gerar_resumo_balancete",
-    "get_emoji_severidade",
-    "get_cor_severidade",
-    "formatar_moeda",
-    "exportar_achados_excel",
-    "exportar_relatorio_completo",
-]
+import os
+import atexit
+import shutil
+import importlib
+from pathlib import Path
+
+
+# Extensões aceitas no upload (constante leve, usada pela interface antes de
+# qualquer submódulo ser carregado)
+EXTENSOES_ACEITAS = ["txt", "zip", "gz", "zst"]
+
+# Diretório padrão do cache (reexportado por core.cache)
+DIRETORIO_CACHE = os.environ.get("AUDIPER_CACHE", ".audiper_cache")
+
+# Diretório de descarga (spill) do estado intermediário do engine streaming
+DIRETORIO_DESCARGA = os.environ.get("AUDIPER_DESCARGA", "")
+
+
+def diretorio_descarga() -> Path:
+    """Diretório de descarga deste processo (removido ao encerrar)"""
+    base = Path(DIRETORIO_DESCARGA) if DIRETORIO_DESCARGA else Path(DIRETORIO_CACHE) / "descarga"
+    return base / str(os.getpid())
+
+
+def _preparar_descarga() -> None:
+    """
+    Cria o diretório de descarga e o informa ao Polars. Processos filhos
+    herdam POLARS_TEMP_DIR e usam o diretório do processo que os criou.
+    """
+    try:
+        limite = int(os.environ.get("AUDIPER_MEMORIA_MB", "0"))
+    except ValueError:
+        return
+    if limite <= 0 or "POLARS_TEMP_DIR" in os.environ:
+        return
+
+    diretorio = diretorio_descarga()
+    try:
+        diretorio.mkdir(parents=True, exist_ok=True)
+    except OSError:
+        return  # Sem diretório próprio, o Polars usa o temporário do sistema
+    os.environ["POLARS_TEMP_DIR"] = str(diretorio)
+    atexit.register(shutil.rmtree, diretorio, True)
+
+
+_preparar_descarga()
+
+
+# Submódulo -> nomes exportados
+_SUBMODULOS = {
+    "leitor_sped": [
+        "processar_sped_ecd",
+        "processar_sped_ecd_bytes",
+        "processar_sped_ecd_arquivo",
+        "detectar_codificacao",
+        "carregar_arquivo_upload",
+        "DadosEmpresa",
+    ],
+    "testes_auditoria": [
+        "teste_saldos_invertidos",
+        "gerar_resumo_balancete",
+        "formatar_moeda",
+    ],
+    "achados": [
+        "Regra",
+        "Severidade",
+        "registrar_regra",
+        "tabela_regras",
+        "achados_vazios",
+        "combinar_achados",
+        "estatisticas_achados",
+        "renderizar_achados",
+        "get_emoji_severidade",
+        "get_cor_severidade",
+    ],
+    "exportador": [
+        "exportar_achados_excel",
+        "exportar_relatorio_completo",
+        "exportar_amostra_excel",
+        "exportar_portfolio_excel",
+    ],
+    "armazenamento": [
+        "ArmazemAuditoria",
+    ],
+    "entrada": [
+        "abrir_fontes_sped",
+        "processar_arquivos_sped",
+        "ArquivoProcessado",
+    ],
+    "leitor_lazy": [
+        "SpedLazy",
+        "carregar_sped_lazy",
+        "abrir_sped_lazy",
+    ],
+    "indice_sped": [
+        "IndiceSped",
+        "obter_indice",
+        "processar_sped_seletivo",
+        "carregar_plano",
+        "carregar_saldos_periodo",
+    ],
+    "leitor_paralelo": [
+        "processar_sped_ecd_paralelo",
+    ],
+    "materialidade": [
+        "Materialidade",
+        "calcular_materialidade",
+        "pontuar_achados",
+        "principais_achados",
+    ],
+    "cubo_saldos": [
+        "CuboSaldos",
+        "gerar_cubo_saldos",
+        "expandir_ancestrais",
+    ],
+    "classificador": [
+        "ClassificadorRetificadoras",
+        "classificar_plano",
+    ],
+    "cache_compartilhado": [
+        "CacheCompartilhado",
+        "ReferenciaDados",
+        "obter_cache_compartilhado",
+    ],
+    "centros_custo": [
+        "CuboCentrosCusto",
+        "gerar_cubo_centros_custo",
+        "teste_saldos_invertidos_centro_custo",
+        "teste_variacao_centro_custo",
+    ],
+    "anomalias": [
+        "teste_anomalias_mensais",
+    ],
+    "demonstracoes": [
+        "DemonstracoesContabeis",
+        "processar_demonstracoes",
+        "conciliar_demonstracoes",
+        "teste_conciliacao_demonstracoes",
+        "demonstracoes_do_cache",
+    ],
+    "layouts": [
+        "Campo",
+        "LayoutRegistro",
+        "LayoutSped",
+        "LAYOUTS",
+        "compilar_plano",
+        "extrair_registros",
+    ],
+    "amostragem": [
+        "Amostra",
+        "processar_lancamentos",
+        "lancamentos_do_cache",
+        "amostra_mus",
+        "amostra_estratificada",
+        "maiores_por_conta",
+    ],
+    "regras": [
+        "ConjuntoRegras",
+        "compilar_regras",
+        "carregar_regras",
+        "teste_regras",
+    ],
+    "pipeline": [
+        "executar_testes",
+    ],
+    "execucao": [
+        "OrcamentoMemoria",
+        "orcamento_memoria",
+        "coletar",
+    ],
+    "portfolio": [
+        "auditar_portfolio",
+        "ResultadoPortfolio",
+        "EmpresaPortfolio",
+    ],
+    "monitor_pasta": [
+        "MonitorPasta",
+        "EstadoMonitor",
+    ],
+}
+
+_ORIGEM = {nome: submodulo for submodulo, nomes in _SUBMODULOS.items() for nome in nomes}
+
+__all__ = ["EXTENSOES_ACEITAS"] + list(_ORIGEM)
+
+
+def __getattr__(nome: str):
+    submodulo = _ORIGEM.get(nome)
+    if submodulo is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {nome!r}")
+
+    valor = getattr(importlib.import_module(f".{submodulo}", __name__), nome)
+    globals()[nome] = valor
+    return valor
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
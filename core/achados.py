@@ -0,0 +1,205 @@
+"""
+Modelo de Achados
+Audiper - Sistema de Auditoria Digital
+
+Achados são um DataFrame tipado (uma linha por achado) compartilhado pelos
+testes, pelo dashboard e pelo exportador:
+
+- severidade é um pl.Enum (ordenável e compacto);
+- regra_id referencia a tabela de regras, que guarda mensagem e recomendação;
+- emoji, cor, textos e valores formatados são gerados apenas na renderização.
+
+Assim, milhões de achados de testes sobre lançamentos continuam compactos e
+as estatísticas são agregadas uma única vez.
+"""
+
+import polars as pl
+from dataclasses import dataclass
+from enum import Enum
+from typing import Dict, List, Optional
+
+
+class Severidade(Enum):
+    """Níveis de severidade dos achados"""
+    CRITICO = "CRÍTICO"
+    ATENCAO = "ATENÇÃO"
+    INFO = "INFO"
+    OK = "OK"
+
+
+# Ordem do Enum = ordem de gravidade (CRÍTICO < ATENÇÃO < ...)
+TIPO_SEVERIDADE = pl.Enum([s.value for s in Severidade])
+
+TIPO_INDICADOR = pl.Enum(["D", "C"])
+
+CORES_SEVERIDADE = {
+    "CRÍTICO": "#DC2626",   # Vermelho
+    "ATENÇÃO": "#F59E0B",   # Amarelo
+    "INFO": "#3B82F6",      # Azul
+    "OK": "#10B981",        # Verde
+}
+
+EMOJIS_SEVERIDADE = {
+    "CRÍTICO": "🔴",
+    "ATENÇÃO": "🟡",
+    "INFO": "🔵",
+    "OK": "🟢",
+}
+
+# Colunas comuns a todos os testes; testes podem acrescentar colunas próprias
+ESQUEMA_ACHADOS = {
+    "id": pl.UInt32,
+    "regra_id": pl.Categorical,
+    "cod_conta": pl.String,
+    "descricao": pl.String,
+    "natureza": pl.String,
+    "valor": pl.Float64,
+    "severidade": TIPO_SEVERIDADE,
+}
+
+
+def get_cor_severidade(severidade: str) -> str:
+    """Retorna cor para exibição baseado na severidade"""
+    return CORES_SEVERIDADE.get(severidade, "#6B7280")
+
+
+def get_emoji_severidade(severidade: str) -> str:
+    """Retorna emoji para exibição"""
+    return EMOJIS_SEVERIDADE.get(severidade, "⚪")
+
+
+def formatar_moeda(valor: float) -> str:
+    """Formata valor para moeda brasileira"""
+    return f"R$ {valor:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
+
+
+# ============================================
+# TABELA DE REGRAS
+# ============================================
+
+@dataclass(frozen=True)
+class Regra:
+    """Regra de auditoria: textos exibidos para os achados com este regra_id"""
+    regra_id: str
+    teste: str
+    severidade: str
+    achado: str
+    recomendacao: str
+
+
+_REGRAS: Dict[str, Regra] = {}
+_tabela_regras: Optional[pl.DataFrame] = None
+
+
+def registrar_regra(regra: Regra) -> None:
+    """Registra (ou substitui) uma regra na tabela de regras"""
+    global _tabela_regras
+    _REGRAS[regra.regra_id] = regra
+    _tabela_regras = None
+
+
+def obter_regra(regra_id: str) -> Optional[Regra]:
+    return _REGRAS.get(regra_id)
+
+
+def severidade_da_regra(regra_id: pl.Expr) -> pl.Expr:
+    """Expressão com a severidade padrão de cada regra registrada"""
+    return regra_id.replace_strict(
+        {r.regra_id: r.severidade for r in _REGRAS.values()},
+        default=Severidade.INFO.value,
+        return_dtype=TIPO_SEVERIDADE,
+    )
+
+
+def tabela_regras() -> pl.DataFrame:
+    """Tabela (regra_id, teste, achado, recomendacao) para junção na renderização"""
+    global _tabela_regras
+    if _tabela_regras is None:
+        _tabela_regras = pl.DataFrame(
+            [
+                {
+                    "regra_id": r.regra_id,
+                    "teste": r.teste,
+                    "achado": r.achado,
+                    "recomendacao": r.recomendacao,
+                }
+                for r in _REGRAS.values()
+            ],
+            schema={"regra_id": pl.String, "teste": pl.String, "achado": pl.String, "recomendacao": pl.String},
+        )
+    return _tabela_regras
+
+
+# ============================================
+# FRAME DE ACHADOS
+# ============================================
+
+def achados_vazios() -> pl.DataFrame:
+    """Frame de achados sem linhas, com o esquema padrão"""
+    return pl.DataFrame(schema=ESQUEMA_ACHADOS)
+
+
+def frame_achados(df: pl.DataFrame) -> pl.DataFrame:
+    """Converte as colunas comuns para os tipos do modelo de achados"""
+    return df.with_columns(
+        [pl.col(nome).cast(tipo) for nome, tipo in ESQUEMA_ACHADOS.items() if nome in df.columns]
+    )
+
+
+def combinar_achados(frames: List[pl.DataFrame]) -> pl.DataFrame:
+    """Concatena achados de vários testes, renumerando os ids"""
+    frames = [f for f in frames if not f.is_empty()]
+    if not frames:
+        return achados_vazios()
+
+    return frame_achados(
+        pl.concat(frames, how="diagonal_relaxed")
+        .drop("id")
+        .with_row_index("id", offset=1)
+    )
+
+
+def estatisticas_achados(achados: pl.DataFrame) -> Dict[str, int]:
+    """Contagem por severidade em uma única agregação"""
+
+    contagem = dict(
+        achados.group_by("severidade").len().iter_rows()
+    ) if not achados.is_empty() else {}
+
+    return {
+        "total": achados.height,
+        "criticos": contagem.get("CRÍTICO", 0),
+        "atencao": contagem.get("ATENÇÃO", 0),
+        "info": contagem.get("INFO", 0),
+    }
+
+
+def renderizar_achados(achados: pl.DataFrame) -> pl.DataFrame:
+    """
+    Acrescenta os campos de apresentação (textos da regra, emoji, cor, valor
+    formatado, Devedor/Credor). Aplicar apenas às linhas que serão exibidas
+    ou exportadas.
+    """
+
+    if achados.is_empty():
+        return achados
+
+    indicadores = {"D": "Devedor", "C": "Credor"}
+    # Testes sem indicador (ex.: variação) recebem as colunas vazias
+    colunas_indicador = [
+        pl.col(origem).cast(pl.String).replace_strict(indicadores, default=None).alias(destino)
+        if origem in achados.columns else pl.lit(None, dtype=pl.String).alias(destino)
+        for origem, destino in [("ind_esperado", "saldo_esperado"), ("ind_encontrado", "saldo_encontrado")]
+    ]
+
+    return (
+        achados
+        .with_columns(pl.col("regra_id").cast(pl.String))
+        .join(tabela_regras(), on="regra_id", how="left", maintain_order="left")
+        .with_columns(
+            pl.col("severidade").cast(pl.String).replace_strict(EMOJIS_SEVERIDADE, default="⚪").alias("emoji"),
+            pl.col("severidade").cast(pl.String).replace_strict(CORES_SEVERIDADE, default="#6B7280").alias("cor"),
+            pl.col("valor").map_elements(formatar_moeda, return_dtype=pl.String).alias("valor_formatado"),
+            *colunas_indicador,
+        )
+    )
@@ -0,0 +1,400 @@
+"""
+Amostragem Estatística de Lançamentos (I250)
+Audiper - Sistema de Auditoria Digital
+
+Seleção reprodutível de partidas do diário para testes substantivos:
+
+- MUS (amostragem por unidade monetária): seleção sistemática sobre a soma
+  acumulada dos valores absolutos, com início aleatório definido pela
+  semente; os pontos de seleção são localizados na soma acumulada por busca
+  binária (search_sorted), sem laço por partida;
+- estratificada por faixa de valor: estratos por cut() e sorteio dentro de
+  cada estrato sobre uma permutação com semente;
+- maiores valores por conta (top-N).
+
+Cada amostra traz os metadados da seleção (método, semente, estrato,
+intervalo, peso amostral) e um resumo por estrato, exportável pelo
+exportador (exportar_amostra_excel).
+"""
+
+import math
+import mmap
+import random
+import polars as pl
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from .leitor_sped import criar_decodificador, detectar_codificacao_fonte, iterar_linhas
+from .indice_sped import obter_indice, ler_faixas
+from .cache import existe_bruto, abrir_bruto
+from .layouts import compilar_plano
+from .execucao import coletar, tamanho_estimado
+
+
+METODO_MUS = "MUS"
+METODO_ESTRATIFICADA = "ESTRATIFICADA"
+METODO_MAIORES = "MAIORES_POR_CONTA"
+
+# Limites padrão das faixas de valor (R$) da amostra estratificada
+LIMITES_PADRAO = [1_000.0, 10_000.0, 100_000.0, 1_000_000.0]
+
+ESTRATO_ACIMA_INTERVALO = "Acima do intervalo"
+ESTRATO_AMOSTRAL = "Amostral"
+
+
+@dataclass
+class Amostra:
+    """Partidas selecionadas, resumo por estrato e parâmetros da seleção"""
+    metodo: str
+    itens: pl.DataFrame
+    resumo: pl.DataFrame
+    parametros: Dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def tamanho(self) -> int:
+        return self.itens.height
+
+
+# ============================================
+# POPULAÇÃO (I250)
+# ============================================
+
+def coletar_lancamentos(
+    linhas: Iterable[bytes],
+    decodificar: Callable[[bytes], str],
+) -> pl.DataFrame:
+    """Partidas (I250) com número, data e indicador do lançamento (I200)"""
+    return compilar_plano("ECD", ("I250",)).coletar(linhas, decodificar)["I250"]
+
+
+def processar_lancamentos(fonte: Any) -> pl.DataFrame:
+    """
+    Extrai as partidas do diário de um SPED ECD.
+
+    Args:
+        fonte: Caminho do arquivo em texto (lê só as faixas I200/I250 do
+            índice de blocos), bytes ou fluxo binário
+
+    Returns:
+        DataFrame de partidas (leiaute I250 em layouts.py)
+    """
+
+    if isinstance(fonte, str):
+        indice = obter_indice(fonte)
+        with open(fonte, "rb") as arquivo, mmap.mmap(arquivo.fileno(), 0, access=mmap.ACCESS_READ) as mapa:
+            return coletar_lancamentos(ler_faixas(mapa, indice.faixas("I200")), criar_decodificador(indice.codificacao))
+
+    decodificar = criar_decodificador(detectar_codificacao_fonte(fonte))
+    return coletar_lancamentos(iterar_linhas(fonte), decodificar)
+
+
+def lancamentos_do_cache(hash_conteudo: str) -> Optional[pl.DataFrame]:
+    """Partidas a partir do original guardado no cache (None se indisponível)"""
+
+    if not existe_bruto(hash_conteudo):
+        return None
+
+    try:
+        with abrir_bruto(hash_conteudo) as fluxo:
+            return processar_lancamentos(fluxo)
+    except (ImportError, OSError):
+        return None
+
+
+def _populacao(df: pl.DataFrame, coluna_valor: str) -> pl.LazyFrame:
+    """Partidas com identificador estável (posição na população) e valor absoluto"""
+    return (
+        df.lazy()
+        .with_row_index("id_partida")
+        .with_columns(pl.col(coluna_valor).abs().alias("valor_absoluto"))
+        .filter(pl.col("valor_absoluto") > 0)
+    )
+
+
+def _resumo(populacao: pl.LazyFrame, itens: pl.LazyFrame, chave: str) -> pl.DataFrame:
+    """População e amostra por estrato, peso amostral e cobertura do valor"""
+
+    return coletar(
+        populacao.group_by(chave)
+        .agg(
+            pl.len().alias("populacao"),
+            pl.col("valor_absoluto").sum().alias("valor_populacao"),
+        )
+        .join(
+            itens.group_by(chave).agg(
+                pl.len().alias("amostra"),
+                pl.col("valor_absoluto").sum().alias("valor_amostra"),
+            ),
+            on=chave,
+            how="left",
+        )
+        .with_columns(
+            pl.col("amostra").fill_null(0).cast(pl.UInt32),
+            pl.col("valor_amostra").fill_null(0.0),
+        )
+        .with_columns(
+            (pl.col("populacao") / pl.col("amostra")).alias("peso_amostral"),
+            (pl.col("valor_amostra") / pl.col("valor_populacao")).alias("cobertura_valor"),
+        )
+        .sort(chave)
+    )
+
+
+# ============================================
+# MUS - UNIDADE MONETÁRIA
+# ============================================
+
+def fator_confianca(confianca: float) -> float:
+    """Fator de confiabilidade para zero erros esperados (Poisson): -ln(1 - confiança)"""
+    if not 0 < confianca < 1:
+        raise ValueError("A confiança deve estar entre 0 e 1 (ex.: 0.95)")
+    return -math.log(1 - confianca)
+
+
+def amostra_mus(
+    df: pl.DataFrame,
+    tamanho: Optional[int] = None,
+    erro_toleravel: Optional[float] = None,
+    confianca: float = 0.95,
+    semente: int = 0,
+    coluna_valor: str = "valor",
+) -> Amostra:
+    """
+    Amostragem por unidade monetária (seleção sistemática com início aleatório).
+
+    Args:
+        df: Partidas (ex.: processar_lancamentos)
+        tamanho: Quantidade de pontos de seleção (>= 1); se None, calculada
+            por valor total × fator de confiança / erro tolerável
+        erro_toleravel: Erro tolerável (R$, > 0), usado quando tamanho é None
+        confianca: Nível de confiança do cálculo do tamanho (entre 0 e 1)
+        semente: Semente do início aleatório (mesma semente, mesma amostra)
+        coluna_valor: Coluna com o valor da partida
+
+    Returns:
+        Amostra; partidas maiores que o intervalo são sempre selecionadas
+        (estrato "Acima do intervalo") e podem conter vários pontos
+
+    Raises:
+        ValueError: parâmetros inválidos ou população sem partidas com valor
+    """
+
+    fator = fator_confianca(confianca)
+    if tamanho is None:
+        if erro_toleravel is None:
+            raise ValueError("Informe o tamanho da amostra ou o erro tolerável")
+        if not erro_toleravel > 0:
+            raise ValueError("O erro tolerável deve ser maior que zero")
+    elif int(tamanho) < 1:
+        raise ValueError("O tamanho da amostra deve ser de pelo menos 1 ponto de seleção")
+
+    populacao = coletar(
+        _populacao(df, coluna_valor).with_columns(pl.col("valor_absoluto").cum_sum().alias("valor_acumulado")),
+        tamanho_estimado(df),
+    )
+
+    if populacao.is_empty():
+        raise ValueError("População sem partidas com valor")
+
+    total = populacao.get_column("valor_acumulado")[-1]
+    tamanho = int(tamanho) if tamanho is not None else math.ceil(total * fator / erro_toleravel)
+
+    intervalo = total / tamanho
+    inicio = random.Random(semente).uniform(0, intervalo)
+
+    # Ponto k = início + k × intervalo; a partida selecionada é a primeira
+    # cuja soma acumulada alcança o ponto
+    pontos = pl.int_range(0, tamanho, eager=True).cast(pl.Float64) * intervalo + inicio
+    posicoes = (
+        populacao.get_column("valor_acumulado")
+        .search_sorted(pontos, side="left")
+        .clip(upper_bound=populacao.height - 1)
+    )
+
+    selecao = (
+        pl.DataFrame({"posicao": posicoes, "ponto_selecao": pontos})
+        .group_by("posicao")
+        .agg(
+            pl.col("ponto_selecao").min(),
+            pl.len().alias("pontos"),
+        )
+    )
+
+    estrato = (
+        pl.when(pl.col("valor_absoluto") >= intervalo)
+        .then(pl.lit(ESTRATO_ACIMA_INTERVALO))
+        .otherwise(pl.lit(ESTRATO_AMOSTRAL))
+        .alias("estrato")
+    )
+    populacao = populacao.with_row_index("posicao").with_columns(estrato)
+
+    itens = (
+        populacao.join(selecao, on="posicao", how="inner")
+        .sort("posicao")
+        .drop("posicao", "valor_acumulado")
+        .with_columns(
+            pl.lit(METODO_MUS).alias("metodo"),
+            pl.lit(semente, dtype=pl.Int64).alias("semente"),
+            pl.lit(intervalo).alias("intervalo"),
+            (pl.col("valor_absoluto") / intervalo).clip(upper_bound=1.0).alias("probabilidade"),
+        )
+    )
+
+    return Amostra(
+        metodo=METODO_MUS,
+        itens=itens,
+        resumo=_resumo(populacao.lazy(), itens.lazy(), "estrato"),
+        parametros={
+            "metodo": METODO_MUS,
+            "semente": semente,
+            "pontos_selecao": tamanho,
+            "intervalo": intervalo,
+            "inicio": inicio,
+            "erro_toleravel": erro_toleravel,
+            "confianca": confianca,
+            "partidas_populacao": populacao.height,
+            "valor_populacao": total,
+        },
+    )
+
+
+# ============================================
+# ESTRATIFICADA POR FAIXA DE VALOR
+# ============================================
+
+def _formatar_limite(valor: float) -> str:
+    return f"{valor:,.0f}".replace(",", ".")
+
+
+def rotulos_estratos(limites: List[float]) -> List[str]:
+    """Rótulos ordenáveis das faixas: E1 (até 1.000), E2 (1.000 a 10.000)..."""
+    rotulos = [f"E1 (até {_formatar_limite(limites[0])})"]
+    for i, (inferior, superior) in enumerate(zip(limites, limites[1:]), start=2):
+        rotulos.append(f"E{i} ({_formatar_limite(inferior)} a {_formatar_limite(superior)})")
+    rotulos.append(f"E{len(limites) + 1} (acima de {_formatar_limite(limites[-1])})")
+    return rotulos
+
+
+def amostra_estratificada(
+    df: pl.DataFrame,
+    limites: Optional[List[float]] = None,
+    por_estrato: int = 25,
+    fracao: Optional[float] = None,
+    censo_acima: Optional[float] = None,
+    semente: int = 0,
+    coluna_valor: str = "valor",
+) -> Amostra:
+    """
+    Amostra aleatória estratificada por faixa de valor absoluto.
+
+    Args:
+        df: Partidas (ex.: processar_lancamentos)
+        limites: Limites superiores das faixas (padrão: LIMITES_PADRAO)
+        por_estrato: Partidas sorteadas por estrato (alocação fixa)
+        fracao: Se informada, sorteia essa fração de cada estrato
+            (alocação proporcional, ao menos uma partida)
+        censo_acima: Partidas com valor absoluto a partir deste são todas
+            selecionadas, em um estrato próprio
+        semente: Semente do sorteio (mesma semente, mesma amostra)
+        coluna_valor: Coluna com o valor da partida
+
+    Returns:
+        Amostra com estrato e peso amostral (população / amostra do estrato)
+    """
+
+    limites = sorted(limites or LIMITES_PADRAO)
+    rotulos = rotulos_estratos(limites)
+    estrato = pl.col("valor_absoluto").cut(limites, labels=rotulos, left_closed=True).cast(pl.String)
+    if censo_acima is not None:
+        rotulo_censo = f"Censo (a partir de {_formatar_limite(censo_acima)})"
+        estrato = pl.when(pl.col("valor_absoluto") >= censo_acima).then(pl.lit(rotulo_censo)).otherwise(estrato)
+
+    # Permutação com semente: o sorteio do estrato são as primeiras posições
+    populacao = coletar(
+        _populacao(df, coluna_valor).with_columns(
+            estrato.alias("estrato"),
+            pl.int_range(pl.len(), dtype=pl.UInt32).shuffle(seed=semente).alias("_ordem_sorteio"),
+        ),
+        tamanho_estimado(df),
+    )
+
+    if fracao is not None:
+        alvo = (pl.len().over("estrato") * fracao).ceil().clip(lower_bound=1)
+    else:
+        alvo = pl.lit(por_estrato)
+    if censo_acima is not None:
+        alvo = pl.when(pl.col("valor_absoluto") >= censo_acima).then(pl.len().over("estrato")).otherwise(alvo)
+
+    itens = (
+        populacao
+        .filter(pl.col("_ordem_sorteio").rank("ordinal").over("estrato") <= alvo)
+        .sort("id_partida")
+        .drop("_ordem_sorteio")
+    )
+    resumo = _resumo(populacao.lazy(), itens.lazy(), "estrato")
+
+    itens = (
+        itens.join(resumo.select("estrato", "peso_amostral"), on="estrato", how="left", maintain_order="left")
+        .with_columns(
+            pl.lit(METODO_ESTRATIFICADA).alias("metodo"),
+            pl.lit(semente, dtype=pl.Int64).alias("semente"),
+        )
+    )
+
+    return Amostra(
+        metodo=METODO_ESTRATIFICADA,
+        itens=itens,
+        resumo=resumo,
+        parametros={
+            "metodo": METODO_ESTRATIFICADA,
+            "semente": semente,
+            "limites": limites,
+            "por_estrato": None if fracao is not None else por_estrato,
+            "fracao": fracao,
+            "censo_acima": censo_acima,
+            "partidas_populacao": int(resumo.get_column("populacao").sum()),
+            "valor_populacao": resumo.get_column("valor_populacao").sum(),
+        },
+    )
+
+
+# ============================================
+# MAIORES VALORES POR CONTA
+# ============================================
+
+def maiores_por_conta(
+    df: pl.DataFrame,
+    n: int = 5,
+    coluna_valor: str = "valor",
+    coluna_conta: str = "cod_conta",
+) -> Amostra:
+    """
+    As n partidas de maior valor absoluto de cada conta.
+
+    Empates são resolvidos pela ordem no diário (seleção determinística).
+    """
+
+    populacao = _populacao(df, coluna_valor)
+    ordem = pl.col("valor_absoluto").rank("ordinal", descending=True).over(coluna_conta)
+
+    itens = coletar(
+        populacao
+        .with_columns(ordem.alias("ordem_na_conta"))
+        .filter(pl.col("ordem_na_conta") <= n)
+        .sort([coluna_conta, "ordem_na_conta"])
+        .with_columns(pl.lit(METODO_MAIORES).alias("metodo")),
+        tamanho_estimado(df),
+    )
+    resumo = _resumo(populacao, itens.lazy(), coluna_conta)
+
+    return Amostra(
+        metodo=METODO_MAIORES,
+        itens=itens,
+        resumo=resumo,
+        parametros={
+            "metodo": METODO_MAIORES,
+            "n_por_conta": n,
+            "partidas_populacao": int(resumo.get_column("populacao").sum()),
+            "valor_populacao": resumo.get_column("valor_populacao").sum(),
+        },
+    )
@@ -0,0 +1,304 @@
+"""
+Anomalias Mensais
+Audiper - Sistema de Auditoria Digital
+
+Compara cada conta analítica com o próprio histórico mensal (I155, um
+período por mês, um ou mais exercícios) e com as contas do mesmo grupo
+(conta superior no plano de contas):
+
+- movimento (débitos + créditos) fora do padrão da conta, medido pelo
+  escore robusto 0,6745 × (x − mediana) / MAD, menos sensível aos próprios
+  picos do que o escore-z pela média;
+- inversão súbita do sinal do saldo em contas que não alternam de sinal;
+- conta sem movimento por alguns meses que volta a movimentar;
+- desvio em relação ao grupo no mesmo período (a conta varia em relação ao
+  próprio histórico de forma diferente das contas irmãs).
+
+Todo o cálculo é uma única consulta lazy com funções de janela por conta
+(over("cod_conta")) e por grupo e período; os achados seguem o modelo de
+core.achados.
+"""
+
+import polars as pl
+from typing import Dict, Optional, Tuple, Union
+
+from .achados import (
+    Regra,
+    Severidade,
+    registrar_regra,
+    severidade_da_regra,
+    estatisticas_achados,
+    frame_achados,
+    achados_vazios,
+)
+from .cubo_saldos import saldo_com_sinal
+from .execucao import coletar, tamanho_estimado
+
+
+TESTE_ANOMALIAS = "Anomalias Mensais"
+
+for _regra in [
+    Regra(
+        regra_id="AM-01",
+        teste=TESTE_ANOMALIAS,
+        severidade=Severidade.ATENCAO.value,
+        achado="Movimento do mês fora do padrão histórico da conta e do seu grupo",
+        recomendacao="Obter a composição dos lançamentos do mês e a documentação de suporte dos mais relevantes.",
+    ),
+    Regra(
+        regra_id="AM-02",
+        teste=TESTE_ANOMALIAS,
+        severidade=Severidade.ATENCAO.value,
+        achado="Saldo da conta inverteu de sinal em relação ao mês anterior",
+        recomendacao="Verificar baixas em duplicidade, lançamentos na conta errada e a natureza do saldo.",
+    ),
+    Regra(
+        regra_id="AM-03",
+        teste=TESTE_ANOMALIAS,
+        severidade=Severidade.INFO.value,
+        achado="Conta sem movimento nos meses anteriores voltou a movimentar",
+        recomendacao="Confirmar a origem dos lançamentos e se a conta deveria estar inativa.",
+    ),
+    Regra(
+        regra_id="AM-04",
+        teste=TESTE_ANOMALIAS,
+        severidade=Severidade.INFO.value,
+        achado="Variação do movimento destoa das demais contas do mesmo grupo",
+        recomendacao="Comparar com as contas do mesmo grupo e verificar reclassificações entre elas.",
+    ),
+]:
+    registrar_regra(_regra)
+
+
+# Constante do escore robusto (Iglewicz e Hoaglin): 0,6745 × (x − mediana) / MAD
+FATOR_MAD = 0.6745
+
+# Com MAD zero (maioria dos meses iguais), a escala passa a ser o desvio
+# absoluto médio × 1,2533
+FATOR_DESVIO_MEDIO = 1.253314
+
+
+def _escore_robusto(lf: pl.LazyFrame, coluna: str, grupo: Union[str, list], destino: str) -> pl.LazyFrame:
+    """
+    Acrescenta a mediana ({destino}_mediana) e o escore robusto (destino) de
+    uma coluna dentro do grupo. Cada etapa lê a anterior já calculada:
+    janelas aninhadas seriam reavaliadas a cada grupo.
+    """
+
+    valor = pl.col(coluna)
+    mediana = pl.col(f"{destino}_mediana")
+    desvio = pl.col(f"{destino}_desvio")
+    mad = desvio.median().over(grupo)
+    escala = (
+        pl.when(mad > 0)
+        .then(mad / FATOR_MAD)
+        .otherwise(desvio.mean().over(grupo) * FATOR_DESVIO_MEDIO)
+    )
+
+    return (
+        lf
+        .with_columns(valor.median().over(grupo).alias(f"{destino}_mediana"))
+        .with_columns((valor - mediana).abs().alias(f"{destino}_desvio"))
+        .with_columns(escala.alias(f"{destino}_escala"))
+        .with_columns(
+            pl.when(pl.col(f"{destino}_escala") > 0)
+            .then((valor - mediana) / pl.col(f"{destino}_escala"))
+            .otherwise(0.0)
+            .alias(destino)
+        )
+        .drop(f"{destino}_desvio", f"{destino}_escala")
+    )
+
+
+def _historico_mensal(
+    df_saldos: Union[pl.DataFrame, pl.LazyFrame],
+    df_plano: Optional[Union[pl.DataFrame, pl.LazyFrame]],
+    minimo_pares: int,
+    meses_dormencia: int,
+) -> pl.LazyFrame:
+    """Conta × mês com as estatísticas de janela usadas pelas regras"""
+
+    lf = df_saldos.lazy()
+    if "tipo_conta" in lf.collect_schema().names():
+        lf = lf.filter(pl.col("tipo_conta") == "A")
+
+    # Conta × mês (soma dos centros de custo)
+    mensal = (
+        lf
+        .group_by("cod_conta", "periodo_fim")
+        .agg(
+            pl.col("descricao").first(),
+            pl.col("natureza").first(),
+            (pl.col("valor_debito").fill_null(0.0) + pl.col("valor_credito").fill_null(0.0))
+            .sum().round(2).alias("movimento"),
+            saldo_com_sinal("saldo_final", "ind_saldo_fin").sum().round(2).alias("saldo"),
+        )
+    )
+
+    if df_plano is not None:
+        mensal = mensal.join(
+            df_plano.lazy().select("cod_conta", "conta_superior").unique("cod_conta"),
+            on="cod_conta",
+            how="left",
+        )
+    else:
+        mensal = mensal.with_columns(pl.lit(None, dtype=pl.String).alias("conta_superior"))
+
+    # Defasagens pelo calendário, não pelas linhas: um mês sem I155 da conta
+    # é um mês sem saldo e sem movimento. O saldo anterior só vale se a linha
+    # anterior da conta for do período imediatamente anterior da escrituração
+    # (mesmo critério de cubo_saldos.saldo_periodo_anterior, sem o self-join);
+    # a dormência conta os meses com movimento na janela de meses_dormencia
+    # meses antes do período, desde que a escrituração já cubra a janela
+    conta = "cod_conta"
+    ordem = {"order_by": "periodo_fim"}
+    mensal = mensal.with_columns(pl.col("periodo_fim").rank("dense").alias("_ordem_periodo"))
+    ordem_periodo = pl.col("_ordem_periodo")
+    anterior = (
+        pl.when(ordem_periodo.shift(1).over(conta, **ordem) == ordem_periodo - 1)
+        .then(pl.col("saldo").shift(1).over(conta, **ordem))
+    )
+    inverteu = (pl.col("saldo").sign() * anterior.sign()) < 0
+    meses_ativos = (
+        pl.when(ordem_periodo > meses_dormencia)
+        .then(
+            (pl.col("movimento") > 0).cast(pl.UInt32)
+            .rolling_sum_by("periodo_fim", window_size=f"{meses_dormencia}mo", closed="left")
+            .over(conta)
+            .fill_null(0)
+        )
+    )
+
+    historico = _escore_robusto(mensal, "movimento", conta, "escore").with_columns(
+        pl.col("escore_mediana").alias("valor_referencia"),
+        pl.len().over(conta).alias("periodos"),
+        anterior.alias("saldo_anterior"),
+        inverteu.fill_null(False).alias("inverteu"),
+        meses_ativos.alias("meses_ativos"),
+    ).with_columns(
+        pl.col("inverteu").sum().over(conta).alias("inversoes"),
+        # Movimento em relação ao padrão da própria conta, comparado entre
+        # as contas do mesmo grupo no mesmo mês
+        pl.when(pl.col("valor_referencia") > 0)
+        .then(pl.col("movimento") / pl.col("valor_referencia"))
+        .alias("indice"),
+    )
+
+    grupo = ["conta_superior", "periodo_fim"]
+    return (
+        _escore_robusto(historico, "indice", grupo, "escore_grupo")
+        .with_columns(
+            pl.when(
+                pl.col("conta_superior").is_not_null()
+                & (pl.col("indice").count().over(grupo) >= minimo_pares)
+            )
+            .then(pl.col("escore_grupo"))
+            .alias("escore_grupo"),
+        )
+        .rename({"escore_grupo_mediana": "indice_grupo"})
+        .drop("escore_mediana", "_ordem_periodo")
+    )
+
+
+def teste_anomalias_mensais(
+    df_saldos: Union[pl.DataFrame, pl.LazyFrame],
+    df_plano: Optional[Union[pl.DataFrame, pl.LazyFrame]] = None,
+    limite_escore: float = 3.5,
+    valor_minimo: float = 10_000.0,
+    minimo_periodos: int = 6,
+    meses_dormencia: int = 3,
+    maximo_inversoes: int = 2,
+    minimo_pares: int = 5,
+    variacao_minima: float = 0.5,
+) -> Tuple[pl.DataFrame, Dict[str, int]]:
+    """
+    TESTE: Anomalias mês a mês
+
+    Regras:
+    - AM-01: |escore robusto do movimento| >= limite_escore na conta (com
+      pelo menos minimo_periodos meses de histórico) e também no grupo,
+      quando o grupo tem minimo_pares contas
+    - AM-02: saldo com sinal oposto ao do mês anterior, |saldo| >=
+      valor_minimo, em conta com no máximo maximo_inversoes inversões no
+      histórico
+    - AM-03: movimento >= valor_minimo após meses_dormencia meses sem movimento
+    - AM-04: |escore robusto no grupo| >= limite_escore sem desvio no
+      histórico da própria conta
+
+    AM-01 e AM-04 consideram apenas movimentos >= valor_minimo que se
+    afastam pelo menos variacao_minima (50%) da mediana da conta e do grupo:
+    com poucos meses ou poucas contas irmãs, o MAD é pequeno e o escore
+    sozinho marcaria oscilações comuns.
+
+    Args:
+        df_saldos: Saldos enriquecidos (DataFrame ou LazyFrame), um ou mais
+            exercícios
+        df_plano: Plano de contas (I050) com conta_superior; sem ele, não há
+            comparação com o grupo
+
+    Returns:
+        Tupla com (DataFrame de achados, estatísticas)
+    """
+
+    if isinstance(df_saldos, pl.DataFrame) and df_saldos.is_empty():
+        return achados_vazios(), estatisticas_achados(achados_vazios())
+
+    historico = _historico_mensal(df_saldos, df_plano, minimo_pares, meses_dormencia)
+
+    relevante = pl.col("movimento") >= valor_minimo
+    desvio_conta = (
+        (pl.col("periodos") >= minimo_periodos)
+        & (pl.col("escore").abs() >= limite_escore)
+        & ((pl.col("indice") - 1).abs() >= variacao_minima)
+    ).fill_null(False)
+    desvio_grupo = (
+        (pl.col("escore_grupo").abs() >= limite_escore)
+        & ((pl.col("indice") - pl.col("indice_grupo")).abs() >= variacao_minima)
+    )
+    sem_grupo = pl.col("escore_grupo").is_null()
+
+    condicoes = {
+        "AM-01": relevante & desvio_conta & (sem_grupo | desvio_grupo),
+        "AM-02": pl.col("inverteu")
+        & (pl.col("saldo").abs() >= valor_minimo)
+        & (pl.col("inversoes") <= maximo_inversoes),
+        "AM-03": relevante & (pl.col("meses_ativos") == 0),
+        "AM-04": relevante & desvio_grupo & ~desvio_conta,
+    }
+    valores = {
+        "AM-01": ("movimento", "valor_referencia", "escore"),
+        "AM-02": ("saldo", "saldo_anterior", None),
+        "AM-03": ("movimento", None, None),
+        "AM-04": ("movimento", "valor_referencia", "escore_grupo"),
+    }
+
+    # Uma ramificação por regra sobre o mesmo histórico (calculado uma vez)
+    historico = historico.cache()
+    consulta = pl.concat([
+        historico
+        .filter(condicao)
+        .select(
+            pl.lit(regra_id).alias("regra_id"),
+            "cod_conta",
+            "descricao",
+            "natureza",
+            "periodo_fim",
+            pl.col(valores[regra_id][0]).alias("valor"),
+            (pl.col(valores[regra_id][1]) if valores[regra_id][1] else pl.lit(None, dtype=pl.Float64))
+            .cast(pl.Float64).alias("valor_referencia"),
+            (pl.col(valores[regra_id][2]) if valores[regra_id][2] else pl.lit(None, dtype=pl.Float64))
+            .cast(pl.Float64).round(2).alias("escore"),
+        )
+        for regra_id, condicao in condicoes.items()
+    ])
+
+    achados = coletar(
+        consulta
+        .sort("periodo_fim", "cod_conta", "regra_id")
+        .with_columns(severidade_da_regra(pl.col("regra_id")).alias("severidade"))
+        .with_row_index("id", offset=1),
+        tamanho_estimado(df_saldos, df_plano),
+    )
+
+    achados = frame_achados(achados)
+    return achados, estatisticas_achados(achados)
@@ -0,0 +1,265 @@
+"""
+Armazém Local de Auditoria
+Audiper - Sistema de Auditoria Digital
+
+Persiste os resultados de processar_sped_ecd e os achados dos testes em um
+dataset Parquet local, particionado por CNPJ e ano (layout hive):
+
+    <raiz>/saldos/cnpj=12345678000190/ano=2024/dados.parquet
+    <raiz>/planos/cnpj=12345678000190/ano=2024/dados.parquet
+    <raiz>/achados/cnpj=12345678000190/ano=2024/dados.parquet
+    <raiz>/catalogo.parquet
+
+Filtros por CNPJ/ano são resolvidos pelo caminho (poda de partições) e os
+arquivos são gravados ordenados por período e cod_conta, com estatísticas
+min/max por row group, para que consultas de portfólio leiam só o necessário.
+"""
+
+import os
+import re
+import tempfile
+import threading
+import polars as pl
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Any, Optional, Union
+
+from .leitor_sped import DadosEmpresa
+from .execucao import coletar, tamanho_parquet
+
+
+# Diretório padrão do armazém (pode ser alterado por variável de ambiente)
+DIRETORIO_ARMAZEM = os.environ.get("AUDIPER_ARMAZEM", ".audiper_armazem")
+
+# Linhas por row group: granularidade das estatísticas usadas na poda
+TAMANHO_ROW_GROUP = 64_000
+
+ESQUEMA_PARTICAO = {"cnpj": pl.String, "ano": pl.Int32}
+
+# Serializa atualizações do catálogo entre threads do mesmo processo
+_trava_catalogo = threading.Lock()
+
+
+def somente_digitos(cnpj: str) -> str:
+    """Remove a formatação do CNPJ: 12.345.678/0001-90 -> 12345678000190"""
+    return re.sub(r"\D", "", cnpj or "")
+
+
+def ano_referencia(empresa: DadosEmpresa) -> int:
+    """
+    Ano de referência da escrituração a partir da data final (dd/mm/aaaa).
+
+    Raises:
+        ValueError: DT_FIN do registro 0000 vazia ou inválida
+    """
+    try:
+        return datetime.strptime(empresa.data_fim or "", "%d/%m/%Y").year
+    except ValueError:
+        raise ValueError(
+            f"Data final da escrituração inválida no registro 0000 (DT_FIN={empresa.data_fim!r}); "
+            "esperado ddmmaaaa"
+        ) from None
+
+
+class ArmazemAuditoria:
+    """
+    Armazém embutido (Parquet) com todas as empresas já processadas.
+
+    Exemplo:
+        armazem = ArmazemAuditoria()
+        armazem.gravar(empresa, df_plano, df_saldos, achados)
+        armazem.consultar_saldos(natureza="PASSIVO", ind_saldo_fin="D",
+                                 valor_minimo=100_000, ano=2024)
+    """
+
+    def __init__(self, raiz: Optional[Union[str, Path]] = None):
+        self.raiz = Path(raiz or DIRETORIO_ARMAZEM)
+
+    # ------------------------------------------
+    # Gravação
+    # ------------------------------------------
+    def _arquivo_particao(self, tabela: str, cnpj: str, ano: int) -> Path:
+        return self.raiz / tabela / f"cnpj={cnpj}" / f"ano={ano}" / "dados.parquet"
+
+    def _gravar_particao(self, df: pl.DataFrame, tabela: str, cnpj: str, ano: int) -> None:
+        """Substitui a partição de forma atômica (reprocessar não duplica dados)"""
+        destino = self._arquivo_particao(tabela, cnpj, ano)
+
+        if df.is_empty():
+            destino.unlink(missing_ok=True)
+            return
+
+        destino.parent.mkdir(parents=True, exist_ok=True)
+        # Temporário exclusivo: gravações simultâneas da mesma partição
+        # (ex.: trabalhadores do monitor de pastas) não colidem
+        descritor, temporario = tempfile.mkstemp(dir=destino.parent, suffix=".parquet.tmp")
+        os.close(descritor)
+        try:
+            df.write_parquet(
+                temporario,
+                statistics=True,
+                row_group_size=TAMANHO_ROW_GROUP,
+            )
+            os.replace(temporario, destino)
+        except BaseException:
+            Path(temporario).unlink(missing_ok=True)
+            raise
+
+    def gravar(
+        self,
+        empresa: DadosEmpresa,
+        df_plano: pl.DataFrame,
+        df_saldos: pl.DataFrame,
+        achados: Optional[pl.DataFrame] = None,
+    ) -> Dict[str, Any]:
+        """
+        Persiste plano, saldos e achados de uma escrituração.
+
+        Args:
+            empresa: Dados do registro 0000
+            df_plano: DataFrame do plano de contas (I050)
+            df_saldos: DataFrame de saldos enriquecido (I155)
+            achados: DataFrame de achados (modelo de core.achados)
+
+        Returns:
+            Linha do catálogo referente à escrituração gravada
+
+        Raises:
+            ValueError: Data final (DT_FIN) inválida, sem ano para a partição
+        """
+
+        cnpj = somente_digitos(empresa.cnpj)
+        ano = ano_referencia(empresa)
+
+        ordem = [c for c in ["periodo_fim", "cod_conta"] if c in df_saldos.columns]
+        df_saldos_ordenado = df_saldos.sort(ordem) if ordem else df_saldos
+
+        df_achados = achados.sort("cod_conta") if achados is not None else pl.DataFrame()
+
+        self._gravar_particao(df_plano, "planos", cnpj, ano)
+        self._gravar_particao(df_saldos_ordenado, "saldos", cnpj, ano)
+        self._gravar_particao(df_achados, "achados", cnpj, ano)
+
+        registro = {
+            "cnpj": cnpj,
+            "ano": ano,
+            "nome": empresa.nome,
+            "uf": empresa.uf,
+            "data_inicio": empresa.data_inicio,
+            "data_fim": empresa.data_fim,
+            "qtd_contas": df_plano.height,
+            "qtd_saldos": df_saldos.height,
+            "qtd_achados": df_achados.height,
+            "atualizado_em": datetime.now(),
+        }
+        self._atualizar_catalogo(registro)
+
+        return registro
+
+    def _atualizar_catalogo(self, registro: Dict[str, Any]) -> None:
+        caminho = self.raiz / "catalogo.parquet"
+        novo = pl.DataFrame([registro]).with_columns(pl.col("ano").cast(pl.Int32))
+
+        with _trava_catalogo:
+            catalogo = self.catalogo()
+            if not catalogo.is_empty():
+                catalogo = catalogo.filter(
+                    ~((pl.col("cnpj") == registro["cnpj"]) & (pl.col("ano") == registro["ano"]))
+                )
+                novo = pl.concat([catalogo, novo], how="diagonal_relaxed")
+
+            self.raiz.mkdir(parents=True, exist_ok=True)
+            temporario = caminho.with_suffix(".parquet.tmp")
+            novo.sort(["cnpj", "ano"]).write_parquet(temporario)
+            os.replace(temporario, caminho)
+
+    # ------------------------------------------
+    # Leitura
+    # ------------------------------------------
+    def catalogo(self) -> pl.DataFrame:
+        """Uma linha por escrituração (CNPJ + ano) armazenada"""
+        caminho = self.raiz / "catalogo.parquet"
+        if not caminho.exists():
+            return pl.DataFrame()
+        return pl.read_parquet(caminho)
+
+    def _varrer(self, tabela: str, cnpj: Optional[str], ano: Optional[int]) -> pl.LazyFrame:
+        base = self.raiz / tabela
+        if not any(base.glob("cnpj=*/ano=*/dados.parquet")):
+            return pl.LazyFrame()
+
+        lf = pl.scan_parquet(
+            base / "**" / "*.parquet",
+            hive_partitioning=True,
+            hive_schema=ESQUEMA_PARTICAO,
+        )
+
+        # Filtros nas colunas de partição são resolvidos pelo caminho
+        if cnpj:
+            lf = lf.filter(pl.col("cnpj") == somente_digitos(cnpj))
+        if ano:
+            lf = lf.filter(pl.col("ano") == ano)
+
+        return lf
+
+    def saldos(self, cnpj: Optional[str] = None, ano: Optional[int] = None) -> pl.LazyFrame:
+        """Varredura lazy dos saldos do portfólio"""
+        return self._varrer("saldos", cnpj, ano)
+
+    def planos(self, cnpj: Optional[str] = None, ano: Optional[int] = None) -> pl.LazyFrame:
+        """Varredura lazy dos planos de contas do portfólio"""
+        return self._varrer("planos", cnpj, ano)
+
+    def achados(self, cnpj: Optional[str] = None, ano: Optional[int] = None) -> pl.LazyFrame:
+        """Varredura lazy dos achados do portfólio"""
+        return self._varrer("achados", cnpj, ano)
+
+    def consultar_saldos(
+        self,
+        natureza: Optional[str] = None,
+        ind_saldo_fin: Optional[str] = None,
+        valor_minimo: Optional[float] = None,
+        ano: Optional[int] = None,
+        cnpj: Optional[str] = None,
+        cod_conta: Optional[str] = None,
+        apenas_analiticas: bool = True,
+    ) -> pl.DataFrame:
+        """
+        Consulta de portfólio sobre todos os saldos armazenados.
+
+        Ex.: clientes com contas do PASSIVO devedoras acima de R$ 100 mil em 2024:
+            consultar_saldos(natureza="PASSIVO", ind_saldo_fin="D",
+                             valor_minimo=100_000, ano=2024)
+
+        Returns:
+            DataFrame com os saldos encontrados e o nome de cada empresa
+        """
+
+        lf = self.saldos(cnpj=cnpj, ano=ano)
+        if not lf.collect_schema().names():
+            return pl.DataFrame()
+
+        filtros = []
+        if apenas_analiticas:
+            filtros.append(pl.col("tipo_conta") == "A")
+        if natureza:
+            filtros.append(pl.col("natureza") == natureza)
+        if ind_saldo_fin:
+            filtros.append(pl.col("ind_saldo_fin") == ind_saldo_fin)
+        if valor_minimo is not None:
+            filtros.append(pl.col("saldo_final") >= valor_minimo)
+        if cod_conta:
+            filtros.append(pl.col("cod_conta") == cod_conta)
+
+        if filtros:
+            lf = lf.filter(pl.all_horizontal(filtros))
+
+        catalogo = self.catalogo()
+        if not catalogo.is_empty():
+            lf = lf.join(
+                catalogo.lazy().select(["cnpj", "ano", "nome"]),
+                on=["cnpj", "ano"],
+                how="left",
+            )
+
+        return coletar(lf, tamanho_parquet(self.raiz / "saldos"))
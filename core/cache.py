@@ -0,0 +1,295 @@
+"""
+Cache de Arquivos SPED
+Audiper - Sistema de Auditoria Digital
+
+Cache em disco endereçado pelo hash do conteúdo do SPED (já descompactado):
+
+    <cache>/brutos/<hash>.txt.zst    Arquivo original, compactado com zstd
+    <cache>/parquet/<hash>/          Resultado do parse em Parquet
+        empresa.json                 Registro 0000
+        plano.parquet                I050
+        saldos.parquet               I155 (sem o enriquecimento com o plano)
+        achados.parquet              Achados dos testes (core.cache_compartilhado)
+    <cache>/demonstracoes/<hash>/    J100, J150, I052 e I355 (core.demonstracoes)
+
+O original é gravado em streaming enquanto o arquivo é lido pelo parser,
+sem cópia integral em memória ou arquivo temporário descompactado. Os
+originais ocupam no máximo AUDIPER_CACHE_BRUTOS_MB: ao gravar um novo, os
+menos usados recentemente são removidos (o resultado em Parquet continua
+servindo os testes; só a releitura do original deixa de ser possível).
+"""
+
+import io
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+import polars as pl
+from pathlib import Path
+from typing import BinaryIO, Optional, Any, Dict
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - dependência listada em requirements.txt
+    zstandard = None
+
+from . import DIRETORIO_CACHE  # AUDIPER_CACHE, lido no pacote (leve) e reexportado aqui
+
+
+# Espaço máximo dos originais compactados (0 = sem limite)
+LIMITE_BRUTOS_MB = int(os.environ.get("AUDIPER_CACHE_BRUTOS_MB", "4096"))
+
+NIVEL_ZSTD = 3
+TAMANHO_BUFFER = 1024 * 1024
+
+# Linhas por row group: granularidade das estatísticas usadas na poda
+TAMANHO_ROW_GROUP = 64_000
+
+# Colunas que vêm do plano de contas (adicionadas no enriquecimento)
+COLUNAS_ENRIQUECIMENTO = ["descricao", "natureza", "tipo_conta", "eh_retificadora"]
+
+
+def diretorio_cache() -> Path:
+    """Diretório raiz do cache"""
+    return Path(DIRETORIO_CACHE)
+
+
+def novo_hash():
+    """Hasher usado para identificar o conteúdo de um SPED"""
+    return hashlib.blake2b(digest_size=20)
+
+
+def hash_arquivo(caminho: str) -> str:
+    """Calcula o hash do conteúdo de um arquivo em blocos"""
+    hasher = novo_hash()
+    with open(caminho, "rb") as arquivo:
+        for bloco in iter(lambda: arquivo.read(TAMANHO_BUFFER), b""):
+            hasher.update(bloco)
+    return hasher.hexdigest()
+
+
+def hash_buffer(dados: Any) -> str:
+    """Calcula o hash de bytes, mmap ou memoryview (sem cópia)"""
+    hasher = novo_hash()
+    hasher.update(dados)
+    return hasher.hexdigest()
+
+
+def caminho_bruto(hash_conteudo: str) -> Path:
+    """Caminho do arquivo original compactado no cache"""
+    return diretorio_cache() / "brutos" / f"{hash_conteudo}.txt.zst"
+
+
+def existe_bruto(hash_conteudo: str) -> bool:
+    return caminho_bruto(hash_conteudo).exists()
+
+
+def _marcar_uso(caminho: Path) -> None:
+    """Atualiza o mtime, usado como ordem de uso na poda (atime é pouco confiável)"""
+    try:
+        os.utime(caminho)
+    except OSError:
+        pass
+
+
+def podar_brutos(limite_bytes: Optional[int] = None, preservar: str = "") -> int:
+    """
+    Remove os originais menos usados recentemente até o total caber no
+    limite (padrão: LIMITE_BRUTOS_MB). Temporários em gravação e o original
+    preservado não são removidos.
+
+    Returns:
+        Quantidade de originais removidos
+    """
+
+    limite = LIMITE_BRUTOS_MB * 1024 * 1024 if limite_bytes is None else limite_bytes
+    if limite <= 0:
+        return 0
+
+    arquivos = []
+    for caminho in (diretorio_cache() / "brutos").glob("*.txt.zst"):
+        try:
+            estado = caminho.stat()
+        except OSError:
+            continue  # removido por outro processo
+        arquivos.append((estado.st_mtime_ns, estado.st_size, caminho))
+
+    total = sum(tamanho for _, tamanho, _ in arquivos)
+    removidos = 0
+    for _, tamanho, caminho in sorted(arquivos, key=lambda item: item[0]):
+        if total <= limite:
+            break
+        if caminho.name == f"{preservar}.txt.zst":
+            continue
+        try:
+            caminho.unlink()
+        except FileNotFoundError:
+            pass
+        except OSError:
+            continue  # em uso (Windows): fica para a próxima poda
+        total -= tamanho
+        removidos += 1
+
+    return removidos
+
+
+def abrir_bruto(hash_conteudo: str) -> BinaryIO:
+    """Abre o original do cache como fluxo descompactado (com readline)"""
+    if zstandard is None:
+        raise ImportError("O cache de arquivos requer o pacote 'zstandard' (pip install zstandard)")
+
+    caminho = caminho_bruto(hash_conteudo)
+    arquivo = open(caminho, "rb")
+    _marcar_uso(caminho)
+    leitor = zstandard.ZstdDecompressor().stream_reader(arquivo, closefd=True)
+    return io.BufferedReader(leitor, buffer_size=TAMANHO_BUFFER)
+
+
+class LeitorComCache:
+    """
+    Envolve um fluxo binário e, a cada readline(), atualiza o hash do conteúdo
+    e grava a linha compactada (zstd) em um arquivo temporário do cache.
+
+    Ao final da leitura, concluir() move o temporário para o cache com o nome
+    do hash (ou descarta, se o conteúdo já estava em cache) e poda os
+    originais que passaram do limite.
+    """
+
+    def __init__(self, fluxo: Any, guardar: bool = True):
+        self.fluxo = fluxo
+        self.hasher = novo_hash()
+        self._temporario: Optional[str] = None
+        self._arquivo = None
+        self._escritor = None
+
+        if guardar and zstandard is not None:
+            destino = diretorio_cache() / "brutos"
+            destino.mkdir(parents=True, exist_ok=True)
+            descritor, self._temporario = tempfile.mkstemp(dir=destino, suffix=".tmp")
+            self._arquivo = os.fdopen(descritor, "wb")
+            self._escritor = zstandard.ZstdCompressor(level=NIVEL_ZSTD).stream_writer(
+                self._arquivo, closefd=False
+            )
+
+    def readline(self, *args) -> bytes:
+        linha = self.fluxo.readline(*args)
+        if linha:
+            self.hasher.update(linha)
+            if self._escritor is not None:
+                self._escritor.write(linha)
+        return linha
+
+    def concluir(self) -> str:
+        """Consome o restante do fluxo, fecha o cache e retorna o hash"""
+        for _ in iter(self.readline, b""):
+            pass
+
+        hash_conteudo = self.hasher.hexdigest()
+
+        if self._escritor is not None:
+            self._escritor.close()
+            self._arquivo.close()
+            destino = caminho_bruto(hash_conteudo)
+            if destino.exists():
+                os.remove(self._temporario)
+                _marcar_uso(destino)
+            else:
+                os.replace(self._temporario, destino)
+            self._escritor = None
+            podar_brutos(preservar=hash_conteudo)
+
+        return hash_conteudo
+
+    def descartar(self) -> None:
+        """Interrompe a gravação e remove o temporário"""
+        if self._escritor is not None:
+            self._escritor.close()
+            self._arquivo.close()
+            os.remove(self._temporario)
+            self._escritor = None
+
+
+# ============================================
+# RESULTADO DO PARSE EM PARQUET
+# ============================================
+
+def diretorio_parquet(hash_conteudo: str) -> Path:
+    """Diretório com o resultado do parse de um conteúdo"""
+    return diretorio_cache() / "parquet" / hash_conteudo
+
+
+def existe_parquet(hash_conteudo: str) -> bool:
+    return (diretorio_parquet(hash_conteudo) / "saldos.parquet").exists()
+
+
+def gravar_parquet(
+    hash_conteudo: str,
+    empresa: Optional[Dict[str, str]],
+    df_plano: pl.DataFrame,
+    df_saldos: pl.DataFrame,
+) -> Path:
+    """
+    Grava o resultado do parse no cache.
+
+    Os saldos são gravados sem as colunas de enriquecimento (que vêm do plano),
+    ordenados por período e conta, com estatísticas por row group.
+    """
+
+    destino = diretorio_parquet(hash_conteudo)
+    if existe_parquet(hash_conteudo):
+        return destino
+
+    destino.parent.mkdir(parents=True, exist_ok=True)
+    temporario = Path(tempfile.mkdtemp(dir=destino.parent))
+    try:
+        with open(temporario / "empresa.json", "w", encoding="utf-8") as arquivo:
+            json.dump(empresa, arquivo, ensure_ascii=False)
+
+        df_plano.write_parquet(temporario / "plano.parquet", statistics=True)
+
+        df_saldos = df_saldos.drop(COLUNAS_ENRIQUECIMENTO, strict=False)
+        ordem = [c for c in ["periodo_fim", "cod_conta"] if c in df_saldos.columns]
+        if ordem:
+            df_saldos = df_saldos.sort(ordem)
+        df_saldos.write_parquet(
+            temporario / "saldos.parquet",
+            statistics=True,
+            row_group_size=TAMANHO_ROW_GROUP,
+        )
+
+        os.replace(temporario, destino)
+    except OSError:
+        shutil.rmtree(temporario, ignore_errors=True)
+        if not existe_parquet(hash_conteudo):
+            raise
+
+    return destino
+
+
+def gravar_achados_parquet(hash_conteudo: str, achados: pl.DataFrame) -> None:
+    """Grava (ou substitui) os achados junto ao resultado do parse"""
+
+    destino = diretorio_parquet(hash_conteudo) / "achados.parquet"
+    descritor, temporario = tempfile.mkstemp(dir=destino.parent, suffix=".parquet.tmp")
+    os.close(descritor)
+    try:
+        achados.write_parquet(temporario)
+        os.replace(temporario, destino)
+    except BaseException:
+        Path(temporario).unlink(missing_ok=True)
+        raise
+
+
+def ler_achados_parquet(hash_conteudo: str) -> Optional[pl.DataFrame]:
+    """Achados gravados junto ao parse (None se não gravados)"""
+    caminho = diretorio_parquet(hash_conteudo) / "achados.parquet"
+    if not caminho.exists():
+        return None
+    return pl.read_parquet(caminho)
+
+
+def ler_empresa_parquet(hash_conteudo: str) -> Optional[Dict[str, str]]:
+    """Dados do registro 0000 gravados junto ao parse"""
+    with open(diretorio_parquet(hash_conteudo) / "empresa.json", encoding="utf-8") as arquivo:
+        return json.load(arquivo)
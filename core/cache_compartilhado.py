@@ -0,0 +1,295 @@
+"""
+Cache Compartilhado de Escriturações
+Audiper - Sistema de Auditoria Digital
+
+Em um servidor Streamlit com vários auditores, cada sessão guardava sua
+própria cópia de plano, saldos e achados. Este cache, único por processo,
+guarda cada escrituração uma vez (chave: hash do conteúdo) e entrega às
+sessões referências somente leitura:
+
+- contagem de referências: cada sessão segura um ReferenciaDados; quando ele
+  é descartado (nova carga, fim da sessão), a referência é liberada
+  automaticamente (weakref.finalize);
+- orçamento global de memória (AUDIPER_CACHE_MEMORIA_MB): ao ultrapassá-lo,
+  escriturações sem referências são despejadas em ordem LRU, após garantir
+  que o resultado do parse e os achados estão no cache Parquet em disco. As
+  vítimas são escolhidas com a trava, mas gravadas fora dela: uma gravação
+  não bloqueia as consultas das outras sessões;
+- escriturações despejadas voltam do Parquet (com os achados) na próxima
+  consulta; as publicadas como não persistentes (dados de demonstração)
+  nunca vão para o disco e são simplesmente descartadas;
+- métricas de taxa de acerto e bytes residentes.
+"""
+
+import os
+import threading
+import weakref
+import polars as pl
+from collections import OrderedDict
+from dataclasses import dataclass, replace
+from typing import Dict, Any, Optional
+
+from .leitor_sped import DadosEmpresa
+from .achados import frame_achados
+from .cache import existe_parquet, gravar_parquet, gravar_achados_parquet, ler_achados_parquet
+from .leitor_lazy import abrir_sped_lazy
+
+
+# Orçamento global de memória do cache (MB)
+LIMITE_MEMORIA_MB = int(os.environ.get("AUDIPER_CACHE_MEMORIA_MB", "2048"))
+
+
+@dataclass(frozen=True)
+class ConjuntoDados:
+    """Escrituração compartilhada entre sessões (não modificar os DataFrames)"""
+    hash_conteudo: str
+    empresa: Optional[DadosEmpresa]
+    df_plano: pl.DataFrame
+    df_saldos: pl.DataFrame
+    achados: Optional[pl.DataFrame] = None
+
+    @property
+    def tamanho_bytes(self) -> int:
+        frames = [self.df_plano, self.df_saldos, self.achados]
+        return sum(df.estimated_size() for df in frames if df is not None)
+
+
+class ReferenciaDados:
+    """
+    Referência de uma sessão a uma escrituração do cache.
+
+    Enquanto existir, a escrituração não é despejada. A liberação acontece
+    ao chamar liberar() ou quando o objeto é coletado.
+    """
+
+    def __init__(self, cache: "CacheCompartilhado", dados: ConjuntoDados):
+        self._cache = cache
+        self._hash = dados.hash_conteudo
+        self._finalizador = weakref.finalize(self, cache._liberar, dados.hash_conteudo)
+
+    @property
+    def hash_conteudo(self) -> str:
+        return self._hash
+
+    @property
+    def dados(self) -> ConjuntoDados:
+        """Versão atual da escrituração (inclui achados anexados depois)"""
+        return self._cache._entrada_referenciada(self._hash)
+
+    def liberar(self) -> None:
+        self._finalizador()
+
+
+@dataclass
+class _Entrada:
+    dados: ConjuntoDados
+    tamanho: int
+    referencias: int = 0
+    # Sem cópia em disco: despejada, é descartada
+    persistente: bool = True
+    # Escolhida por um despejo em andamento (gravação fora da trava)
+    despejando: bool = False
+
+
+class CacheCompartilhado:
+    """
+    Cache de escriturações por processo, com limite de memória.
+
+    Exemplo:
+        cache = obter_cache_compartilhado()
+        referencia = cache.obter(hash_conteudo) or cache.publicar(
+            hash_conteudo, empresa, df_plano, df_saldos)
+        referencia.dados.df_saldos
+    """
+
+    def __init__(self, limite_bytes: Optional[int] = None):
+        self.limite_bytes = limite_bytes if limite_bytes is not None else LIMITE_MEMORIA_MB * 1024 * 1024
+        self._entradas: "OrderedDict[str, _Entrada]" = OrderedDict()
+        self._trava = threading.RLock()
+        self._metricas = {"acertos": 0, "recargas_disco": 0, "faltas": 0, "despejos": 0}
+
+    # ------------------------------------------
+    # Consulta e publicação
+    # ------------------------------------------
+    def obter(self, hash_conteudo: str) -> Optional[ReferenciaDados]:
+        """Referência à escrituração em memória ou recarregada do Parquet; None se desconhecida"""
+
+        with self._trava:
+            entrada = self._entradas.get(hash_conteudo)
+            if entrada is not None:
+                self._metricas["acertos"] += 1
+                self._entradas.move_to_end(hash_conteudo)
+                return self._referenciar(entrada)
+
+        if not existe_parquet(hash_conteudo):
+            with self._trava:
+                self._metricas["faltas"] += 1
+            return None
+
+        # Leitura do disco fora da trava (outras sessões seguem atendidas)
+        sped = abrir_sped_lazy(hash_conteudo)
+        achados = ler_achados_parquet(hash_conteudo)
+        dados = ConjuntoDados(
+            hash_conteudo=hash_conteudo,
+            empresa=sped.empresa,
+            df_plano=sped.plano.collect(),
+            df_saldos=sped.saldos_enriquecidos().collect(),
+            achados=frame_achados(achados) if achados is not None else None,
+        )
+
+        with self._trava:
+            self._metricas["recargas_disco"] += 1
+            referencia = self._inserir(dados)
+        self._despejar()
+        return referencia
+
+    def publicar(
+        self,
+        hash_conteudo: str,
+        empresa: Optional[DadosEmpresa],
+        df_plano: pl.DataFrame,
+        df_saldos: pl.DataFrame,
+        achados: Optional[pl.DataFrame] = None,
+        persistente: bool = True,
+    ) -> ReferenciaDados:
+        """
+        Publica uma escrituração recém-processada. Se outra sessão já a
+        publicou, a cópia existente é reutilizada e a nova é descartada.
+
+        Com persistente=False (ex.: dados de demonstração, sem hash de
+        conteúdo real), a escrituração nunca é gravada no cache em disco.
+        """
+
+        dados = ConjuntoDados(hash_conteudo, empresa, df_plano, df_saldos, achados)
+        with self._trava:
+            referencia = self._inserir(dados, persistente)
+        self._despejar()
+        return referencia
+
+    def anexar_achados(self, hash_conteudo: str, achados: pl.DataFrame) -> None:
+        """Guarda os achados calculados para a escrituração (compartilhados entre sessões)"""
+        with self._trava:
+            entrada = self._entradas.get(hash_conteudo)
+            if entrada is None:
+                return
+            entrada.dados = replace(entrada.dados, achados=achados)
+            entrada.tamanho = entrada.dados.tamanho_bytes
+        self._despejar()
+
+    # ------------------------------------------
+    # Internos (chamados com a trava, exceto _despejar)
+    # ------------------------------------------
+    def _inserir(self, dados: ConjuntoDados, persistente: bool = True) -> ReferenciaDados:
+        entrada = self._entradas.get(dados.hash_conteudo)
+        if entrada is None:
+            entrada = _Entrada(dados=dados, tamanho=dados.tamanho_bytes, persistente=persistente)
+            self._entradas[dados.hash_conteudo] = entrada
+        elif entrada.dados.achados is None and dados.achados is not None:
+            entrada.dados = replace(entrada.dados, achados=dados.achados)
+            entrada.tamanho = entrada.dados.tamanho_bytes
+
+        self._entradas.move_to_end(dados.hash_conteudo)
+        return self._referenciar(entrada)
+
+    def _referenciar(self, entrada: _Entrada) -> ReferenciaDados:
+        entrada.referencias += 1
+        return ReferenciaDados(self, entrada.dados)
+
+    def _entrada_referenciada(self, hash_conteudo: str) -> ConjuntoDados:
+        with self._trava:
+            return self._entradas[hash_conteudo].dados
+
+    def _liberar(self, hash_conteudo: str) -> None:
+        with self._trava:
+            entrada = self._entradas.get(hash_conteudo)
+            if entrada is not None and entrada.referencias > 0:
+                entrada.referencias -= 1
+        self._despejar()
+
+    def _despejar(self) -> None:
+        """
+        Despeja escriturações sem referências (LRU) até caber no orçamento.
+
+        As vítimas são escolhidas com a trava e gravadas no disco sem ela;
+        cada uma só sai da memória se, terminada a gravação, continuar sem
+        referências e sem alterações (achados anexados no meio do caminho).
+        """
+
+        with self._trava:
+            em_despejo = sum(e.tamanho for e in self._entradas.values() if e.despejando)
+            excesso = self.bytes_residentes - em_despejo - self.limite_bytes
+            vitimas = []
+            for hash_conteudo, entrada in self._entradas.items():
+                if excesso <= 0:
+                    break
+                if entrada.referencias > 0 or entrada.despejando:
+                    continue
+                entrada.despejando = True
+                vitimas.append((hash_conteudo, entrada, entrada.dados))
+                excesso -= entrada.tamanho
+
+        for hash_conteudo, entrada, dados in vitimas:
+            gravada = not entrada.persistente or self._persistir(dados)
+            with self._trava:
+                entrada.despejando = False
+                if (
+                    not gravada
+                    or entrada.referencias > 0
+                    or entrada.dados is not dados
+                    or self._entradas.get(hash_conteudo) is not entrada
+                ):
+                    continue
+                del self._entradas[hash_conteudo]
+                self._metricas["despejos"] += 1
+
+    @staticmethod
+    def _persistir(dados: ConjuntoDados) -> bool:
+        """Garante parse e achados no cache em disco (False se não foi possível)"""
+        try:
+            if not existe_parquet(dados.hash_conteudo):
+                gravar_parquet(
+                    dados.hash_conteudo,
+                    dados.empresa.to_dict() if dados.empresa else None,
+                    dados.df_plano,
+                    dados.df_saldos,
+                )
+            if dados.achados is not None:
+                gravar_achados_parquet(dados.hash_conteudo, dados.achados)
+        except OSError:
+            # Sem disco, a escrituração permanece em memória
+            return False
+        return True
+
+    # ------------------------------------------
+    # Métricas
+    # ------------------------------------------
+    @property
+    def bytes_residentes(self) -> int:
+        return sum(e.tamanho for e in self._entradas.values())
+
+    def metricas(self) -> Dict[str, Any]:
+        """Acertos, recargas do disco, faltas, taxa de acerto e memória residente"""
+        with self._trava:
+            consultas = sum(self._metricas[c] for c in ["acertos", "recargas_disco", "faltas"])
+            return {
+                **self._metricas,
+                "consultas": consultas,
+                "taxa_acerto": self._metricas["acertos"] / consultas if consultas else 0.0,
+                "entradas": len(self._entradas),
+                "referencias_ativas": sum(e.referencias for e in self._entradas.values()),
+                "bytes_residentes": self.bytes_residentes,
+                "limite_bytes": self.limite_bytes,
+            }
+
+
+_cache_processo: Optional[CacheCompartilhado] = None
+_trava_criacao = threading.Lock()
+
+
+def obter_cache_compartilhado() -> CacheCompartilhado:
+    """Instância única do cache no processo (compartilhada por todas as sessões)"""
+    global _cache_processo
+    with _trava_criacao:
+        if _cache_processo is None:
+            _cache_processo = CacheCompartilhado()
+        return _cache_processo
@@ -0,0 +1,373 @@
+"""
+Análise por Centro de Custo
+Audiper - Sistema de Auditoria Digital
+
+Cubo conta × centro de custo × período construído sobre a base do cubo de
+saldos (core.cubo_saldos), com os agregados pré-calculados:
+
+- base: saldo com sinal, débitos, créditos, saldo do período anterior e
+  variação para cada conta/centro/período;
+- por_centro: totais por centro de custo, natureza e período.
+
+O fatiamento do dashboard e os testes por centro de custo (saldos invertidos
+e variação entre períodos) leem desses agregados, sem reagregar os saldos.
+"""
+
+import threading
+import polars as pl
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import date
+from typing import Dict, List, Optional, Tuple, Union
+
+from .achados import (
+    Regra,
+    Severidade,
+    registrar_regra,
+    severidade_da_regra,
+    estatisticas_achados,
+    frame_achados,
+    achados_vazios,
+)
+from .cubo_saldos import gerar_cubo_saldos, hash_dados, saldo_periodo_anterior, chave_com_plano
+from .execucao import coletar
+
+
+TESTE_CENTROS_CUSTO = "Centros de Custo"
+
+for _regra in [
+    Regra(
+        regra_id="CC-01",
+        teste=TESTE_CENTROS_CUSTO,
+        severidade=Severidade.ATENCAO.value,
+        achado="Conta do ATIVO com saldo CREDOR no centro de custo",
+        recomendacao="Verificar rateios e transferências entre centros de custo; o saldo consolidado pode esconder a inversão.",
+    ),
+    Regra(
+        regra_id="CC-02",
+        teste=TESTE_CENTROS_CUSTO,
+        severidade=Severidade.ATENCAO.value,
+        achado="Conta do PASSIVO com saldo DEVEDOR no centro de custo",
+        recomendacao="Verificar baixas lançadas em centro de custo diferente do registro da obrigação.",
+    ),
+    Regra(
+        regra_id="CC-03",
+        teste=TESTE_CENTROS_CUSTO,
+        severidade=Severidade.INFO.value,
+        achado="Conta do PL com saldo DEVEDOR no centro de custo",
+        recomendacao="Confirmar se a segregação do PL por centro de custo é intencional.",
+    ),
+    Regra(
+        regra_id="CC-10",
+        teste=TESTE_CENTROS_CUSTO,
+        severidade=Severidade.ATENCAO.value,
+        achado="Variação relevante do saldo no centro de custo em relação ao período anterior",
+        recomendacao="Analisar os lançamentos do período no centro de custo e a documentação de suporte.",
+    ),
+    Regra(
+        regra_id="CC-11",
+        teste=TESTE_CENTROS_CUSTO,
+        severidade=Severidade.INFO.value,
+        achado="Centro de custo passou a movimentar a conta com saldo relevante",
+        recomendacao="Confirmar a criação do centro de custo e os critérios de apropriação.",
+    ),
+]:
+    registrar_regra(_regra)
+
+
+# Sinal esperado do saldo (com sinal D+/C-) por natureza
+SINAL_ESPERADO = {
+    "ATIVO": 1,
+    "PASSIVO": -1,
+    "PATRIMÔNIO LÍQUIDO": -1,
+}
+
+# Coluna da matriz para os saldos sem centro de custo (I155.COD_CCUS vazio)
+SEM_CENTRO = "SEM CENTRO"
+
+MAXIMO_CUBOS_MEMORIZADOS = 16
+
+_cubos: "OrderedDict[str, CuboCentrosCusto]" = OrderedDict()
+
+# Sessões do dashboard e trabalhadores do monitor consultam o LRU em paralelo
+_trava_cubos = threading.Lock()
+
+
+@dataclass
+class CuboCentrosCusto:
+    """Agregados pré-calculados por conta × centro de custo × período"""
+
+    base: pl.DataFrame
+    por_centro: pl.DataFrame
+
+    @property
+    def centros_custo(self) -> List[str]:
+        return self.por_centro.get_column("centro_custo").unique().sort().to_list()
+
+    @property
+    def periodos(self) -> List[date]:
+        return self.por_centro.get_column("periodo_fim").unique().sort().drop_nulls().to_list()
+
+    def fatiar(
+        self,
+        centro_custo: Optional[Union[str, List[str]]] = None,
+        cod_conta: Optional[str] = None,
+        periodo_fim: Optional[date] = None,
+        natureza: Optional[str] = None,
+    ) -> pl.DataFrame:
+        """Recorte da base do cubo (filtros combinados; None = todos)"""
+
+        filtros = []
+        if centro_custo is not None:
+            centros = [centro_custo] if isinstance(centro_custo, str) else centro_custo
+            filtros.append(pl.col("centro_custo").is_in(centros))
+        if cod_conta is not None:
+            filtros.append(pl.col("cod_conta") == cod_conta)
+        if periodo_fim is not None:
+            filtros.append(pl.col("periodo_fim") == periodo_fim)
+        if natureza is not None:
+            filtros.append(pl.col("natureza") == natureza)
+
+        return self.base.filter(pl.all_horizontal(filtros)) if filtros else self.base
+
+    def totais(self, periodo_fim: Optional[date] = None, natureza: Optional[str] = None) -> pl.DataFrame:
+        """Totais por centro de custo (lidos do agregado por_centro)"""
+        df = self.por_centro
+        if periodo_fim is not None:
+            df = df.filter(pl.col("periodo_fim") == periodo_fim)
+        if natureza is not None:
+            df = df.filter(pl.col("natureza") == natureza)
+        return df
+
+    def matriz(self, periodo_fim: Optional[date] = None, natureza: Optional[str] = None) -> pl.DataFrame:
+        """
+        Tabela dinâmica conta × centro de custo do saldo com sinal; saldos
+        sem centro de custo ficam na coluna SEM_CENTRO
+        """
+
+        periodos = self.periodos
+        periodo_fim = periodo_fim or (periodos[-1] if periodos else None)
+        recorte = self.fatiar(periodo_fim=periodo_fim, natureza=natureza)
+        if recorte.is_empty():
+            return pl.DataFrame()
+
+        rotulo = (
+            pl.when(pl.col("centro_custo").fill_null("") == "")
+            .then(pl.lit(SEM_CENTRO))
+            .otherwise(pl.col("centro_custo"))
+            .alias("centro_custo")
+        )
+        return (
+            recorte.with_columns(rotulo)
+            .pivot(
+                on="centro_custo",
+                index=["cod_conta", "descricao"],
+                values="saldo_final",
+                aggregate_function="sum",
+                sort_columns=True,
+            )
+            .sort("cod_conta")
+        )
+
+
+def gerar_cubo_centros_custo(
+    df_saldos: Union[pl.DataFrame, pl.LazyFrame],
+    df_plano: Optional[pl.DataFrame] = None,
+    chave: Optional[str] = None,
+) -> CuboCentrosCusto:
+    """
+    Gera (ou recupera da memória) o cubo por centro de custo.
+
+    Args:
+        df_saldos: Saldos enriquecidos (DataFrame ou LazyFrame)
+        df_plano: Plano de contas (descrição e classificação de retificadoras)
+        chave: Identificador do conjunto de dados (ex.: hash do arquivo).
+            Informe sempre que possível: se None, é calculado pelo
+            conteúdo (hash_dados), o que varre todos os saldos
+
+    Returns:
+        CuboCentrosCusto
+    """
+
+    if chave is None:
+        if isinstance(df_saldos, pl.LazyFrame):
+            df_saldos = df_saldos.collect()
+        chave = hash_dados(df_saldos)
+    chave_cubo = chave_com_plano(chave, df_plano)
+
+    with _trava_cubos:
+        if chave_cubo in _cubos:
+            _cubos.move_to_end(chave_cubo)
+            return _cubos[chave_cubo]
+
+    # A única agregação sobre os saldos é a do cubo de saldos (memorizada)
+    base = gerar_cubo_saldos(df_saldos, df_plano, chave=chave).base
+
+    # Atributos das contas vêm do plano (pequeno); sem plano, dos próprios saldos
+    if df_plano is not None and not df_plano.is_empty():
+        atributos = df_plano.lazy()
+    else:
+        atributos = df_saldos.lazy()
+    colunas_atributos = [c for c in ["descricao", "eh_retificadora"] if c in atributos.collect_schema().names()]
+    atributos = coletar(
+        atributos.select(["cod_conta", *colunas_atributos])
+        .unique(subset="cod_conta", keep="first")
+    )
+
+    # Saldo anterior: o do período imediatamente anterior da escrituração
+    # (sem linha nele, nulo), não o da linha anterior da série
+    chaves_serie = ["cod_conta", "centro_custo"]
+    base = (
+        saldo_periodo_anterior(
+            base.join(atributos, on="cod_conta", how="left").lazy(),
+            chaves_serie,
+            pl.col("saldo_final"),
+        )
+        .sort([*chaves_serie, "periodo_fim"])
+        .collect()
+        .with_columns(
+            (pl.col("saldo_final") - pl.col("saldo_anterior").fill_null(0.0)).alias("variacao"),
+            pl.when(pl.col("saldo_anterior").fill_null(0.0) != 0)
+            .then((pl.col("saldo_final") - pl.col("saldo_anterior")) / pl.col("saldo_anterior").abs())
+            .otherwise(None)
+            .alias("variacao_percentual"),
+        )
+    )
+    if "descricao" not in base.columns:
+        base = base.with_columns(pl.lit(None, dtype=pl.String).alias("descricao"))
+    if "eh_retificadora" not in base.columns:
+        base = base.with_columns(pl.lit(False).alias("eh_retificadora"))
+
+    por_centro = (
+        base.group_by(["centro_custo", "natureza", "periodo_fim"])
+        .agg(
+            pl.col("cod_conta").n_unique().alias("contas"),
+            pl.col("debitos").sum(),
+            pl.col("creditos").sum(),
+            pl.col("saldo_final").sum(),
+            pl.col("saldo_anterior").sum(),
+        )
+        .sort(["periodo_fim", "centro_custo", "natureza"])
+    )
+
+    cubo = CuboCentrosCusto(base=base, por_centro=por_centro)
+
+    with _trava_cubos:
+        _cubos[chave_cubo] = cubo
+        _cubos.move_to_end(chave_cubo)
+        if len(_cubos) > MAXIMO_CUBOS_MEMORIZADOS:
+            _cubos.popitem(last=False)
+
+    return cubo
+
+
+def _colunas_achado(regra_id: pl.Expr, valor: pl.Expr) -> list:
+    return [
+        regra_id.alias("regra_id"),
+        "cod_conta",
+        "descricao",
+        "natureza",
+        "centro_custo",
+        "periodo_fim",
+        valor.alias("valor"),
+        severidade_da_regra(regra_id).alias("severidade"),
+    ]
+
+
+def teste_saldos_invertidos_centro_custo(
+    cubo: CuboCentrosCusto,
+    periodo_fim: Optional[date] = None,
+) -> Tuple[pl.DataFrame, Dict[str, int]]:
+    """
+    TESTE: Saldos invertidos por centro de custo
+
+    Aponta contas do Ativo/Passivo/PL cujo saldo em um centro de custo tem
+    natureza invertida, mesmo que o saldo consolidado da conta esteja correto.
+    Retificadoras são exceção, como no teste consolidado.
+
+    Args:
+        cubo: Cubo por centro de custo
+        periodo_fim: Período a testar (padrão: último período)
+
+    Returns:
+        Tupla com (DataFrame de achados, estatísticas)
+    """
+
+    periodos = cubo.periodos
+    periodo_fim = periodo_fim or (periodos[-1] if periodos else None)
+    recorte = cubo.fatiar(periodo_fim=periodo_fim)
+    if recorte.is_empty():
+        return achados_vazios(), estatisticas_achados(achados_vazios())
+
+    sinal = pl.col("natureza").replace_strict(SINAL_ESPERADO, default=None, return_dtype=pl.Int8)
+    natureza = pl.col("natureza")
+
+    achados = (
+        recorte.lazy()
+        .filter(
+            (pl.col("centro_custo").fill_null("") != "")
+            & sinal.is_not_null()
+            & (pl.col("saldo_final") * sinal < 0)
+            & ~pl.col("eh_retificadora").fill_null(False)
+        )
+        .select(_colunas_achado(
+            pl.when(natureza == "ATIVO").then(pl.lit("CC-01"))
+            .when(natureza == "PASSIVO").then(pl.lit("CC-02"))
+            .otherwise(pl.lit("CC-03")),
+            pl.col("saldo_final").abs(),
+        ))
+        .with_row_index("id", offset=1)
+        .collect()
+    )
+
+    achados = frame_achados(achados)
+    return achados, estatisticas_achados(achados)
+
+
+def teste_variacao_centro_custo(
+    cubo: CuboCentrosCusto,
+    limite_percentual: float = 0.5,
+    valor_minimo: float = 10_000.0,
+) -> Tuple[pl.DataFrame, Dict[str, int]]:
+    """
+    TESTE: Variação entre períodos por centro de custo
+
+    Regras:
+    - CC-10: |variação| >= valor_minimo e |variação %| >= limite_percentual
+    - CC-11: centro de custo sem saldo no período anterior que passa a ter
+      saldo >= valor_minimo (exceto no primeiro período da escrituração)
+
+    Returns:
+        Tupla com (DataFrame de achados, estatísticas)
+    """
+
+    periodos = cubo.periodos
+    if len(periodos) < 2:
+        return achados_vazios(), estatisticas_achados(achados_vazios())
+
+    relevante = pl.col("variacao").abs() >= valor_minimo
+    novo = (
+        pl.col("saldo_anterior").is_null()
+        & (pl.col("periodo_fim") != periodos[0])
+        & (pl.col("saldo_final").abs() >= valor_minimo)
+    )
+    variou = relevante & (pl.col("variacao_percentual").abs() >= limite_percentual)
+
+    achados = (
+        cubo.base.lazy()
+        .filter(pl.col("centro_custo").fill_null("") != "")
+        .filter(novo | variou)
+        .select(
+            *_colunas_achado(
+                pl.when(novo).then(pl.lit("CC-11")).otherwise(pl.lit("CC-10")),
+                pl.col("variacao"),
+            ),
+            pl.col("saldo_anterior").alias("valor_anterior"),
+            "variacao_percentual",
+        )
+        .with_row_index("id", offset=1)
+        .collect()
+    )
+
+    achados = frame_achados(achados)
+    return achados, estatisticas_achados(achados)
@@ -0,0 +1,156 @@
+"""
+Classificador de Contas Retificadoras
+Audiper - Sistema de Auditoria Digital
+
+Identifica contas retificadoras (depreciação, PDD, prejuízos acumulados...)
+uma única vez por plano de contas:
+
+- descrições normalizadas (maiúsculas, sem acentos: "Provisão" = "PROVISAO");
+- busca de múltiplos termos em uma passada (str.contains_any, Aho-Corasick);
+- herança pela hierarquia: contas sob um grupo marcado como redutor, como
+  "(-) DEPRECIAÇÃO ACUMULADA", também são retificadoras. Só marcadores de
+  conta redutora são herdados: sob "PROVISÃO TRABALHISTA" ou "AJUSTES..."
+  ficam passivos e ativos comuns (ex.: Férias a Pagar).
+
+O resultado fica na coluna booleana eh_retificadora do df_plano e segue para
+os saldos no enriquecimento, sendo reutilizado por todos os testes e períodos.
+"""
+
+import threading
+import polars as pl
+from collections import OrderedDict
+from typing import Iterable, Optional, Tuple
+
+from .cubo_saldos import expandir_ancestrais, hash_dados
+
+
+# Termos (já normalizados) que identificam contas retificadoras
+TERMOS_RETIFICADORAS = [
+    "DEPRECIA", "AMORTIZA", "EXAUST", "PROVIS", "PERDAS",
+    "(-)", "RETIFICADORA", "DEVEDORES DUVIDOSOS", "PREJUIZO",
+    "AJUSTE", "REDUCAO"
+]
+
+# Termos de grupos redutores: as contas abaixo deles herdam a classificação
+TERMOS_HERANCA = ["(-)", "DEPRECIA", "AMORTIZA", "EXAUST", "RETIFICADORA"]
+
+COLUNA_RETIFICADORA = "eh_retificadora"
+
+# Planos classificados mantidos em memória (LRU)
+MAXIMO_PLANOS_MEMORIZADOS = 32
+
+_planos_classificados: "OrderedDict[Tuple[str, Tuple], pl.DataFrame]" = OrderedDict()
+_trava_planos = threading.Lock()
+
+
+def normalizar_texto(expr: pl.Expr) -> pl.Expr:
+    """Maiúsculas e sem acentos (decomposição NFKD + remoção das marcas)"""
+    return (
+        expr.fill_null("")
+        .str.normalize("NFKD")
+        .str.replace_all(r"\p{M}", "")
+        .str.to_uppercase()
+    )
+
+
+def _normalizar_termo(termo: str) -> str:
+    return pl.select(normalizar_texto(pl.lit(termo))).item()
+
+
+class ClassificadorRetificadoras:
+    """
+    Classificador pré-compilado a partir de uma lista de termos.
+
+    Exemplo:
+        classificador = ClassificadorRetificadoras(TERMOS_RETIFICADORAS + ["REDUTORA"])
+        df_plano = classificador.classificar(df_plano)
+    """
+
+    def __init__(
+        self,
+        termos: Optional[Iterable[str]] = None,
+        herdar_superior: bool = True,
+        termos_heranca: Optional[Iterable[str]] = None,
+    ):
+        termos = TERMOS_RETIFICADORAS if termos is None else termos
+        termos_heranca = TERMOS_HERANCA if termos_heranca is None else termos_heranca
+        self.termos = tuple(sorted({_normalizar_termo(t) for t in termos if t}))
+        self.termos_heranca = tuple(sorted({_normalizar_termo(t) for t in termos_heranca if t}))
+        self.herdar_superior = herdar_superior
+
+    @property
+    def chave(self) -> Tuple:
+        return (self.termos, self.termos_heranca, self.herdar_superior)
+
+    def expressao(self, coluna: str = "descricao", termos: Optional[Tuple[str, ...]] = None) -> pl.Expr:
+        """Expressão booleana que testa a descrição contra todos os termos"""
+        termos = self.termos if termos is None else termos
+        if not termos:
+            return pl.lit(False)
+        return normalizar_texto(pl.col(coluna)).str.contains_any(list(termos))
+
+    def classificar(self, df_plano: pl.DataFrame) -> pl.DataFrame:
+        """Acrescenta (ou recalcula) a coluna eh_retificadora no plano"""
+
+        if df_plano.is_empty():
+            return df_plano
+
+        df_plano = df_plano.drop(COLUNA_RETIFICADORA, strict=False)
+        chave = (hash_dados(df_plano), self.chave)
+        with _trava_planos:
+            if chave in _planos_classificados:
+                _planos_classificados.move_to_end(chave)
+                return _planos_classificados[chave]
+
+        proprias = self.expressao()
+
+        if self.herdar_superior and "conta_superior" in df_plano.columns:
+            # Retificadora se a própria conta casar com os termos ou algum
+            # ancestral (distância >= 1) for um grupo redutor
+            redutores = df_plano.select(
+                pl.col("cod_conta").alias("cod_ancestral"),
+                self.expressao(termos=self.termos_heranca).alias("_redutor"),
+            ).unique(subset="cod_ancestral", keep="first")
+            herdadas = (
+                expandir_ancestrais(df_plano)
+                .filter(pl.col("distancia") > 0)
+                .join(redutores, on="cod_ancestral", how="inner")
+                .group_by("cod_conta")
+                .agg(pl.col("_redutor").any())
+            )
+            resultado = (
+                df_plano
+                .join(herdadas, on="cod_conta", how="left", maintain_order="left")
+                .with_columns((proprias | pl.col("_redutor").fill_null(False)).alias(COLUNA_RETIFICADORA))
+                .drop("_redutor")
+            )
+        else:
+            resultado = df_plano.with_columns(proprias.alias(COLUNA_RETIFICADORA))
+
+        resultado = resultado.with_columns(pl.col(COLUNA_RETIFICADORA).fill_null(False))
+
+        with _trava_planos:
+            _planos_classificados[chave] = resultado
+            _planos_classificados.move_to_end(chave)
+            if len(_planos_classificados) > MAXIMO_PLANOS_MEMORIZADOS:
+                _planos_classificados.popitem(last=False)
+
+        return resultado
+
+
+_classificador_padrao: Optional[ClassificadorRetificadoras] = None
+
+
+def classificador_padrao() -> ClassificadorRetificadoras:
+    global _classificador_padrao
+    if _classificador_padrao is None:
+        _classificador_padrao = ClassificadorRetificadoras()
+    return _classificador_padrao
+
+
+def classificar_plano(
+    df_plano: pl.DataFrame,
+    classificador: Optional[ClassificadorRetificadoras] = None,
+) -> pl.DataFrame:
+    """Plano de contas com a coluna eh_retificadora (memorizado por plano)"""
+    return (classificador or classificador_padrao()).classificar(df_plano)
@@ -0,0 +1,353 @@
+"""
+Cubo de Saldos (Balanço / DRE)
+Audiper - Sistema de Auditoria Digital
+
+Agrega os saldos (I155) em uma única passada group_by por
+natureza × conta × centro de custo × período, com sinal (D positivo,
+C negativo). A partir dessa base, já pequena, são derivados:
+
+- totais por natureza, nível e conta sintética (rollup pela hierarquia do plano);
+- estruturas de Balanço Patrimonial e DRE.
+
+Os cubos são memorizados pelo hash do conjunto de dados, de modo que o
+dashboard navega entre dimensões sem varrer os saldos novamente.
+"""
+
+import hashlib
+import threading
+import polars as pl
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import date
+from typing import Optional, Union, Dict, Any, List
+
+from .execucao import coletar, tamanho_estimado
+
+
+# Quantidade de cubos mantidos em memória (LRU)
+MAXIMO_CUBOS_MEMORIZADOS = 16
+
+NATUREZAS_BALANCO = ["ATIVO", "PASSIVO", "PATRIMÔNIO LÍQUIDO"]
+
+_cubos: "OrderedDict[str, CuboSaldos]" = OrderedDict()
+
+# Sessões do dashboard e trabalhadores do monitor consultam o LRU em paralelo
+_trava_cubos = threading.Lock()
+
+
+def saldo_com_sinal(valor: str, indicador: str) -> pl.Expr:
+    """Saldo com sinal contábil: D positivo, C negativo"""
+    return (
+        pl.when(pl.col(indicador) == "C")
+        .then(-pl.col(valor))
+        .otherwise(pl.col(valor))
+    )
+
+
+def expandir_ancestrais(
+    df: pl.DataFrame,
+    coluna_codigo: str = "cod_conta",
+    coluna_superior: str = "conta_superior",
+) -> pl.DataFrame:
+    """
+    Gera o fechamento transitivo da hierarquia: uma linha (codigo, ancestral,
+    distancia) para cada conta e cada um de seus ancestrais, incluindo ela
+    mesma (distância 0). Cada nível da árvore é resolvido com um join.
+
+    Returns:
+        DataFrame com colunas [coluna_codigo, "cod_ancestral", "distancia"]
+    """
+
+    pais = (
+        df.select(
+            pl.col(coluna_codigo).alias("cod_ancestral"),
+            pl.col(coluna_superior).alias("cod_pai"),
+        )
+        .filter(pl.col("cod_pai").is_not_null() & (pl.col("cod_pai") != ""))
+        .unique(subset="cod_ancestral", keep="first")
+    )
+
+    fronteira = df.select(
+        pl.col(coluna_codigo),
+        pl.col(coluna_codigo).alias("cod_ancestral"),
+        pl.lit(0, dtype=pl.UInt32).alias("distancia"),
+    ).unique(subset=coluna_codigo, keep="first")
+
+    niveis = [fronteira]
+    # Limite de segurança contra ciclos no plano de contas
+    for _ in range(64):
+        fronteira = (
+            fronteira.join(pais, on="cod_ancestral", how="inner")
+            .select(
+                pl.col(coluna_codigo),
+                pl.col("cod_pai").alias("cod_ancestral"),
+                (pl.col("distancia") + 1).alias("distancia"),
+            )
+        )
+        if fronteira.is_empty():
+            break
+        niveis.append(fronteira)
+
+    return pl.concat(niveis)
+
+
+def saldo_periodo_anterior(
+    lf: pl.LazyFrame,
+    chaves: List[str],
+    valor: pl.Expr,
+    alias: str = "saldo_anterior",
+) -> pl.LazyFrame:
+    """
+    Acrescenta o valor da mesma série (chaves) no período imediatamente
+    anterior da escrituração. Séries sem linha nesse período (conta sem saldo
+    no mês) ficam com nulo, em vez de herdar um período mais antigo.
+    """
+
+    periodos = lf.select(pl.col("periodo_fim").drop_nulls().unique().sort())
+    anteriores = periodos.with_columns(pl.col("periodo_fim").shift(1).alias("_periodo_anterior"))
+    valores = (
+        lf.group_by([*chaves, "periodo_fim"])
+        .agg(valor.sum().alias(alias))
+        .rename({"periodo_fim": "_periodo_anterior"})
+    )
+    return (
+        lf.join(anteriores, on="periodo_fim", how="left", maintain_order="left")
+        .join(valores, on=[*chaves, "_periodo_anterior"], how="left", maintain_order="left")
+        .drop("_periodo_anterior")
+    )
+
+
+@dataclass
+class CuboSaldos:
+    """Agregados de saldos com sinal, prontos para fatiamento"""
+
+    # natureza × cod_conta × centro_custo × periodo_fim (contas analíticas)
+    base: pl.DataFrame
+    # Mesmas medidas consolidadas em cada conta (analítica ou sintética) do plano
+    por_conta: pl.DataFrame
+
+    @property
+    def periodos(self) -> pl.Series:
+        return self.base.get_column("periodo_fim").unique().sort()
+
+    def _periodo(self, periodo_fim: Optional[date]) -> Optional[date]:
+        if periodo_fim is not None:
+            return periodo_fim
+        periodos = self.periodos.drop_nulls()
+        return periodos[-1] if len(periodos) else None
+
+    def _filtrar_periodo(self, df: pl.DataFrame, periodo_fim: Optional[date]) -> pl.DataFrame:
+        periodo = self._periodo(periodo_fim)
+        if periodo is None:
+            return df
+        return df.filter(pl.col("periodo_fim") == periodo)
+
+    def por_natureza(self, periodo_fim: Optional[date] = None) -> pl.DataFrame:
+        """Totais com sinal por natureza no período (padrão: último período)"""
+        return (
+            self._filtrar_periodo(self.base, periodo_fim)
+            .group_by("natureza")
+            .agg(
+                pl.col("quantidade").sum(),
+                pl.col("saldo_inicial").sum(),
+                pl.col("debitos").sum(),
+                pl.col("creditos").sum(),
+                pl.col("saldo_final").sum(),
+            )
+            .sort("natureza")
+        )
+
+    def por_centro_custo(self, periodo_fim: Optional[date] = None) -> pl.DataFrame:
+        """Totais com sinal por natureza e centro de custo"""
+        return (
+            self._filtrar_periodo(self.base, periodo_fim)
+            .group_by(["natureza", "centro_custo"])
+            .agg(pl.col("saldo_final").sum(), pl.col("debitos").sum(), pl.col("creditos").sum())
+            .sort(["natureza", "centro_custo"])
+        )
+
+    def por_nivel(self, nivel: Union[int, str], periodo_fim: Optional[date] = None) -> pl.DataFrame:
+        """Contas (sintéticas ou analíticas) de um nível com seus totais consolidados"""
+        return (
+            self._filtrar_periodo(self.por_conta, periodo_fim)
+            .filter(pl.col("nivel") == str(nivel))
+            .sort("cod_conta")
+        )
+
+    def _demonstracao(
+        self,
+        naturezas: list,
+        nivel_maximo: int,
+        periodo_fim: Optional[date],
+    ) -> pl.DataFrame:
+        return (
+            self._filtrar_periodo(self.por_conta, periodo_fim)
+            .filter(
+                pl.col("natureza").is_in(naturezas)
+                & (pl.col("nivel").cast(pl.Int32, strict=False) <= nivel_maximo)
+            )
+            .select(
+                "natureza",
+                "nivel",
+                "cod_conta",
+                "descricao",
+                "periodo_fim",
+                # Apresentação na natureza da conta: credoras positivas no Passivo/PL/Receitas
+                pl.when(pl.col("natureza") == "ATIVO")
+                .then(pl.col("saldo_final"))
+                .otherwise(-pl.col("saldo_final"))
+                .alias("valor"),
+            )
+            .sort("cod_conta")
+        )
+
+    def balanco_patrimonial(self, nivel_maximo: int = 3, periodo_fim: Optional[date] = None) -> pl.DataFrame:
+        """Linhas do Balanço (Ativo, Passivo, PL) até o nível informado"""
+        return self._demonstracao(NATUREZAS_BALANCO, nivel_maximo, periodo_fim)
+
+    def dre(self, nivel_maximo: int = 3, periodo_fim: Optional[date] = None) -> pl.DataFrame:
+        """Linhas da DRE (contas de resultado; receitas positivas, despesas negativas)"""
+        return self._demonstracao(["RESULTADO"], nivel_maximo, periodo_fim)
+
+
+def _colunas_opcionais(lf: pl.LazyFrame) -> pl.LazyFrame:
+    """Garante centro_custo e periodo_fim em frames antigos ou de demonstração"""
+    colunas = lf.collect_schema().names()
+    faltantes = []
+    if "centro_custo" not in colunas:
+        faltantes.append(pl.lit("").alias("centro_custo"))
+    if "periodo_fim" not in colunas:
+        faltantes.append(pl.lit(None, dtype=pl.Date).alias("periodo_fim"))
+    return lf.with_columns(faltantes) if faltantes else lf
+
+
+def hash_dados(df: pl.DataFrame) -> str:
+    """
+    Hash do conteúdo de um DataFrame (chave de memorização).
+
+    Resume o hash de cada linha (hash_rows) em um digest blake2b: somar os
+    hashes confundiria linhas permutadas entre colunas ou que se compensam.
+    Percorre todas as linhas: em saldos grandes custa uma varredura completa
+    a cada chamada. Quem já conhece a identidade dos dados (ex.: hash do
+    arquivo) deve passar chave aos geradores de cubo.
+    """
+    if df.is_empty():
+        return f"vazio:{df.width}"
+    digest = hashlib.blake2b(df.hash_rows().to_numpy().tobytes(), digest_size=20)
+    digest.update(",".join(df.columns).encode("utf-8"))
+    return f"{df.height}:{digest.hexdigest()}"
+
+
+def chave_com_plano(chave: str, df_plano: Optional[pl.DataFrame]) -> str:
+    """O plano entra na chave: sem ele o cubo não tem as contas sintéticas"""
+    return f"{chave}|{hash_dados(df_plano)}" if df_plano is not None else f"{chave}|sem plano"
+
+
+def gerar_cubo_saldos(
+    df_saldos: Union[pl.DataFrame, pl.LazyFrame],
+    df_plano: Optional[pl.DataFrame] = None,
+    chave: Optional[str] = None,
+) -> CuboSaldos:
+    """
+    Gera (ou recupera da memória) o cubo de saldos.
+
+    Args:
+        df_saldos: Saldos enriquecidos (DataFrame ou LazyFrame)
+        df_plano: Plano de contas, para consolidar nas contas sintéticas
+        chave: Identificador do conjunto de dados (ex.: hash do arquivo).
+            Informe sempre que possível: se None, é calculado pelo
+            conteúdo (hash_dados), o que varre todos os saldos
+
+    Returns:
+        CuboSaldos
+    """
+
+    if chave is None:
+        if isinstance(df_saldos, pl.LazyFrame):
+            df_saldos = df_saldos.collect()
+        chave = hash_dados(df_saldos)
+    chave = chave_com_plano(chave, df_plano)
+
+    with _trava_cubos:
+        if chave in _cubos:
+            _cubos.move_to_end(chave)
+            return _cubos[chave]
+
+    # Passada única sobre os saldos (engine streaming acima do orçamento de
+    # memória). Somas arredondadas ao centavo e ordenação completa: o cubo não
+    # depende da ordem de soma dos blocos nem do engine
+    base = coletar(
+        _colunas_opcionais(df_saldos.lazy())
+        .filter(pl.col("tipo_conta") == "A")
+        .group_by(["natureza", "cod_conta", "centro_custo", "periodo_fim"])
+        .agg(
+            pl.len().alias("quantidade"),
+            saldo_com_sinal("saldo_inicial", "ind_saldo_ini").sum().round(2).alias("saldo_inicial"),
+            pl.col("valor_debito").sum().round(2).alias("debitos"),
+            pl.col("valor_credito").sum().round(2).alias("creditos"),
+            saldo_com_sinal("saldo_final", "ind_saldo_fin").sum().round(2).alias("saldo_final"),
+        )
+        .sort(["periodo_fim", "cod_conta", "centro_custo", "natureza"]),
+        tamanho_estimado(df_saldos),
+    )
+
+    # Rollup para as contas sintéticas sobre a base já agregada
+    if df_plano is not None and not df_plano.is_empty():
+        ancestrais = expandir_ancestrais(df_plano)
+        por_conta = (
+            base.join(ancestrais, on="cod_conta", how="inner")
+            .group_by(["cod_ancestral", "periodo_fim"])
+            .agg(
+                pl.col("quantidade").sum(),
+                pl.col("saldo_inicial").sum(),
+                pl.col("debitos").sum(),
+                pl.col("creditos").sum(),
+                pl.col("saldo_final").sum(),
+            )
+            .rename({"cod_ancestral": "cod_conta"})
+            .join(
+                df_plano.select(["cod_conta", "descricao", "natureza", "nivel", "tipo_conta"])
+                .unique(subset="cod_conta", keep="first"),
+                on="cod_conta",
+                how="left",
+            )
+            .sort(["periodo_fim", "cod_conta"])
+        )
+    else:
+        por_conta = (
+            base.group_by(["natureza", "cod_conta", "periodo_fim"])
+            .agg(
+                pl.col("quantidade").sum(),
+                pl.col("saldo_inicial").sum(),
+                pl.col("debitos").sum(),
+                pl.col("creditos").sum(),
+                pl.col("saldo_final").sum(),
+            )
+            .with_columns(
+                pl.lit(None, dtype=pl.String).alias("descricao"),
+                pl.lit(None, dtype=pl.String).alias("nivel"),
+                pl.lit("A").alias("tipo_conta"),
+            )
+            .sort(["periodo_fim", "cod_conta"])
+        )
+
+    cubo = CuboSaldos(base=base, por_conta=por_conta)
+
+    with _trava_cubos:
+        _cubos[chave] = cubo
+        _cubos.move_to_end(chave)
+        if len(_cubos) > MAXIMO_CUBOS_MEMORIZADOS:
+            _cubos.popitem(last=False)
+
+    return cubo
+
+
+def resumo_por_natureza(cubo: CuboSaldos, periodo_fim: Optional[date] = None) -> Dict[str, Dict[str, Any]]:
+    """Totais por natureza como dicionário (formato usado pelo dashboard)"""
+    return {
+        linha["natureza"]: {
+            "quantidade": linha["quantidade"],
+            "total": linha["saldo_final"],
+        }
+        for linha in cubo.por_natureza(periodo_fim).iter_rows(named=True)
+    }
@@ -0,0 +1,448 @@
+"""
+Demonstrações Contábeis (J100 / J150) e Conciliação com o Balancete
+Audiper - Sistema de Auditoria Digital
+
+Lê do ECD:
+- J005: período das demonstrações;
+- J100: Balanço Patrimonial, por código de aglutinação;
+- J150: Demonstração do Resultado (DRE), por código de aglutinação;
+- I052: código de aglutinação de cada conta analítica (filho do I050);
+- I350/I355: saldos das contas de resultado antes do encerramento.
+
+A conciliação soma os saldos do balancete (cubo de saldos) por código de
+aglutinação, consolida nos totalizadores pela hierarquia das linhas
+(COD_AGL_SUP) e compara com cada demonstração em um único join. Nos
+leiautes 1 a 6, sem COD_AGL_SUP, a hierarquia é derivada da ordem e do
+NIVEL_AGL das linhas.
+
+No upload e no monitor de pastas, estes registros são extraídos na mesma
+passada do parse principal (core.entrada) e gravados no cache com o
+resultado do parse; o original compactado só é relido para entradas
+antigas do cache.
+"""
+
+import os
+import mmap
+import shutil
+import tempfile
+import polars as pl
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+from .leitor_sped import (
+    criar_decodificador,
+    detectar_codificacao_fonte,
+    iterar_linhas,
+)
+from .achados import (
+    Regra,
+    Severidade,
+    registrar_regra,
+    severidade_da_regra,
+    estatisticas_achados,
+    frame_achados,
+    achados_vazios,
+)
+from .indice_sped import obter_indice, ler_faixas
+from .cache import existe_bruto, abrir_bruto, diretorio_cache
+from .cubo_saldos import expandir_ancestrais, gerar_cubo_saldos, saldo_com_sinal
+from .layouts import compilar_plano
+
+
+TESTE_DEMONSTRACOES = "Conciliação das Demonstrações"
+
+for _regra in [
+    Regra(
+        regra_id="DC-01",
+        teste=TESTE_DEMONSTRACOES,
+        severidade=Severidade.CRITICO.value,
+        achado="Linha do Balanço (J100) diverge dos saldos do balancete (I155)",
+        recomendacao="Revisar o mapeamento I052 das contas e a geração do Balanço no sistema contábil.",
+    ),
+    Regra(
+        regra_id="DC-02",
+        teste=TESTE_DEMONSTRACOES,
+        severidade=Severidade.CRITICO.value,
+        achado="Linha da DRE (J150) diverge dos saldos de resultado do balancete",
+        recomendacao="Conferir os saldos antes do encerramento (I355) e o mapeamento I052 das contas de resultado.",
+    ),
+    Regra(
+        regra_id="DC-03",
+        teste=TESTE_DEMONSTRACOES,
+        severidade=Severidade.ATENCAO.value,
+        achado="Código de aglutinação com saldo no balancete sem linha nas demonstrações",
+        recomendacao="Verificar se o código de aglutinação informado no I052 existe no J100/J150.",
+    ),
+]:
+    registrar_regra(_regra)
+
+
+# Grupos de registros lidos do arquivo (faixas do índice de blocos)
+REGISTROS_DEMONSTRACOES = ("I010", "I050", "I350", "J005", "J100", "J150")
+
+# Registros extraídos (leiautes em layouts.py)
+REGISTROS_EXTRAIDOS = ("J100", "J150", "I052", "I355")
+
+# Demonstrações gravadas junto ao parse: campo -> arquivo
+ARQUIVOS_DEMONSTRACOES = {
+    "balanco": "j100.parquet",
+    "dre": "j150.parquet",
+    "aglutinacao": "i052.parquet",
+    "resultado_antes_encerramento": "i355.parquet",
+}
+
+
+@dataclass
+class DemonstracoesContabeis:
+    """Balanço, DRE e mapeamento de aglutinação de uma escrituração"""
+    balanco: pl.DataFrame
+    dre: pl.DataFrame
+    aglutinacao: pl.DataFrame
+    resultado_antes_encerramento: pl.DataFrame
+
+    @property
+    def vazia(self) -> bool:
+        return self.balanco.is_empty() and self.dre.is_empty()
+
+
+def coletar_demonstracoes(
+    linhas: Iterable[bytes],
+    decodificar: Callable[[bytes], str],
+) -> Dict[str, pl.DataFrame]:
+    """
+    Extrai J100, J150, I052 e I355 em uma passada pelas linhas.
+
+    Os registros filhos herdam o contexto do pai: I052 a conta do último
+    I050, I355 a data do último I350 e J100/J150 o período do último J005.
+    O leiaute do J100/J150 segue a versão informada no I010.
+    """
+    return compilar_plano("ECD", REGISTROS_EXTRAIDOS).coletar(linhas, decodificar)
+
+
+def processar_demonstracoes(fonte: Any) -> DemonstracoesContabeis:
+    """
+    Extrai as demonstrações de um SPED ECD.
+
+    Args:
+        fonte: Caminho do arquivo em texto (lê só as faixas do índice de
+            blocos), bytes ou fluxo binário (ex.: abrir_bruto do cache)
+
+    Returns:
+        DemonstracoesContabeis
+    """
+
+    if isinstance(fonte, str):
+        indice = obter_indice(fonte)
+        faixas = [f for registro in REGISTROS_DEMONSTRACOES for f in indice.faixas(registro)]
+        with open(fonte, "rb") as arquivo, mmap.mmap(arquivo.fileno(), 0, access=mmap.ACCESS_READ) as mapa:
+            coletados = coletar_demonstracoes(ler_faixas(mapa, faixas), criar_decodificador(indice.codificacao))
+    else:
+        decodificar = criar_decodificador(detectar_codificacao_fonte(fonte))
+        coletados = coletar_demonstracoes(iterar_linhas(fonte), decodificar)
+
+    return demonstracoes_dos_quadros(coletados)
+
+
+def hierarquia_por_nivel(linhas: pl.DataFrame, subtotais: Tuple[str, ...] = ()) -> pl.DataFrame:
+    """
+    Preenche cod_agl_sup e ind_cod_agl das linhas dos leiautes 1 a 6, que não
+    os informam: a linha superior é a última linha anterior da mesma
+    demonstração (período) com NIVEL_AGL menor. Linhas com linhas abaixo e
+    as de ind_grupo em subtotais (IND_VL P/N da DRE) são totalizadoras.
+    """
+
+    if linhas.is_empty() or linhas.get_column("cod_agl_sup").is_not_null().any():
+        return linhas
+
+    niveis = linhas.get_column("nivel_agl").cast(pl.Int64, strict=False).fill_null(0)
+    superiores: List[Optional[str]] = []
+    totalizadoras = set()
+    pilha: List[Tuple[str, int]] = []
+    periodo_anterior = None
+    for cod_agl, nivel, periodo in zip(linhas.get_column("cod_agl"), niveis, linhas.get_column("periodo_fim")):
+        if periodo != periodo_anterior:
+            pilha, periodo_anterior = [], periodo
+        while pilha and pilha[-1][1] >= nivel:
+            pilha.pop()
+        superior = pilha[-1][0] if pilha else None
+        superiores.append(superior)
+        if superior is not None:
+            totalizadoras.add((periodo, superior))
+        pilha.append((cod_agl, nivel))
+
+    totalizadora = pl.Series([
+        (periodo, cod_agl) in totalizadoras
+        for periodo, cod_agl in zip(linhas.get_column("periodo_fim"), linhas.get_column("cod_agl"))
+    ])
+    return linhas.with_columns(
+        pl.Series("cod_agl_sup", superiores, dtype=pl.String),
+        pl.when(totalizadora | pl.col("ind_grupo").is_in(list(subtotais)))
+        .then(pl.lit("T")).otherwise(pl.lit("D")).alias("ind_cod_agl"),
+    )
+
+
+def demonstracoes_dos_quadros(quadros: Dict[str, pl.DataFrame]) -> DemonstracoesContabeis:
+    """Demonstrações a partir dos quadros J100, J150, I052 e I355 já extraídos"""
+    return DemonstracoesContabeis(
+        balanco=hierarquia_por_nivel(quadros["J100"]),
+        dre=hierarquia_por_nivel(quadros["J150"], subtotais=("P", "N")),
+        aglutinacao=quadros["I052"].select("cod_conta", "centro_custo", "cod_agl"),
+        resultado_antes_encerramento=quadros["I355"],
+    )
+
+
+def _diretorio_demonstracoes(hash_conteudo: str) -> Path:
+    return diretorio_cache() / "demonstracoes" / hash_conteudo
+
+
+def gravar_demonstracoes(hash_conteudo: str, demonstracoes: DemonstracoesContabeis) -> None:
+    """Grava as demonstrações no cache, como o resultado do parse"""
+
+    destino = _diretorio_demonstracoes(hash_conteudo)
+    if destino.exists():
+        return
+
+    destino.parent.mkdir(parents=True, exist_ok=True)
+    temporario = tempfile.mkdtemp(dir=destino.parent)
+    try:
+        for campo, arquivo in ARQUIVOS_DEMONSTRACOES.items():
+            getattr(demonstracoes, campo).write_parquet(os.path.join(temporario, arquivo))
+        os.replace(temporario, destino)
+    except OSError:
+        shutil.rmtree(temporario, ignore_errors=True)
+        if not destino.exists():
+            raise
+
+
+def ler_demonstracoes(hash_conteudo: str) -> Optional[DemonstracoesContabeis]:
+    """Demonstrações gravadas junto ao parse (None se não gravadas)"""
+
+    origem = _diretorio_demonstracoes(hash_conteudo)
+    if not origem.exists():
+        return None
+
+    return DemonstracoesContabeis(**{
+        campo: pl.read_parquet(origem / arquivo)
+        for campo, arquivo in ARQUIVOS_DEMONSTRACOES.items()
+    })
+
+
+def demonstracoes_do_cache(hash_conteudo: str) -> Optional[DemonstracoesContabeis]:
+    """
+    Demonstrações do cache: as gravadas junto ao parse ou, em entradas
+    anteriores a isso, extraídas uma vez do original (None se indisponível)
+    """
+
+    try:
+        demonstracoes = ler_demonstracoes(hash_conteudo)
+        if demonstracoes is not None or not existe_bruto(hash_conteudo):
+            return demonstracoes
+
+        with abrir_bruto(hash_conteudo) as fluxo:
+            demonstracoes = processar_demonstracoes(fluxo)
+        gravar_demonstracoes(hash_conteudo, demonstracoes)
+        return demonstracoes
+    except (ImportError, OSError):
+        return None
+
+
+# ============================================
+# CONCILIAÇÃO
+# ============================================
+
+def _valores_por_aglutinacao(valores_conta: pl.DataFrame, aglutinacao: pl.DataFrame) -> pl.DataFrame:
+    """
+    Soma os saldos com sinal (cod_conta, valor) por código de aglutinação,
+    arredondados ao centavo: o resultado não depende da ordem de soma (nem
+    do engine). Com a coluna natureza, leva a natureza das contas do código.
+    """
+    mapa = aglutinacao.select(["cod_conta", "cod_agl"]).unique(subset="cod_conta", keep="first")
+    natureza = [pl.col("natureza").drop_nulls().min()] if "natureza" in valores_conta.columns else []
+    return (
+        valores_conta.join(mapa, on="cod_conta", how="inner")
+        .group_by("cod_agl")
+        .agg(pl.col("valor").sum().round(2).alias("valor_balancete"), *natureza)
+    )
+
+
+def _conciliar_linhas(linhas: pl.DataFrame, valores_agl: pl.DataFrame) -> pl.DataFrame:
+    """
+    Consolida os valores nos totalizadores e compara com as linhas (um join).
+    Totalizadores sem linhas abaixo (subtotais da DRE nos leiautes 1 a 6)
+    não têm como ser consolidados e saem com conciliavel falso.
+    """
+
+    ancestrais = expandir_ancestrais(linhas, "cod_agl", "cod_agl_sup")
+    consolidado = (
+        valores_agl.join(ancestrais, on="cod_agl", how="inner")
+        .group_by("cod_ancestral")
+        .agg(pl.col("valor_balancete").sum().round(2))
+        .rename({"cod_ancestral": "cod_agl"})
+    )
+
+    return (
+        linhas.join(consolidado, on="cod_agl", how="left", maintain_order="left")
+        .with_columns(
+            saldo_com_sinal("valor_final", "ind_dc_fin").alias("valor_demonstracao"),
+            pl.col("valor_balancete").fill_null(0.0),
+        )
+        .with_columns(
+            (pl.col("valor_demonstracao") - pl.col("valor_balancete")).round(2).alias("diferenca"),
+            (
+                (pl.col("ind_cod_agl").fill_null("D") != "T")
+                | pl.col("cod_agl").is_in(linhas.get_column("cod_agl_sup").drop_nulls().implode())
+            ).alias("conciliavel"),
+        )
+    )
+
+
+def conciliar_demonstracoes(
+    demonstracoes: DemonstracoesContabeis,
+    df_saldos: Union[pl.DataFrame, pl.LazyFrame],
+    df_plano: Optional[pl.DataFrame] = None,
+    chave: Optional[str] = None,
+) -> Tuple[pl.DataFrame, pl.DataFrame]:
+    """
+    Compara cada linha do Balanço e da DRE com o balancete consolidado.
+
+    Balanço: saldos com sinal (D+/C-) do cubo de saldos na data final do J005.
+    DRE: saldos antes do encerramento (I355) do período; na ausência de I355,
+    os saldos das contas de resultado no cubo.
+
+    Returns:
+        Tupla (balanço conciliado, DRE conciliada), com as colunas
+        valor_demonstracao, valor_balancete e diferenca (com sinal D+/C-) e
+        conciliavel
+    """
+
+    base = gerar_cubo_saldos(df_saldos, df_plano, chave=chave).base
+
+    def saldos_em(periodo_fim, naturezas: Optional[List[str]] = None) -> pl.DataFrame:
+        filtro = pl.col("periodo_fim") == periodo_fim
+        if naturezas:
+            filtro = filtro & pl.col("natureza").is_in(naturezas)
+        return (
+            base.filter(filtro)
+            .group_by("cod_conta")
+            .agg(pl.col("saldo_final").sum().round(2).alias("valor"))
+        )
+
+    conciliados = []
+    for linhas, resultado in [(demonstracoes.balanco, False), (demonstracoes.dre, True)]:
+        if linhas.is_empty():
+            conciliados.append(linhas)
+            continue
+
+        partes = []
+        for (inicio, fim), linhas_periodo in linhas.group_by(["periodo_inicio", "periodo_fim"], maintain_order=True):
+            i355 = demonstracoes.resultado_antes_encerramento.filter(
+                pl.col("data_resultado").is_between(inicio, fim)
+            ) if resultado else pl.DataFrame()
+
+            if not i355.is_empty():
+                valores = i355.group_by("cod_conta").agg(saldo_com_sinal("valor", "ind_dc").sum().round(2).alias("valor"))
+            else:
+                valores = saldos_em(fim, ["RESULTADO"] if resultado else None)
+
+            partes.append(_conciliar_linhas(
+                linhas_periodo,
+                _valores_por_aglutinacao(valores, demonstracoes.aglutinacao),
+            ))
+
+        conciliados.append(pl.concat(partes))
+
+    return conciliados[0], conciliados[1]
+
+
+def teste_conciliacao_demonstracoes(
+    demonstracoes: DemonstracoesContabeis,
+    df_saldos: Union[pl.DataFrame, pl.LazyFrame],
+    df_plano: Optional[pl.DataFrame] = None,
+    chave: Optional[str] = None,
+    tolerancia: float = 1.0,
+) -> Tuple[pl.DataFrame, Dict[str, int]]:
+    """
+    TESTE: Conciliação J100/J150 × I155
+
+    Regras:
+    - DC-01: linha do Balanço com diferença acima da tolerância
+    - DC-02: linha da DRE com diferença acima da tolerância
+    - DC-03: código de aglutinação do I052 com saldo e sem linha nas demonstrações
+
+    Returns:
+        Tupla com (DataFrame de achados, estatísticas)
+    """
+
+    if demonstracoes.vazia:
+        return achados_vazios(), estatisticas_achados(achados_vazios())
+
+    balanco, dre = conciliar_demonstracoes(demonstracoes, df_saldos, df_plano, chave)
+
+    colunas = ["cod_agl", "descricao", "natureza", "valor_demonstracao", "valor_balancete", "diferenca", "periodo_fim"]
+    divergencias = []
+    if not balanco.is_empty():
+        divergencias.append(
+            balanco.filter((pl.col("diferenca").abs() > tolerancia) & pl.col("conciliavel"))
+            .with_columns(
+                pl.lit("DC-01").alias("regra_id"),
+                pl.when(pl.col("ind_grupo") == "A").then(pl.lit("ATIVO"))
+                .otherwise(pl.lit("PASSIVO")).alias("natureza"),
+            )
+            .select(["regra_id", *colunas])
+        )
+    if not dre.is_empty():
+        divergencias.append(
+            dre.filter((pl.col("diferenca").abs() > tolerancia) & pl.col("conciliavel"))
+            .with_columns(pl.lit("DC-02").alias("regra_id"), pl.lit("RESULTADO").alias("natureza"))
+            .select(["regra_id", *colunas])
+        )
+
+    # Códigos de aglutinação com saldo que não aparecem em nenhuma
+    # demonstração, na data final das demonstrações (J005)
+    codigos_demonstracoes = pl.concat([balanco.select("cod_agl"), dre.select("cod_agl")])
+    base = gerar_cubo_saldos(df_saldos, df_plano, chave=chave).base
+    periodo = pl.concat([balanco.select("periodo_fim"), dre.select("periodo_fim")]).get_column("periodo_fim").max()
+    if periodo is None:
+        periodo = base.get_column("periodo_fim").max()
+    orfaos = (
+        base
+        .filter(pl.col("periodo_fim") == periodo)
+        .group_by("cod_conta")
+        .agg(pl.col("saldo_final").sum().round(2).alias("valor"), pl.col("natureza").first())
+        .pipe(_valores_por_aglutinacao, demonstracoes.aglutinacao)
+        .join(codigos_demonstracoes, on="cod_agl", how="anti")
+        .filter(pl.col("valor_balancete").abs() > tolerancia)
+        .select(
+            pl.lit("DC-03").alias("regra_id"),
+            "cod_agl",
+            pl.lit(None, dtype=pl.String).alias("descricao"),
+            pl.col("natureza").cast(pl.String),
+            pl.lit(0.0).alias("valor_demonstracao"),
+            "valor_balancete",
+            (-pl.col("valor_balancete")).alias("diferenca"),
+            pl.lit(periodo, dtype=pl.Date).alias("periodo_fim"),
+        )
+        .sort("cod_agl")
+    )
+    divergencias.append(orfaos)
+
+    achados = (
+        pl.concat(divergencias, how="vertical_relaxed")
+        .with_row_index("id", offset=1)
+        .select(
+            "id",
+            "regra_id",
+            pl.col("cod_agl").alias("cod_conta"),
+            "descricao",
+            "natureza",
+            pl.col("diferenca").alias("valor"),
+            severidade_da_regra(pl.col("regra_id")).alias("severidade"),
+            "valor_demonstracao",
+            "valor_balancete",
+            "periodo_fim",
+        )
+    )
+
+    achados = frame_achados(achados)
+    return achados, estatisticas_achados(achados)
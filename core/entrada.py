@@ -0,0 +1,202 @@
+"""
+Entrada de Arquivos SPED
+Audiper - Sistema de Auditoria Digital
+
+Abre arquivos SPED em texto ou compactados (zip, gzip, zstd) como fluxos
+binários descompactados sob demanda, que alimentam o parser diretamente:
+nenhum arquivo é extraído para disco nem descompactado inteiro em memória.
+Um zip pode conter várias escriturações.
+"""
+
+import io
+import os
+import gzip
+import zipfile
+import polars as pl
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, Sequence, Tuple, Optional, Any, BinaryIO
+
+from .leitor_sped import (
+    DadosEmpresa,
+    REGISTROS_ECD,
+    registros_ecd,
+    montar_resultado,
+    criar_decodificador,
+    detectar_codificacao_fonte,
+    iterar_linhas,
+)
+from .layouts import compilar_plano
+from .demonstracoes import (
+    DemonstracoesContabeis,
+    REGISTROS_EXTRAIDOS,
+    demonstracoes_dos_quadros,
+    gravar_demonstracoes,
+)
+from .cache import LeitorComCache, gravar_parquet, TAMANHO_BUFFER
+from . import EXTENSOES_ACEITAS  # definida no pacote (leve) e reexportada aqui
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - dependência listada em requirements.txt
+    zstandard = None
+
+
+# Assinaturas (magic bytes) dos formatos aceitos
+ASSINATURA_ZIP = b"PK\x03\x04"
+ASSINATURA_GZIP = b"\x1f\x8b"
+ASSINATURA_ZSTD = b"\x28\xb5\x2f\xfd"
+
+
+@dataclass
+class ArquivoProcessado:
+    """Resultado do processamento de uma escrituração"""
+    nome: str
+    hash_conteudo: str
+    empresa: Optional[DadosEmpresa]
+    df_plano: pl.DataFrame
+    df_saldos: pl.DataFrame
+    status: str
+    # J100/J150/I052/I355, extraídos na mesma passada
+    demonstracoes: Optional[DemonstracoesContabeis] = None
+    # Registros adicionais pedidos pelo chamador (ex.: 0150/I250 no portfólio)
+    extras: Dict[str, pl.DataFrame] = field(default_factory=dict)
+
+
+def detectar_formato(cabecalho: bytes) -> str:
+    """Identifica o formato pelos primeiros bytes: zip, gzip, zstd ou texto"""
+    if cabecalho.startswith(ASSINATURA_ZIP):
+        return "zip"
+    if cabecalho.startswith(ASSINATURA_GZIP):
+        return "gzip"
+    if cabecalho.startswith(ASSINATURA_ZSTD):
+        return "zstd"
+    return "texto"
+
+
+def _ler_cabecalho(arquivo: BinaryIO) -> bytes:
+    posicao = arquivo.tell()
+    cabecalho = arquivo.read(4)
+    arquivo.seek(posicao)
+    return cabecalho
+
+
+def _sem_extensao(nome: str, extensao: str) -> str:
+    return nome[: -len(extensao)] if nome.lower().endswith(extensao) else nome
+
+
+def abrir_fontes_sped(arquivo: Any, nome: str = "") -> Iterator[Tuple[str, BinaryIO]]:
+    """
+    Abre um arquivo SPED (texto ou compactado) e gera (nome, fluxo) para cada
+    escrituração contida nele.
+
+    Args:
+        arquivo: Caminho (str ou PathLike), conteúdo em bytes ou objeto
+            binário com seek() (ex.: upload do Streamlit)
+        nome: Nome original do arquivo (usado para identificar as escriturações)
+
+    Yields:
+        Tuplas (nome da escrituração, fluxo binário com readline())
+    """
+
+    if isinstance(arquivo, (str, os.PathLike)):
+        nome = nome or os.fspath(arquivo)
+        with open(arquivo, "rb") as aberto:
+            yield from abrir_fontes_sped(aberto, nome)
+        return
+
+    if isinstance(arquivo, (bytes, bytearray, memoryview)):
+        yield from abrir_fontes_sped(io.BytesIO(arquivo), nome)
+        return
+
+    formato = detectar_formato(_ler_cabecalho(arquivo))
+
+    if formato == "zip":
+        with zipfile.ZipFile(arquivo) as pacote:
+            for membro in pacote.infolist():
+                if membro.is_dir() or membro.filename.startswith("__MACOSX/"):
+                    continue
+                if not membro.filename.lower().endswith(".txt"):
+                    continue
+                with pacote.open(membro) as fluxo:
+                    yield membro.filename, fluxo
+
+    elif formato == "gzip":
+        with gzip.GzipFile(fileobj=arquivo, mode="rb") as fluxo:
+            yield _sem_extensao(nome, ".gz"), fluxo
+
+    elif formato == "zstd":
+        if zstandard is None:
+            raise ImportError("Arquivos .zst requerem o pacote 'zstandard' (pip install zstandard)")
+        leitor = zstandard.ZstdDecompressor().stream_reader(arquivo, closefd=False)
+        with io.BufferedReader(leitor, buffer_size=TAMANHO_BUFFER) as fluxo:
+            yield _sem_extensao(nome, ".zst"), fluxo
+
+    else:
+        yield nome, arquivo
+
+
+def processar_arquivos_sped(
+    arquivo: Any,
+    nome: str = "",
+    guardar_cache: bool = True,
+    extras: Optional[Dict[str, Sequence[str]]] = None,
+) -> Iterator[ArquivoProcessado]:
+    """
+    Processa todas as escriturações de um arquivo (texto ou compactado).
+
+    Cada fluxo é lido uma única vez: o parser consome as linhas enquanto o
+    hash do conteúdo é calculado e o original é gravado no cache em zstd.
+    As demonstrações (J100/J150) são extraídas na mesma passada. O resultado
+    do parse e as demonstrações também são gravados no cache em Parquet.
+
+    Args:
+        arquivo: Caminho ou objeto binário com seek()
+        nome: Nome original do arquivo
+        guardar_cache: Grava o original e o resultado do parse no cache
+        extras: Registros adicionais a extrair na mesma passada, com as
+            colunas de cada um (ex.: {"I250": ("cod_conta", "valor")})
+
+    Yields:
+        ArquivoProcessado para cada escrituração encontrada
+    """
+
+    extras = extras or {}
+    for nome_fonte, fluxo in abrir_fontes_sped(arquivo, nome):
+        codificacao = detectar_codificacao_fonte(fluxo)
+        leitor = LeitorComCache(fluxo, guardar=guardar_cache)
+
+        try:
+            quadros = compilar_plano("ECD", REGISTROS_ECD + REGISTROS_EXTRAIDOS + tuple(extras)).coletar(
+                iterar_linhas(leitor), criar_decodificador(codificacao), extras
+            )
+            empresa, df_plano, df_saldos, status = montar_resultado(*registros_ecd(quadros))
+            demonstracoes = demonstracoes_dos_quadros(quadros)
+            quadros_extras = {registro: quadros[registro] for registro in extras}
+            del quadros
+            hash_conteudo = leitor.concluir()
+        except Exception:
+            leitor.descartar()
+            raise
+
+        if guardar_cache and "✅" in status:
+            try:
+                gravar_parquet(
+                    hash_conteudo,
+                    empresa.to_dict() if empresa else None,
+                    df_plano,
+                    df_saldos,
+                )
+                gravar_demonstracoes(hash_conteudo, demonstracoes)
+            except OSError:
+                pass  # O cache é opcional: falha de disco não interrompe o processamento
+
+        yield ArquivoProcessado(
+            nome=nome_fonte,
+            hash_conteudo=hash_conteudo,
+            empresa=empresa,
+            df_plano=df_plano,
+            df_saldos=df_saldos,
+            status=status,
+            demonstracoes=demonstracoes,
+            extras=quadros_extras,
+        )
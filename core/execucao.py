@@ -0,0 +1,160 @@
+"""
+Execução com Orçamento de Memória
+Audiper - Sistema de Auditoria Digital
+
+Orçamento de memória único para o processo (AUDIPER_MEMORIA_MB). Antes de
+uma etapa pesada (testes de uma escrituração, consultas de portfólio,
+amostragem), a memória residente do processo, somada às etapas em andamento
+e à estimativa da nova, é comparada com o orçamento:
+
+- dentro do orçamento: execução em memória (comportamento padrão);
+- acima: as consultas rodam no engine streaming do Polars, que processa os
+  dados em blocos; agregações e joins deixam de alocar memória proporcional
+  à entrada. Varreduras Parquet (armazém, cache) são lidas em blocos e o
+  diretório temporário do engine (POLARS_TEMP_DIR) aponta para o diretório
+  de descarga local, criado pelo pacote core antes de o Polars ser
+  importado.
+
+O resultado é o mesmo nos dois modos: as consultas ordenam explicitamente
+suas saídas e as somas monetárias são arredondadas ao centavo.
+"""
+
+import os
+import threading
+import polars as pl
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Dict, Any, Iterator, Optional, Union
+
+from . import DIRETORIO_DESCARGA, diretorio_descarga  # preparados no pacote, antes do Polars
+
+
+# Orçamento de memória do processo (MB); 0 desativa o modo streaming
+LIMITE_MEMORIA_MB = int(os.environ.get("AUDIPER_MEMORIA_MB", "0"))
+
+# Memória de trabalho estimada por byte de entrada (joins, group-bys, cópias)
+FATOR_TRABALHO = 3
+
+# Bytes em memória por byte de Parquet (compressão + decodificação)
+FATOR_PARQUET = 4
+
+MEMORIA = "memoria"
+STREAMING = "streaming"
+
+# Modo da etapa em andamento (as coletas feitas dentro dela o seguem)
+_modo_atual: ContextVar[Optional[str]] = ContextVar("modo_execucao", default=None)
+
+
+def memoria_residente() -> int:
+    """Memória residente (RSS) do processo em bytes; 0 se indisponível"""
+    try:
+        with open("/proc/self/statm") as arquivo:
+            return int(arquivo.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def tamanho_estimado(*frames: Union[pl.DataFrame, pl.LazyFrame, None]) -> int:
+    """Tamanho em memória dos DataFrames (LazyFrames não são materializados: 0)"""
+    return sum(df.estimated_size() for df in frames if isinstance(df, pl.DataFrame))
+
+
+def tamanho_parquet(caminho: Union[str, Path]) -> int:
+    """Estimativa em memória de um arquivo ou diretório Parquet"""
+    caminho = Path(caminho)
+    if caminho.is_file():
+        return caminho.stat().st_size * FATOR_PARQUET
+    if not caminho.is_dir():
+        return 0
+    return sum(p.stat().st_size for p in caminho.rglob("*.parquet")) * FATOR_PARQUET
+
+
+class OrcamentoMemoria:
+    """
+    Orçamento de memória compartilhado pelas etapas do processo.
+
+    Exemplo:
+        with orcamento_memoria().execucao(df_saldos.estimated_size()) as modo:
+            ...  # coletar() dentro do bloco usa o modo escolhido
+    """
+
+    def __init__(self, limite_bytes: Optional[int] = None):
+        self.limite_bytes = LIMITE_MEMORIA_MB * 1024 * 1024 if limite_bytes is None else limite_bytes
+        self._trava = threading.Lock()
+        self._reservado = 0
+        self._metricas = {"execucoes_memoria": 0, "execucoes_streaming": 0}
+
+    def modo(self, estimativa_bytes: int = 0) -> str:
+        """Modo para uma nova etapa com a estimativa de entrada informada"""
+        if self.limite_bytes <= 0:
+            return MEMORIA
+        necessario = memoria_residente() + self._reservado + estimativa_bytes * FATOR_TRABALHO
+        return STREAMING if necessario > self.limite_bytes else MEMORIA
+
+    @contextmanager
+    def execucao(self, estimativa_bytes: int = 0) -> Iterator[str]:
+        """
+        Reserva a estimativa durante o bloco e define o modo das coletas
+        feitas nele. Etapas aninhadas seguem o modo da etapa externa.
+        """
+
+        externo = _modo_atual.get()
+        if externo is not None:
+            yield externo
+            return
+
+        with self._trava:
+            modo = self.modo(estimativa_bytes)
+            reserva = estimativa_bytes * FATOR_TRABALHO
+            self._reservado += reserva
+            self._metricas[f"execucoes_{modo}"] += 1
+
+        token = _modo_atual.set(modo)
+        try:
+            yield modo
+        finally:
+            _modo_atual.reset(token)
+            with self._trava:
+                self._reservado -= reserva
+
+    def metricas(self) -> Dict[str, Any]:
+        """Execuções por modo, reservas e memória residente"""
+        with self._trava:
+            return {
+                **self._metricas,
+                "bytes_reservados": self._reservado,
+                "memoria_residente": memoria_residente(),
+                "limite_bytes": self.limite_bytes,
+            }
+
+
+_orcamento_processo: Optional[OrcamentoMemoria] = None
+_trava_criacao = threading.Lock()
+
+
+def orcamento_memoria() -> OrcamentoMemoria:
+    """Instância única do orçamento no processo"""
+    global _orcamento_processo
+    with _trava_criacao:
+        if _orcamento_processo is None:
+            _orcamento_processo = OrcamentoMemoria()
+        return _orcamento_processo
+
+
+def execucao(estimativa_bytes: int = 0):
+    """Atalho para orcamento_memoria().execucao()"""
+    return orcamento_memoria().execucao(estimativa_bytes)
+
+
+def coletar(lf: pl.LazyFrame, estimativa_bytes: int = 0) -> pl.DataFrame:
+    """
+    collect() no modo da etapa em andamento; fora de uma etapa, o modo é
+    decidido pela estimativa informada.
+    """
+
+    with execucao(estimativa_bytes) as modo:
+        if modo == STREAMING:
+            return lf.collect(engine="streaming")
+        return lf.collect()
+
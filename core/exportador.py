@@ -6,43 +6,95 @@ Gera arquivos Excel formatados com os resultados da auditoria.
 """
 
 import polars as pl
-from typing import List, Dict, Any, Optional
+from typing import List, Optional, Sequence, Union, TYPE_CHECKING
 from io import BytesIO
 from datetime import datetime
 
+from .achados import renderizar_achados, estatisticas_achados, formatar_moeda, tabela_regras
+from .materialidade import Materialidade, principais_achados
+
+if TYPE_CHECKING:
+    from .amostragem import Amostra
+    from .portfolio import ResultadoPortfolio
+
+
+# Caracteres não aceitos em nomes de aba do Excel (limite de 31 caracteres)
+CARACTERES_INVALIDOS_ABA = str.maketrans({c: " " for c in "[]:*?/\\"})
+
+# Linhas de dados por aba (limite do Excel menos o cabeçalho); acima disso,
+# seguem os achados mais materiais
+LIMITE_LINHAS_EXCEL = 1_048_575
+
+
+def _colunas_materialidade(achados: pl.DataFrame) -> list:
+    """Colunas de materialidade (apenas para achados pontuados com materialidade)"""
+    if "materialidade" not in achados.columns:
+        return []
+    return [pl.col("materialidade").alias("Materialidade"), pl.col("pontuacao").alias("Pontuação")]
+
+
+def _colunas_contexto(achados: pl.DataFrame) -> list:
+    """Período e centro de custo (apenas para testes que os informam)"""
+    colunas = []
+    if "periodo_fim" in achados.columns:
+        colunas.append(pl.col("periodo_fim").alias("Período"))
+    if "centro_custo" in achados.columns:
+        colunas.append(pl.col("centro_custo").alias("Centro de Custo"))
+    return colunas
+
+
+def _testes_com_achados(achados: pl.DataFrame) -> List[str]:
+    """Testes que geraram achados, na ordem da primeira ocorrência"""
+    if achados.is_empty():
+        return []
+    return (
+        achados.select(pl.col("regra_id").cast(pl.String))
+        .unique(maintain_order=True)
+        .join(tabela_regras().select("regra_id", "teste"), on="regra_id", how="left", maintain_order="left")
+        .get_column("teste")
+        .drop_nulls()
+        .unique(maintain_order=True)
+        .to_list()
+    )
+
 
 def exportar_achados_excel(
-    achados: List[Dict[str, Any]],
+    achados: pl.DataFrame,
     empresa_nome: str = "N/A",
-    teste_nome: str = "Saldos Invertidos"
+    teste_nome: str = "Saldos Invertidos",
+    materialidade: Optional[Materialidade] = None,
 ) -> BytesIO:
     """
-    Exporta lista de achados para Excel formatado.
+    Exporta lista de achados para Excel formatado, dos mais materiais aos
+    menos materiais.
     
     Args:
-        achados: Lista de dicionários com os achados
+        achados: DataFrame de achados (modelo de core.achados)
         empresa_nome: Nome da empresa auditada
         teste_nome: Nome do teste realizado
+        materialidade: Materialidade da escrituração (core.materialidade)
         
     Returns:
         BytesIO com o arquivo Excel
     """
     
     # Criar DataFrame para exportação
-    if not achados:
+    if achados.is_empty():
         df_export = pl.DataFrame({
             "Mensagem": ["Nenhum achado encontrado neste teste."]
         })
     else:
         # Selecionar e renomear colunas para o relatório
-        df_export = pl.DataFrame(achados).select([
+        achados = principais_achados(achados, materialidade, n=LIMITE_LINHAS_EXCEL)
+        df_export = renderizar_achados(achados).select([
             pl.col("cod_conta").alias("Código da Conta"),
             pl.col("descricao").alias("Descrição"),
             pl.col("natureza").alias("Natureza"),
             pl.col("saldo_esperado").alias("Saldo Esperado"),
             pl.col("saldo_encontrado").alias("Saldo Encontrado"),
             pl.col("valor").alias("Valor (R$)"),
-            pl.col("severidade").alias("Severidade"),
+            *_colunas_materialidade(achados),
+            pl.col("severidade").cast(pl.String).alias("Severidade"),
             pl.col("achado").alias("Achado"),
             pl.col("recomendacao").alias("Recomendação"),
         ])
@@ -60,31 +112,42 @@ def exportar_achados_excel(
 
 
 def exportar_relatorio_completo(
-    achados: List[Dict[str, Any]],
-    df_saldos: pl.DataFrame,
+    achados: pl.DataFrame,
+    df_saldos: Union[pl.DataFrame, pl.LazyFrame],
     empresa_nome: str = "N/A",
-    periodo: str = "N/A"
+    periodo: str = "N/A",
+    materialidade: Optional[Materialidade] = None,
+    testes: Optional[Sequence[str]] = None,
 ) -> BytesIO:
     """
     Exporta relatório completo com múltiplas abas:
     - Resumo
-    - Achados
+    - Materialidade (se informada)
+    - Achados (dos mais materiais aos menos materiais)
     - Balancete Completo
     
     Args:
-        achados: Lista de achados encontrados
-        df_saldos: DataFrame com todos os saldos
+        achados: DataFrame de achados (modelo de core.achados)
+        df_saldos: DataFrame (ou LazyFrame) com todos os saldos
         empresa_nome: Nome da empresa
         periodo: Período de referência
+        materialidade: Materialidade da escrituração (core.materialidade)
+        testes: Testes executados; se None, os que geraram achados
         
     Returns:
         BytesIO com arquivo Excel
     """
     
     buffer = BytesIO()
+    stats = estatisticas_achados(achados)
+    testes = list(testes) if testes is not None else _testes_com_achados(achados)
+    achados = principais_achados(achados, materialidade, n=LIMITE_LINHAS_EXCEL)
+    
+    # xlsxwriter é importado só ao gerar o relatório
+    import xlsxwriter
     
-    # Usar xlsxwriter via polars para múltiplas abas
-    with pl.ExcelWriter(buffer, engine="xlsxwriter") as writer:
+    # Usar um Workbook do xlsxwriter compartilhado entre as abas
+    with xlsxwriter.Workbook(buffer, {"in_memory": True}) as writer:
         
         # Aba 1: Resumo
         resumo_data = {
@@ -92,7 +155,7 @@ def exportar_relatorio_completo(
                 "Empresa",
                 "Período",
                 "Data da Auditoria",
-                "Teste Realizado",
+                "Testes Realizados",
                 "Total de Achados",
                 "Críticos",
                 "Atenção",
@@ -102,30 +165,50 @@ def exportar_relatorio_completo(
                 empresa_nome,
                 periodo,
                 datetime.now().strftime("%d/%m/%Y %H:%M"),
-                "Saldos Invertidos",
-                str(len(achados)),
-                str(len([a for a in achados if a.get("severidade") == "CRÍTICO"])),
-                str(len([a for a in achados if a.get("severidade") == "ATENÇÃO"])),
-                str(len([a for a in achados if a.get("severidade") == "INFO"])),
+                ", ".join(testes) or "N/A",
+                str(stats["total"]),
+                str(stats["criticos"]),
+                str(stats["atencao"]),
+                str(stats["info"]),
             ]
         }
+        if materialidade is not None:
+            resumo_data["Campo"] += ["Materialidade Global", "Achados Materiais"]
+            resumo_data["Valor"] += [
+                f"{formatar_moeda(materialidade.geral)} ({materialidade.percentual * 100:g}% de {materialidade.base})",
+                str(achados.get_column("material").sum()) if "material" in achados.columns else "0",
+            ]
         df_resumo = pl.DataFrame(resumo_data)
         df_resumo.write_excel(
-            writer,
+            workbook=writer,
             worksheet="Resumo",
             autofit=True,
         )
         
+        if materialidade is not None:
+            materialidade.tabela().select([
+                pl.col("natureza").alias("Natureza"),
+                pl.col("materialidade").alias("Materialidade"),
+            ]).write_excel(
+                workbook=writer,
+                worksheet="Materialidade",
+                autofit=True,
+            )
+        
         # Aba 2: Achados
-        if achados:
-            df_achados = pl.DataFrame(achados).select([
+        if not achados.is_empty():
+            df_achados = renderizar_achados(achados).select([
+                pl.col("teste").alias("Teste"),
+                pl.col("regra_id").alias("Regra"),
                 pl.col("cod_conta").alias("Conta"),
                 pl.col("descricao").alias("Descrição"),
                 pl.col("natureza").alias("Natureza"),
+                *_colunas_contexto(achados),
                 pl.col("saldo_esperado").alias("Esperado"),
                 pl.col("saldo_encontrado").alias("Encontrado"),
                 pl.col("valor").alias("Valor"),
-                pl.col("severidade").alias("Severidade"),
+                *_colunas_materialidade(achados),
+                pl.col("severidade").cast(pl.String).alias("Severidade"),
                 pl.col("achado").alias("Achado"),
                 pl.col("recomendacao").alias("Recomendação"),
             ])
@@ -133,14 +216,15 @@ def exportar_relatorio_completo(
             df_achados = pl.DataFrame({"Resultado": ["Nenhum achado encontrado"]})
         
         df_achados.write_excel(
-            writer,
+            workbook=writer,
             worksheet="Achados",
             autofit=True,
         )
         
         # Aba 3: Balancete (se disponível)
-        if not df_saldos.is_empty():
-            df_balancete = df_saldos.select([
+        # Seleção feita em modo lazy: só as colunas exportadas são lidas
+        if df_saldos.collect_schema().names():
+            df_balancete = df_saldos.lazy().select([
                 pl.col("cod_conta").alias("Conta"),
                 pl.col("descricao").alias("Descrição"),
                 pl.col("natureza").alias("Natureza"),
@@ -149,13 +233,156 @@ def exportar_relatorio_completo(
                 pl.col("valor_credito").alias("Créditos"),
                 pl.col("saldo_final").alias("Saldo Final"),
                 pl.col("ind_saldo_fin").alias("D/C"),
-            ])
+            ]).collect()
             
             df_balancete.write_excel(
-                writer,
+                workbook=writer,
                 worksheet="Balancete",
                 autofit=True,
             )
     
     buffer.seek(0)
     return buffer
+
+
+def exportar_amostra_excel(
+    amostra: "Amostra",
+    empresa_nome: str = "N/A",
+) -> BytesIO:
+    """
+    Exporta uma amostra de lançamentos (core.amostragem) com as abas:
+    - Parâmetros (método, semente, intervalo... para reproduzir a seleção)
+    - Resumo por estrato
+    - Amostra (partidas selecionadas e metadados da seleção)
+    
+    Args:
+        amostra: Resultado de amostra_mus, amostra_estratificada ou maiores_por_conta
+        empresa_nome: Nome da empresa
+        
+    Returns:
+        BytesIO com arquivo Excel
+    """
+    
+    buffer = BytesIO()
+    
+    # xlsxwriter é importado só ao gerar o relatório
+    import xlsxwriter
+    
+    parametros = {"empresa": empresa_nome, "data_selecao": datetime.now().strftime("%d/%m/%Y %H:%M")}
+    parametros.update(amostra.parametros)
+    df_parametros = pl.DataFrame({
+        "Parâmetro": list(parametros),
+        "Valor": ["" if v is None else str(v) for v in parametros.values()],
+    })
+    
+    with xlsxwriter.Workbook(buffer, {"in_memory": True}) as writer:
+        df_parametros.write_excel(workbook=writer, worksheet="Parâmetros", autofit=True)
+        amostra.resumo.write_excel(workbook=writer, worksheet="Resumo", autofit=True)
+        
+        if amostra.itens.is_empty():
+            df_itens = pl.DataFrame({"Resultado": ["Nenhuma partida selecionada"]})
+        else:
+            df_itens = amostra.itens
+        df_itens.write_excel(workbook=writer, worksheet="Amostra", autofit=True)
+    
+    buffer.seek(0)
+    return buffer
+
+
+def _nome_aba(nome: str, usados: set) -> str:
+    """Nome de aba válido e único"""
+    base = nome.translate(CARACTERES_INVALIDOS_ABA).strip()[:31] or "Empresa"
+    candidato, sufixo = base, 2
+    while candidato.lower() in usados:
+        candidato = f"{base[:31 - len(str(sufixo)) - 1]}~{sufixo}"
+        sufixo += 1
+    usados.add(candidato.lower())
+    return candidato
+
+
+def exportar_portfolio_excel(resultado: "ResultadoPortfolio") -> BytesIO:
+    """
+    Exporta a auditoria de um portfólio (core.portfolio) com as abas:
+    - Resumo (totais por empresa e do grupo)
+    - Intercompany (pares de empresas e diferença entre os lados)
+    - Uma aba de achados por empresa (maiores valores, ponderados pela
+      severidade, primeiro)
+    
+    Args:
+        resultado: Resultado de auditar_portfolio
+        
+    Returns:
+        BytesIO com arquivo Excel
+    """
+    
+    buffer = BytesIO()
+    
+    # xlsxwriter é importado só ao gerar o relatório
+    import xlsxwriter
+    
+    totais = resultado.totais()
+    colunas_soma = ["contas", "saldos", "achados", "criticos", "atencao", "info", "valor_achados"]
+    df_resumo = pl.concat([
+        totais,
+        totais.select(
+            pl.lit("").alias("cnpj"),
+            pl.lit("TOTAL DO GRUPO").alias("empresa"),
+            *[pl.col(c).sum() for c in colunas_soma],
+        ),
+    ], how="diagonal_relaxed").select([
+        pl.col("cnpj").alias("CNPJ"),
+        pl.col("empresa").alias("Empresa"),
+        pl.col("arquivo").alias("Arquivo"),
+        pl.col("periodo").alias("Período"),
+        pl.col("status").alias("Situação"),
+        pl.col("contas").alias("Contas"),
+        pl.col("saldos").alias("Saldos"),
+        pl.col("achados").alias("Achados"),
+        pl.col("criticos").alias("Críticos"),
+        pl.col("atencao").alias("Atenção"),
+        pl.col("info").alias("Informativos"),
+        pl.col("valor_achados").alias("Valor dos Achados"),
+    ])
+    
+    intercompany = resultado.intercompany()
+    if intercompany.is_empty():
+        df_intercompany = pl.DataFrame({"Resultado": ["Nenhum movimento entre empresas do portfólio"]})
+    else:
+        df_intercompany = intercompany.select([
+            pl.col("cnpj").alias("CNPJ"),
+            pl.col("empresa").alias("Empresa"),
+            pl.col("cnpj_contraparte").alias("CNPJ Contraparte"),
+            pl.col("empresa_contraparte").alias("Contraparte"),
+            pl.col("valor").alias("Movimento (D+/C-)"),
+            pl.col("valor_contraparte").alias("Movimento Contraparte"),
+            pl.col("diferenca").alias("Diferença"),
+            pl.when(pl.col("conciliado")).then(pl.lit("Sim")).otherwise(pl.lit("Não")).alias("Conciliado"),
+        ])
+    
+    with xlsxwriter.Workbook(buffer, {"in_memory": True}) as writer:
+        df_resumo.write_excel(workbook=writer, worksheet="Resumo", autofit=True)
+        df_intercompany.write_excel(workbook=writer, worksheet="Intercompany", autofit=True)
+        
+        usados = {"resumo", "intercompany"}
+        for empresa in resultado.processadas:
+            if empresa.achados.is_empty():
+                df_achados = pl.DataFrame({"Resultado": ["Nenhum achado encontrado"]})
+            else:
+                achados = principais_achados(empresa.achados, n=LIMITE_LINHAS_EXCEL)
+                df_achados = renderizar_achados(achados).select([
+                    pl.col("regra_id").alias("Regra"),
+                    pl.col("cod_conta").alias("Conta"),
+                    pl.col("descricao").alias("Descrição"),
+                    pl.col("natureza").alias("Natureza"),
+                    pl.col("valor").alias("Valor"),
+                    pl.col("severidade").cast(pl.String).alias("Severidade"),
+                    pl.col("teste").alias("Teste"),
+                    pl.col("achado").alias("Achado"),
+                    pl.col("recomendacao").alias("Recomendação"),
+                ])
+            
+            nome = f"{empresa.cnpj} {empresa.empresa.nome if empresa.empresa else empresa.nome}"
+            df_achados.write_excel(workbook=writer, worksheet=_nome_aba(nome, usados), autofit=True)
+    
+    buffer.seek(0)
+    return buffer
@@ -0,0 +1,283 @@
+"""
+Índice de Blocos do SPED ECD
+Audiper - Sistema de Auditoria Digital
+
+Os registros do ECD vêm agrupados em blocos (0000, I050 e filhos, cada I150
+com seus I155, I200 com seus I250, J...). Uma única passada pelo arquivo
+registra as faixas de bytes [início, fim) de cada grupo de registros e de
+cada período I150 (e, opcionalmente, de cada lançamento I200).
+
+Com o índice persistido no cache, operações como "carregar só o plano" ou
+"carregar só os saldos de dezembro" posicionam a leitura direto nas faixas
+relevantes e pulam o diário (I200/I250), que é a maior parte do arquivo.
+
+O índice é gravado pelo hash do conteúdo; para reencontrá-lo sem reler o
+arquivo, uma assinatura (caminho, tamanho, mtime_ns) aponta para esse hash.
+O hash completo só é calculado quando a assinatura é nova.
+"""
+
+import os
+import json
+import mmap
+import polars as pl
+from dataclasses import dataclass, field, asdict
+from datetime import date
+from pathlib import Path
+from typing import Dict, List, Tuple, Optional, Iterable, Iterator, Union, Any
+
+from .leitor_sped import (
+    DadosEmpresa,
+    coletar_registros,
+    montar_resultado,
+    criar_decodificador,
+    detectar_codificacao,
+)
+from .cache import diretorio_cache, hash_arquivo, novo_hash
+
+
+# Registros filhos são indexados junto com o registro pai
+REGISTRO_PAI = {
+    "I051": "I050",
+    "I052": "I050",
+    "I053": "I050",
+    "I155": "I150",
+    "I157": "I150",
+    "I250": "I200",
+    "I310": "I300",
+    "I355": "I350",
+}
+
+_REGISTRO_PAI_BYTES = {filho.encode(): pai.encode() for filho, pai in REGISTRO_PAI.items()}
+
+Faixa = Tuple[int, int]
+
+
+@dataclass
+class IndiceSped:
+    """Faixas de bytes por grupo de registros e por período"""
+    tamanho: int
+    codificacao: str
+    blocos: Dict[str, List[Faixa]] = field(default_factory=dict)
+    periodos: List[Dict[str, Any]] = field(default_factory=list)
+    lancamentos: Optional[List[Faixa]] = None
+
+    def faixas(self, registro: str) -> List[Faixa]:
+        return self.blocos.get(REGISTRO_PAI.get(registro, registro), [])
+
+    def faixas_periodos(self, periodos_fim: Iterable[Union[str, date]]) -> List[Faixa]:
+        """Faixas dos blocos I150 cujos períodos terminam nas datas informadas"""
+        alvos = {_data_sped(p) for p in periodos_fim}
+        return [tuple(p["faixa"]) for p in self.periodos if p["fim"] in alvos]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+def _data_sped(valor: Union[str, date]) -> str:
+    """date(2024, 12, 31) -> 31122024 (formato do SPED)"""
+    if isinstance(valor, date):
+        return valor.strftime("%d%m%Y")
+    return valor.replace("/", "")
+
+
+def construir_indice(mapa: Any, incluir_lancamentos: bool = False) -> IndiceSped:
+    """
+    Percorre o arquivo uma vez e registra as faixas de bytes dos blocos.
+
+    Args:
+        mapa: mmap do arquivo SPED em texto
+        incluir_lancamentos: Também registra a faixa de cada I200 (com seus I250)
+
+    Returns:
+        IndiceSped
+    """
+
+    blocos: Dict[bytes, List[List[int]]] = {}
+    periodos: List[Dict[str, Any]] = []
+    lancamentos: List[List[int]] = []
+
+    grupo_atual = None
+    posicao = 0
+    mapa.seek(0)
+
+    for linha in iter(mapa.readline, b""):
+        inicio = posicao
+        posicao += len(linha)
+
+        if not linha.startswith(b"|"):
+            continue
+
+        registro = linha[1:5]
+        grupo = _REGISTRO_PAI_BYTES.get(registro, registro)
+
+        # Linhas consecutivas do mesmo grupo estendem a faixa atual
+        if grupo == grupo_atual:
+            blocos[grupo][-1][1] = posicao
+        else:
+            blocos.setdefault(grupo, []).append([inicio, posicao])
+            grupo_atual = grupo
+
+        if registro == b"I150":
+            campos = linha.strip().split(b"|")
+            periodos.append({
+                "inicio": campos[2].decode("ascii", errors="replace") if len(campos) > 2 else "",
+                "fim": campos[3].decode("ascii", errors="replace") if len(campos) > 3 else "",
+                "faixa": [inicio, posicao],
+            })
+        elif registro in (b"I155", b"I157") and periodos:
+            periodos[-1]["faixa"][1] = posicao
+        elif incluir_lancamentos and registro == b"I200":
+            lancamentos.append([inicio, posicao])
+        elif incluir_lancamentos and registro == b"I250" and lancamentos:
+            lancamentos[-1][1] = posicao
+
+    return IndiceSped(
+        tamanho=posicao,
+        codificacao=detectar_codificacao(mapa),
+        blocos={g.decode("ascii", errors="replace"): [tuple(f) for f in faixas] for g, faixas in blocos.items()},
+        periodos=periodos,
+        lancamentos=[tuple(f) for f in lancamentos] if incluir_lancamentos else None,
+    )
+
+
+# ============================================
+# PERSISTÊNCIA
+# ============================================
+
+def caminho_indice(hash_conteudo: str) -> Path:
+    """Índice gravado ao lado do cache do conteúdo"""
+    return diretorio_cache() / "indices" / f"{hash_conteudo}.json"
+
+
+def salvar_indice(indice: IndiceSped, hash_conteudo: str) -> Path:
+    destino = caminho_indice(hash_conteudo)
+    destino.parent.mkdir(parents=True, exist_ok=True)
+    temporario = destino.with_suffix(".json.tmp")
+    with open(temporario, "w", encoding="utf-8") as arquivo:
+        json.dump(indice.to_dict(), arquivo)
+    temporario.replace(destino)
+    return destino
+
+
+def carregar_indice(hash_conteudo: str) -> Optional[IndiceSped]:
+    caminho = caminho_indice(hash_conteudo)
+    if not caminho.exists():
+        return None
+
+    with open(caminho, encoding="utf-8") as arquivo:
+        dados = json.load(arquivo)
+
+    return IndiceSped(
+        tamanho=dados["tamanho"],
+        codificacao=dados["codificacao"],
+        blocos={g: [tuple(f) for f in faixas] for g, faixas in dados["blocos"].items()},
+        periodos=dados["periodos"],
+        lancamentos=[tuple(f) for f in dados["lancamentos"]] if dados.get("lancamentos") is not None else None,
+    )
+
+
+def _caminho_assinatura(caminho: str) -> Tuple[Path, int]:
+    """Arquivo que guarda o hash do conteúdo para (caminho, tamanho, mtime_ns)"""
+    estado = os.stat(caminho)
+    hasher = novo_hash()
+    hasher.update(f"{os.path.realpath(caminho)}|{estado.st_size}|{estado.st_mtime_ns}".encode("utf-8"))
+    return diretorio_cache() / "indices" / "assinaturas" / hasher.hexdigest(), estado.st_size
+
+
+def obter_indice(caminho: str, incluir_lancamentos: bool = False) -> IndiceSped:
+    """
+    Carrega o índice do cache ou constrói (e persiste) em uma passada.
+
+    Com o índice já gravado para o mesmo caminho, tamanho e mtime, nada do
+    arquivo é lido; o hash completo do conteúdo só é calculado na primeira vez.
+    """
+
+    def valido(indice: Optional[IndiceSped]) -> bool:
+        return (
+            indice is not None
+            and indice.tamanho == tamanho
+            and (indice.lancamentos is not None or not incluir_lancamentos)
+        )
+
+    assinatura, tamanho = _caminho_assinatura(caminho)
+    if assinatura.exists():
+        hash_conteudo = assinatura.read_text(encoding="ascii").strip()
+    else:
+        hash_conteudo = hash_arquivo(caminho)
+
+    indice = carregar_indice(hash_conteudo)
+    if valido(indice) and assinatura.exists():
+        return indice
+
+    if not valido(indice):
+        with open(caminho, "rb") as arquivo, mmap.mmap(arquivo.fileno(), 0, access=mmap.ACCESS_READ) as mapa:
+            indice = construir_indice(mapa, incluir_lancamentos)
+        salvar_indice(indice, hash_conteudo)
+
+    assinatura.parent.mkdir(parents=True, exist_ok=True)
+    assinatura.write_text(hash_conteudo, encoding="ascii")
+    return indice
+
+
+# ============================================
+# LEITURA SELETIVA
+# ============================================
+
+def ler_faixas(mapa: Any, faixas: Iterable[Faixa]) -> Iterator[bytes]:
+    """Gera as linhas contidas nas faixas, posicionando a leitura em cada uma"""
+    for inicio, fim in sorted(faixas):
+        mapa.seek(inicio)
+        while mapa.tell() < fim:
+            linha = mapa.readline()
+            if not linha:
+                break
+            yield linha
+
+
+def processar_sped_seletivo(
+    caminho: str,
+    registros: Iterable[str] = ("0000", "I050", "I150"),
+    periodos_fim: Optional[Iterable[Union[str, date]]] = None,
+    indice: Optional[IndiceSped] = None,
+) -> Tuple[Optional[DadosEmpresa], pl.DataFrame, pl.DataFrame, str]:
+    """
+    Processa apenas os blocos pedidos, lendo direto das faixas do índice.
+
+    Args:
+        caminho: Arquivo SPED em texto (não compactado)
+        registros: Grupos de registros a carregar
+        periodos_fim: Restringe os blocos I150 aos períodos com essas datas finais
+        indice: Índice já carregado (se None, é obtido do cache ou construído)
+
+    Returns:
+        Mesma tupla de processar_sped_ecd
+    """
+
+    indice = indice or obter_indice(caminho)
+    registros = list(registros)
+
+    faixas: List[Faixa] = []
+    for registro in registros:
+        if registro == "I150" and periodos_fim is not None:
+            faixas.extend(indice.faixas_periodos(periodos_fim))
+        else:
+            faixas.extend(indice.faixas(registro))
+
+    with open(caminho, "rb") as arquivo, mmap.mmap(arquivo.fileno(), 0, access=mmap.ACCESS_READ) as mapa:
+        coletados = coletar_registros(ler_faixas(mapa, faixas), criar_decodificador(indice.codificacao))
+
+    return montar_resultado(*coletados)
+
+
+def carregar_plano(caminho: str) -> Tuple[Optional[DadosEmpresa], pl.DataFrame]:
+    """Carrega apenas empresa (0000) e plano de contas (I050)"""
+    empresa, df_plano, _, _ = processar_sped_seletivo(caminho, registros=("0000", "I050"))
+    return empresa, df_plano
+
+
+def carregar_saldos_periodo(
+    caminho: str,
+    periodo_fim: Union[str, date],
+) -> Tuple[Optional[DadosEmpresa], pl.DataFrame, pl.DataFrame, str]:
+    """Carrega plano e os saldos de um único período (ex.: dezembro)"""
+    return processar_sped_seletivo(caminho, periodos_fim=[periodo_fim])
@@ -0,0 +1,645 @@
+"""
+Leiautes Declarativos dos Registros SPED
+Audiper - Sistema de Auditoria Digital
+
+Cada registro é descrito por uma tabela de campos (nome, posição no manual,
+tipo, casas decimais, formato de data) e pela faixa de versões do leiaute em
+que vale. Estão descritas as famílias ECD, ECF e EFD-Contribuições.
+
+Um conjunto de registros é compilado uma única vez (compilar_plano) em:
+- uma tabela de prefixos de linha (b"|I155|"), a única consulta feita por
+  linha no lugar de uma cadeia de if/elif;
+- expressões Polars por registro e variante de leiaute, aplicadas de forma
+  vetorizada sobre as linhas separadas depois da passada.
+
+As linhas separadas são decodificadas em lotes (LOTE_LINHAS): os bytes de
+um lote são liberados assim que viram uma coluna do Polars, de modo que só
+um lote existe ao mesmo tempo como objetos Python.
+
+Registros filhos (I155, I052, J100...) herdam campos do último registro pai
+(I150, I050, J005...) por um join_asof na ordem das linhas. Incluir um
+registro é acrescentar uma entrada na tabela, sem custo por linha para os
+demais.
+"""
+
+import polars as pl
+from dataclasses import dataclass
+from functools import lru_cache
+from itertools import islice
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+
+# Tipos de campo
+TEXTO = "texto"
+NUMERO = "numero"
+DATA = "data"
+INTEIRO = "inteiro"
+
+# Espaços removidos das bordas da linha e de cada campo (mesmo conjunto de bytes.strip)
+ESPACOS = " \t\r\n\x0b\x0c"
+
+_TIPOS_POLARS = {
+    TEXTO: pl.String,
+    NUMERO: pl.Float64,
+    DATA: pl.Date,
+    INTEIRO: pl.Int64,
+}
+
+
+@dataclass(frozen=True)
+class Campo:
+    """Campo de um registro; a posição segue a numeração do manual (01 = REG)"""
+    nome: str
+    posicao: int
+    tipo: str = TEXTO
+    decimais: Optional[int] = None
+    formato_data: str = "%d%m%Y"
+    # Tradução de códigos (ex.: IND_VL "R" -> "C"); códigos fora dela saem nulos
+    traducao: Optional[Tuple[Tuple[str, str], ...]] = None
+
+    @property
+    def tipo_polars(self) -> pl.DataType:
+        return _TIPOS_POLARS[self.tipo]
+
+    def expressao(self, campos: pl.Expr) -> pl.Expr:
+        """Extrai e converte o campo da lista de campos da linha"""
+
+        valor = campos.list.get(self.posicao, null_on_oob=True).str.strip_chars(ESPACOS)
+
+        if self.tipo == NUMERO:
+            # 1.234,56 -> 1234.56; vazio ou inválido -> 0.0
+            valor = (
+                valor.str.replace_all(".", "", literal=True)
+                .str.replace_all(",", ".", literal=True)
+                .cast(pl.Float64, strict=False)
+                .fill_null(0.0)
+            )
+            if self.decimais is not None:
+                valor = valor.round(self.decimais)
+        elif self.tipo == DATA:
+            valor = valor.str.to_date(self.formato_data, strict=False)
+        elif self.tipo == INTEIRO:
+            valor = valor.cast(pl.Int64, strict=False)
+
+        if self.traducao is not None:
+            valor = valor.replace_strict(dict(self.traducao), default=None, return_dtype=self.tipo_polars)
+
+        return valor.alias(self.nome)
+
+
+@dataclass(frozen=True)
+class LayoutRegistro:
+    """
+    Leiaute de um registro em uma faixa de versões.
+
+    Args:
+        registro: Código do registro (ex.: "I155")
+        campos: Campos extraídos
+        pai: Registro cujo contexto é herdado (ex.: I150 para o I155)
+        herdados: Campos do pai repetidos em cada linha do filho
+        versao_minima / versao_maxima: Versões do leiaute em que vale
+            (None = sem limite)
+        posicao_minima: Último campo obrigatório; linhas mais curtas são
+            descartadas (padrão: o último campo do leiaute)
+    """
+    registro: str
+    campos: Tuple[Campo, ...]
+    pai: Optional[str] = None
+    herdados: Tuple[str, ...] = ()
+    versao_minima: Optional[str] = None
+    versao_maxima: Optional[str] = None
+    posicao_minima: Optional[int] = None
+
+    @property
+    def minimo_campos(self) -> int:
+        """Quantidade mínima de partes da linha dividida por "|" (inclui a vazia inicial)"""
+        ultima = self.posicao_minima or max(c.posicao for c in self.campos)
+        return ultima + 1
+
+    def vale_para(self, versao: Optional[float]) -> bool:
+        """Versão desconhecida usa o leiaute vigente (sem versão máxima)"""
+        if versao is None:
+            return self.versao_maxima is None
+        if self.versao_minima is not None and versao < float(self.versao_minima):
+            return False
+        return self.versao_maxima is None or versao <= float(self.versao_maxima)
+
+
+@dataclass(frozen=True)
+class LayoutSped:
+    """Leiautes dos registros de uma família SPED"""
+    familia: str
+    registros: Tuple[LayoutRegistro, ...]
+    versao: Optional[Tuple[str, str]] = None    # (registro, campo) com a versão do leiaute
+
+    def variantes(self, registro: str) -> List[LayoutRegistro]:
+        variantes = [r for r in self.registros if r.registro == registro]
+        if not variantes:
+            raise KeyError(f"Registro {registro} não descrito no leiaute {self.familia}")
+        return variantes
+
+    def esquema(self, registro: str) -> Dict[str, pl.DataType]:
+        """Colunas do registro: campos de todas as variantes e os herdados do pai"""
+
+        esquema: Dict[str, pl.DataType] = {}
+        variantes = self.variantes(registro)
+        for variante in variantes:
+            for campo in variante.campos:
+                esquema.setdefault(campo.nome, campo.tipo_polars)
+
+        principal = variantes[0]
+        if principal.pai is not None:
+            esquema_pai = self.esquema(principal.pai)
+            for nome in principal.herdados:
+                esquema[nome] = esquema_pai[nome]
+
+        return esquema
+
+
+# ============================================
+# ECD - Escrituração Contábil Digital
+# ============================================
+
+# IND_VL da DRE nos leiautes 1 a 6 -> natureza D/C do saldo: R (receita) e
+# P (subtotal positivo) credores; D (despesa) e N (subtotal negativo) devedores
+IND_VL_DC = (("R", "C"), ("P", "C"), ("D", "D"), ("N", "D"))
+
+LAYOUT_ECD = LayoutSped(
+    familia="ECD",
+    versao=("I010", "versao_leiaute"),
+    registros=(
+        # |0000|LECD|DT_INI|DT_FIN|NOME|CNPJ|UF|... (datas como informadas, para DadosEmpresa)
+        LayoutRegistro("0000", (
+            Campo("nome_escrituracao", 2),
+            Campo("data_inicio", 3),
+            Campo("data_fim", 4),
+            Campo("nome", 5),
+            Campo("cnpj", 6),
+            Campo("uf", 7),
+        )),
+        # |0150|COD_PART|NOME|COD_PAIS|CNPJ|CPF|NIT|UF|IE|IE_ST|COD_MUN|IM|SUFRAMA|
+        LayoutRegistro("0150", (
+            Campo("cod_participante", 2),
+            Campo("nome", 3),
+            Campo("cnpj", 5),
+            Campo("cpf", 6),
+            Campo("uf", 8),
+        )),
+        # |I010|IND_ESC|COD_VER_LC|
+        LayoutRegistro("I010", (
+            Campo("ind_escrituracao", 2),
+            Campo("versao_leiaute", 3),
+        )),
+        # |I050|DT_ALT|COD_NAT|IND_CTA|NIVEL|COD_CTA|COD_CTA_SUP|CTA|
+        LayoutRegistro("I050", (
+            Campo("cod_natureza", 3),
+            Campo("tipo_conta", 4),         # S=Sintética, A=Analítica
+            Campo("nivel", 5),
+            Campo("cod_conta", 6),
+            Campo("conta_superior", 7),
+            Campo("descricao", 8),
+        )),
+        # |I052|COD_CCUS|COD_AGL|
+        LayoutRegistro("I052", (
+            Campo("centro_custo", 2),
+            Campo("cod_agl", 3),
+        ), pai="I050", herdados=("cod_conta",)),
+        # |I150|DT_INI|DT_FIN|
+        LayoutRegistro("I150", (
+            Campo("periodo_inicio", 2, DATA),
+            Campo("periodo_fim", 3, DATA),
+        )),
+        # |I155|COD_CTA|COD_CCUS|VL_SLD_INI|IND_DC_INI|VL_DEB|VL_CRED|VL_SLD_FIN|IND_DC_FIN|
+        LayoutRegistro("I155", (
+            Campo("cod_conta", 2),
+            Campo("centro_custo", 3),
+            Campo("saldo_inicial", 4, NUMERO, 2),
+            Campo("ind_saldo_ini", 5),
+            Campo("valor_debito", 6, NUMERO, 2),
+            Campo("valor_credito", 7, NUMERO, 2),
+            Campo("saldo_final", 8, NUMERO, 2),
+            Campo("ind_saldo_fin", 9),
+        ), pai="I150", herdados=("periodo_inicio", "periodo_fim")),
+        # |I200|NUM_LCTO|DT_LCTO|VL_LCTO|IND_LCTO|
+        LayoutRegistro("I200", (
+            Campo("num_lancamento", 2),
+            Campo("data_lancamento", 3, DATA),
+            Campo("valor_lancamento", 4, NUMERO, 2),
+            Campo("ind_lancamento", 5),     # N=Normal, E=Encerramento, X=Extemporâneo
+        )),
+        # |I250|COD_CTA|COD_CCUS|VL_DC|IND_DC|NUM_ARQ|COD_HIST_PAD|HIST|COD_PART|
+        LayoutRegistro("I250", (
+            Campo("cod_conta", 2),
+            Campo("centro_custo", 3),
+            Campo("valor", 4, NUMERO, 2),
+            Campo("ind_dc", 5),
+            Campo("num_arquivo", 6),
+            Campo("cod_historico", 7),
+            Campo("historico", 8),
+            Campo("cod_participante", 9),
+        ), pai="I200", herdados=("num_lancamento", "data_lancamento", "ind_lancamento"), posicao_minima=5),
+        # |I350|DT_RES|
+        LayoutRegistro("I350", (
+            Campo("data_resultado", 2, DATA),
+        )),
+        # |I355|COD_CTA|COD_CCUS|VL_CTA|IND_DC|
+        LayoutRegistro("I355", (
+            Campo("cod_conta", 2),
+            Campo("centro_custo", 3),
+            Campo("valor", 4, NUMERO, 2),
+            Campo("ind_dc", 5),
+        ), pai="I350", herdados=("data_resultado",)),
+        # |J005|DT_INI|DT_FIN|ID_DEM|CAB_DEM|
+        LayoutRegistro("J005", (
+            Campo("periodo_inicio", 2, DATA),
+            Campo("periodo_fim", 3, DATA),
+            Campo("id_demonstracao", 4),
+            Campo("cabecalho", 5),
+        ), posicao_minima=3),
+        # |J100|COD_AGL|IND_COD_AGL|NIVEL_AGL|COD_AGL_SUP|IND_GRP_BAL|DESCR_COD_AGL|
+        #  VL_CTA_INI|IND_DC_CTA_INI|VL_CTA_FIN|IND_DC_CTA_FIN|NOTA_EXP_REF|
+        LayoutRegistro("J100", (
+            Campo("cod_agl", 2),
+            Campo("ind_cod_agl", 3),        # T=Totalizador, D=Detalhe
+            Campo("nivel_agl", 4),
+            Campo("cod_agl_sup", 5),
+            Campo("ind_grupo", 6),          # A=Ativo, P=Passivo e PL
+            Campo("descricao", 7),
+            Campo("valor_inicial", 8, NUMERO, 2),
+            Campo("ind_dc_ini", 9),
+            Campo("valor_final", 10, NUMERO, 2),
+            Campo("ind_dc_fin", 11),
+        ), pai="J005", herdados=("periodo_inicio", "periodo_fim"), versao_minima="7.00"),
+        # Leiautes 1 a 6: |J100|COD_AGL|NIVEL_AGL|IND_GRP_BAL|DESCR_COD_AGL|VL_CTA|IND_DC_BAL|
+        #  VL_CTA_INI|IND_DC_BAL_INI|NOTA_EXP_REF|
+        # Sem IND_COD_AGL/COD_AGL_SUP: a hierarquia sai da ordem e do NIVEL_AGL
+        # das linhas (demonstracoes.hierarquia_por_nivel)
+        LayoutRegistro("J100", (
+            Campo("cod_agl", 2),
+            Campo("nivel_agl", 3),
+            Campo("ind_grupo", 4),
+            Campo("descricao", 5),
+            Campo("valor_final", 6, NUMERO, 2),
+            Campo("ind_dc_fin", 7),
+            Campo("valor_inicial", 8, NUMERO, 2),
+            Campo("ind_dc_ini", 9),
+        ), pai="J005", herdados=("periodo_inicio", "periodo_fim"), versao_maxima="6.00", posicao_minima=7),
+        # |J150|NU_ORDEM|COD_AGL|IND_COD_AGL|NIVEL_AGL|COD_AGL_SUP|DESCR_COD_AGL|
+        #  VL_CTA_INI|IND_DC_CTA_INI|VL_CTA_FIN|IND_DC_CTA_FIN|IND_GRP_DRE|NOTA_EXP_REF|
+        LayoutRegistro("J150", (
+            Campo("nu_ordem", 2),
+            Campo("cod_agl", 3),
+            Campo("ind_cod_agl", 4),
+            Campo("nivel_agl", 5),
+            Campo("cod_agl_sup", 6),
+            Campo("descricao", 7),
+            Campo("valor_inicial", 8, NUMERO, 2),
+            Campo("ind_dc_ini", 9),
+            Campo("valor_final", 10, NUMERO, 2),
+            Campo("ind_dc_fin", 11),
+            Campo("ind_grupo", 12),         # R=Receita, D=Despesa
+        ), pai="J005", herdados=("periodo_inicio", "periodo_fim"), versao_minima="7.00"),
+        # Leiautes 1 a 6: |J150|COD_AGL|NIVEL_AGL|DESCR_COD_AGL|VL_CTA|IND_VL|
+        #  VL_CTA_ULT_DRE|IND_VL_ULT_DRE|NOTA_EXP_REF|
+        LayoutRegistro("J150", (
+            Campo("cod_agl", 2),
+            Campo("nivel_agl", 3),
+            Campo("descricao", 4),
+            Campo("valor_final", 5, NUMERO, 2),
+            Campo("ind_dc_fin", 6, traducao=IND_VL_DC),
+            Campo("ind_grupo", 6),          # D/R (P/N em subtotais)
+            Campo("valor_inicial", 7, NUMERO, 2),
+            Campo("ind_dc_ini", 8, traducao=IND_VL_DC),
+        ), pai="J005", herdados=("periodo_inicio", "periodo_fim"), versao_maxima="6.00", posicao_minima=6),
+    ),
+)
+
+
+# ============================================
+# ECF - Escrituração Contábil Fiscal
+# ============================================
+
+LAYOUT_ECF = LayoutSped(
+    familia="ECF",
+    versao=("0000", "versao_leiaute"),
+    registros=(
+        # |0000|NOME_ESC|COD_VER|CNPJ|NOME|IND_SIT_INI_PER|SIT_ESPECIAL|PAT_REMAN_CIS|
+        #  DT_SIT_ESP|DT_INI|DT_FIN|RETIFICADORA|NUM_REC|TIP_ECF|COD_SCP|
+        LayoutRegistro("0000", (
+            Campo("nome_escrituracao", 2),
+            Campo("versao_leiaute", 3),
+            Campo("cnpj", 4),
+            Campo("nome", 5),
+            Campo("data_inicio", 10),
+            Campo("data_fim", 11),
+            Campo("retificadora", 12),
+            Campo("tipo_ecf", 14),
+        ), posicao_minima=11),
+        # |J050|DT_ALT|COD_NAT|IND_CTA|NIVEL|COD_CTA|COD_CTA_SUP|CTA|
+        LayoutRegistro("J050", (
+            Campo("cod_natureza", 3),
+            Campo("tipo_conta", 4),
+            Campo("nivel", 5),
+            Campo("cod_conta", 6),
+            Campo("conta_superior", 7),
+            Campo("descricao", 8),
+        )),
+        # |J051|COD_CCUS|COD_CTA_REF|
+        LayoutRegistro("J051", (
+            Campo("centro_custo", 2),
+            Campo("cod_conta_referencial", 3),
+        ), pai="J050", herdados=("cod_conta",)),
+        # |K030|DT_INI|DT_FIN|PER_APUR|
+        LayoutRegistro("K030", (
+            Campo("periodo_inicio", 2, DATA),
+            Campo("periodo_fim", 3, DATA),
+            Campo("periodo_apuracao", 4),   # A00=Anual, T01..T04, A01..A12
+        )),
+        # |K155|COD_CTA|COD_CCUS|VL_SLD_INI|IND_VL_SLD_INI|VL_DEB|VL_CRED|VL_SLD_FIN|IND_VL_SLD_FIN|
+        LayoutRegistro("K155", (
+            Campo("cod_conta", 2),
+            Campo("centro_custo", 3),
+            Campo("saldo_inicial", 4, NUMERO, 2),
+            Campo("ind_saldo_ini", 5),
+            Campo("valor_debito", 6, NUMERO, 2),
+            Campo("valor_credito", 7, NUMERO, 2),
+            Campo("saldo_final", 8, NUMERO, 2),
+            Campo("ind_saldo_fin", 9),
+        ), pai="K030", herdados=("periodo_inicio", "periodo_fim", "periodo_apuracao")),
+        # |K355|COD_CTA|COD_CCUS|VL_SLD_FIN|IND_VL_SLD_FIN|
+        LayoutRegistro("K355", (
+            Campo("cod_conta", 2),
+            Campo("centro_custo", 3),
+            Campo("saldo_final", 4, NUMERO, 2),
+            Campo("ind_saldo_fin", 5),
+        ), pai="K030", herdados=("periodo_inicio", "periodo_fim", "periodo_apuracao")),
+    ),
+)
+
+
+# ============================================
+# EFD-Contribuições (PIS/COFINS)
+# ============================================
+
+# M200 (PIS) e M600 (COFINS) têm o mesmo leiaute
+_CAMPOS_APURACAO = (
+    Campo("contribuicao_nao_cumulativa", 2, NUMERO, 2),
+    Campo("creditos_descontados", 3, NUMERO, 2),
+    Campo("creditos_descontados_anteriores", 4, NUMERO, 2),
+    Campo("contribuicao_nao_cumulativa_devida", 5, NUMERO, 2),
+    Campo("retencoes_nao_cumulativa", 6, NUMERO, 2),
+    Campo("outras_deducoes_nao_cumulativa", 7, NUMERO, 2),
+    Campo("nao_cumulativa_a_recolher", 8, NUMERO, 2),
+    Campo("contribuicao_cumulativa", 9, NUMERO, 2),
+    Campo("retencoes_cumulativa", 10, NUMERO, 2),
+    Campo("outras_deducoes_cumulativa", 11, NUMERO, 2),
+    Campo("cumulativa_a_recolher", 12, NUMERO, 2),
+    Campo("total_a_recolher", 13, NUMERO, 2),
+)
+
+LAYOUT_EFD_CONTRIBUICOES = LayoutSped(
+    familia="EFD_CONTRIBUICOES",
+    versao=("0000", "versao_leiaute"),
+    registros=(
+        # |0000|COD_VER|TIPO_ESCRIT|IND_SIT_ESP|NUM_REC_ANTERIOR|DT_INI|DT_FIN|NOME|CNPJ|UF|
+        #  COD_MUN|SUFRAMA|IND_NAT_PJ|IND_ATIV|
+        LayoutRegistro("0000", (
+            Campo("versao_leiaute", 2),
+            Campo("tipo_escrituracao", 3),  # 0=Original, 1=Retificadora
+            Campo("data_inicio", 6),
+            Campo("data_fim", 7),
+            Campo("nome", 8),
+            Campo("cnpj", 9),
+            Campo("uf", 10),
+            Campo("cod_municipio", 11),
+            Campo("ind_natureza_pj", 13),
+            Campo("ind_atividade", 14),
+        ), posicao_minima=10),
+        # |0140|COD_EST|NOME|CNPJ|UF|IE|COD_MUN|IM|SUFRAMA|
+        LayoutRegistro("0140", (
+            Campo("cod_estabelecimento", 2),
+            Campo("nome", 3),
+            Campo("cnpj", 4),
+            Campo("uf", 5),
+        )),
+        # |C010|CNPJ|IND_ESCRI|
+        LayoutRegistro("C010", (
+            Campo("cnpj", 2),
+            Campo("ind_escrituracao", 3),
+        ), posicao_minima=2),
+        # |C100|IND_OPER|IND_EMIT|COD_PART|COD_MOD|COD_SIT|SER|NUM_DOC|CHV_NFE|DT_DOC|DT_E_S|
+        #  VL_DOC|IND_PGTO|VL_DESC|VL_ABAT_NT|VL_MERC|IND_FRT|VL_FRT|VL_SEG|VL_OUT_DA|
+        #  VL_BC_ICMS|VL_ICMS|VL_BC_ICMS_ST|VL_ICMS_ST|VL_IPI|VL_PIS|VL_COFINS|...
+        LayoutRegistro("C100", (
+            Campo("ind_operacao", 2),       # 0=Entrada, 1=Saída
+            Campo("ind_emitente", 3),
+            Campo("cod_participante", 4),
+            Campo("cod_modelo", 5),
+            Campo("cod_situacao", 6),
+            Campo("serie", 7),
+            Campo("num_documento", 8),
+            Campo("chave_nfe", 9),
+            Campo("data_documento", 10, DATA),
+            Campo("data_entrada_saida", 11, DATA),
+            Campo("valor_documento", 12, NUMERO, 2),
+            Campo("valor_mercadorias", 16, NUMERO, 2),
+            Campo("valor_pis", 26, NUMERO, 2),
+            Campo("valor_cofins", 27, NUMERO, 2),
+        ), pai="C010", herdados=("cnpj",), posicao_minima=12),
+        LayoutRegistro("M200", _CAMPOS_APURACAO),
+        LayoutRegistro("M600", _CAMPOS_APURACAO),
+    ),
+)
+
+
+LAYOUTS: Dict[str, LayoutSped] = {
+    layout.familia: layout
+    for layout in (LAYOUT_ECD, LAYOUT_ECF, LAYOUT_EFD_CONTRIBUICOES)
+}
+
+
+# ============================================
+# COMPILAÇÃO E EXTRAÇÃO
+# ============================================
+
+_PARTES = pl.col("linha").str.strip_chars(ESPACOS).str.split("|")
+
+# Linhas separadas por lote de decodificação
+LOTE_LINHAS = 1_000_000
+
+
+class PlanoExtracao:
+    """
+    Plano compilado para um conjunto de registros de uma família.
+
+    Inclui automaticamente os registros pais (contexto herdado) e o registro
+    com a versão do leiaute quando algum registro tem mais de uma variante.
+
+    Exemplo:
+        plano = compilar_plano("ECD", ["I050", "I155"])
+        quadros = plano.coletar(iterar_linhas(fonte), criar_decodificador("utf-8"))
+        quadros["I155"]  # já com periodo_inicio / periodo_fim do I150
+    """
+
+    def __init__(self, layout: LayoutSped, registros: Tuple[str, ...]):
+        self.layout = layout
+        self.registros = registros
+
+        # Fecho: pais (em qualquer profundidade) antes dos filhos
+        ordem: List[str] = []
+
+        def incluir(registro: str) -> None:
+            if registro in ordem:
+                return
+            pai = layout.variantes(registro)[0].pai
+            if pai is not None:
+                incluir(pai)
+            ordem.append(registro)
+
+        for registro in registros:
+            incluir(registro)
+
+        self.versionado = any(len(layout.variantes(r)) > 1 for r in ordem)
+        if self.versionado and layout.versao is not None:
+            incluir(layout.versao[0])
+
+        self.ordem: Tuple[str, ...] = tuple(ordem)
+        self.prefixos = frozenset(f"|{r}|".encode("ascii") for r in ordem)
+        self.esquemas = {r: layout.esquema(r) for r in ordem}
+
+        # Expressões por variante: campos ausentes na variante saem nulos
+        self._expressoes: Dict[str, List[Tuple[LayoutRegistro, List[pl.Expr]]]] = {}
+        for registro in ordem:
+            proprios = [c for c in self.esquemas[registro] if c not in layout.variantes(registro)[0].herdados]
+            compiladas = []
+            for variante in layout.variantes(registro):
+                por_nome = {c.nome: c for c in variante.campos}
+                compiladas.append((variante, [
+                    por_nome[nome].expressao(pl.col("_partes")) if nome in por_nome
+                    else pl.lit(None, dtype=self.esquemas[registro][nome]).alias(nome)
+                    for nome in proprios
+                ]))
+            self._expressoes[registro] = compiladas
+
+    def separar(self, linhas: Iterable[bytes], tamanho_lote: int = LOTE_LINHAS) -> Iterator[List[bytes]]:
+        """
+        Passada pelas linhas: uma consulta à tabela de despacho por linha.
+        As linhas separadas saem em lotes de até tamanho_lote.
+        """
+        prefixos = self.prefixos
+        separadas = (linha for linha in linhas if linha[:6] in prefixos)
+        while True:
+            lote = list(islice(separadas, tamanho_lote))
+            if not lote:
+                return
+            yield lote
+
+    def coletar(
+        self,
+        linhas: Iterable[bytes],
+        decodificar: Callable[[bytes], str],
+        campos: Optional[Dict[str, Sequence[str]]] = None,
+    ) -> Dict[str, pl.DataFrame]:
+        """Separa as linhas e extrai um DataFrame por registro pedido"""
+        return self.extrair(self.separar(linhas), decodificar, campos)
+
+    def extrair(
+        self,
+        lotes: Iterable[List[bytes]],
+        decodificar: Callable[[bytes], str],
+        campos: Optional[Dict[str, Sequence[str]]] = None,
+    ) -> Dict[str, pl.DataFrame]:
+        """
+        Aplica as expressões compiladas e resolve o contexto herdado dos pais.
+        campos restringe as colunas de um registro: as demais nem são
+        extraídas (ex.: o histórico do I250).
+        """
+
+        # Uma linha por registro separado, na ordem do arquivo; cada lote de
+        # bytes é esvaziado logo após a decodificação
+        colunas = []
+        for lote in lotes:
+            colunas.append(pl.Series("linha", [decodificar(linha) for linha in lote], dtype=pl.String))
+            lote.clear()
+
+        coluna = pl.concat(colunas, rechunk=False) if colunas else pl.Series("linha", [], dtype=pl.String)
+        linhas = coluna.to_frame().with_row_index("_seq").with_columns(
+            pl.col("linha").str.slice(1, 4).alias("_registro")
+        )
+        del colunas, coluna
+
+        versao = None
+        if self.versionado and self.layout.versao is not None:
+            registro_versao, campo_versao = self.layout.versao
+            quadro_versao = self._quadro(registro_versao, linhas, None).collect()
+            versao = _versao_numerica(quadro_versao.get_column(campo_versao))
+
+        quadros: Dict[str, pl.LazyFrame] = {}
+        for registro in self.ordem:
+            quadro = self._quadro(registro, linhas, versao)
+            variante = self.layout.variantes(registro)[0]
+            if variante.pai is not None:
+                # Contexto: último pai anterior à linha (nulo se não houver)
+                quadro = quadro.join_asof(
+                    quadros[variante.pai].select("_seq", *variante.herdados),
+                    on="_seq",
+                    strategy="backward",
+                    check_sortedness=False,
+                )
+            quadros[registro] = quadro
+
+        campos = campos or {}
+        coletados = pl.collect_all([
+            quadros[r].select(list(campos.get(r, self.esquemas[r]))) for r in self.registros
+        ])
+        return dict(zip(self.registros, coletados))
+
+    def _quadro(self, registro: str, linhas: pl.DataFrame, versao: Optional[float]) -> pl.LazyFrame:
+        variante, expressoes = next(
+            ((v, e) for v, e in self._expressoes[registro] if v.vale_para(versao)),
+            self._expressoes[registro][0],
+        )
+        return (
+            linhas.lazy()
+            .filter(pl.col("_registro") == registro)
+            .select("_seq", _PARTES.alias("_partes"))
+            .filter(pl.col("_partes").list.len() >= variante.minimo_campos)
+            .select("_seq", *expressoes)
+        )
+
+
+def _versao_numerica(valores: pl.Series) -> Optional[float]:
+    """Última versão informada ("9.00", "006") como número"""
+    valores = valores.str.replace(",", ".", literal=True).cast(pl.Float64, strict=False).drop_nulls()
+    return valores[-1] if len(valores) else None
+
+
+@lru_cache(maxsize=None)
+def _compilar(familia: str, registros: Tuple[str, ...]) -> PlanoExtracao:
+    return PlanoExtracao(LAYOUTS[familia], registros)
+
+
+def compilar_plano(familia: str, registros: Iterable[str]) -> PlanoExtracao:
+    """Plano de extração compilado (uma vez por família e conjunto de registros)"""
+    return _compilar(familia, tuple(registros))
+
+
+def extrair_registros(
+    linhas: Iterable[bytes],
+    decodificar: Callable[[bytes], str],
+    registros: Iterable[str],
+    familia: str = "ECD",
+) -> Dict[str, pl.DataFrame]:
+    """
+    Extrai os registros pedidos em uma passada pelas linhas.
+
+    Args:
+        linhas: Linhas do arquivo em bytes
+        decodificar: Função de decodificação (uma chamada por linha extraída)
+        registros: Códigos dos registros (ex.: ["0000", "I050", "I155"])
+        familia: "ECD", "ECF" ou "EFD_CONTRIBUICOES"
+
+    Returns:
+        Dicionário registro -> DataFrame com as colunas do leiaute
+    """
+    return compilar_plano(familia, registros).coletar(linhas, decodificar)
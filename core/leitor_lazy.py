@@ -0,0 +1,128 @@
+"""
+Leitura Lazy do SPED ECD
+Audiper - Sistema de Auditoria Digital
+
+Alternativa a processar_sped_ecd que devolve pl.LazyFrame sobre o Parquet
+do cache. O enriquecimento saldos x plano fica como um join lazy, de modo
+que filtros (tipo_conta, natureza, período) e projeções aplicados pelos
+testes e pelo exportador são empurrados para a varredura e para o join:
+um teste que toca 5% dos dados lê apenas esses 5%.
+"""
+
+import os
+import polars as pl
+from dataclasses import dataclass
+from typing import List, Optional, Any
+
+from .leitor_sped import DadosEmpresa
+from .entrada import processar_arquivos_sped, detectar_formato
+from .cache import (
+    diretorio_parquet,
+    existe_parquet,
+    hash_arquivo,
+    hash_buffer,
+    ler_empresa_parquet,
+    COLUNAS_ENRIQUECIMENTO,
+)
+
+
+@dataclass
+class SpedLazy:
+    """Escrituração com plano e saldos como LazyFrames"""
+    hash_conteudo: str
+    empresa: Optional[DadosEmpresa]
+    plano: pl.LazyFrame
+    saldos: pl.LazyFrame
+
+    def saldos_enriquecidos(self) -> pl.LazyFrame:
+        """Saldos com descrição, natureza e tipo da conta (join lazy com o plano)"""
+        # Caches gravados por versões anteriores podem não ter todas as colunas
+        colunas_plano = self.plano.collect_schema().names()
+        return self.saldos.join(
+            self.plano.select(["cod_conta", *[c for c in COLUNAS_ENRIQUECIMENTO if c in colunas_plano]]),
+            on="cod_conta",
+            how="left",
+        )
+
+
+def abrir_sped_lazy(hash_conteudo: str) -> SpedLazy:
+    """
+    Abre uma escrituração já processada a partir do cache Parquet.
+
+    Raises:
+        FileNotFoundError: se o conteúdo não estiver em cache
+    """
+
+    diretorio = diretorio_parquet(hash_conteudo)
+    if not existe_parquet(hash_conteudo):
+        raise FileNotFoundError(f"Escrituração {hash_conteudo} não encontrada no cache")
+
+    dados_empresa = ler_empresa_parquet(hash_conteudo)
+
+    return SpedLazy(
+        hash_conteudo=hash_conteudo,
+        empresa=DadosEmpresa(**dados_empresa) if dados_empresa else None,
+        plano=pl.scan_parquet(diretorio / "plano.parquet"),
+        saldos=pl.scan_parquet(diretorio / "saldos.parquet"),
+    )
+
+
+def _hash_previo(arquivo: Any) -> Optional[str]:
+    """Hash de um SPED em texto antes do parse (permite pular o parse se já em cache)"""
+
+    if isinstance(arquivo, (str, os.PathLike)):
+        with open(arquivo, "rb") as aberto:
+            if detectar_formato(aberto.read(4)) != "texto":
+                return None
+        return hash_arquivo(arquivo)
+
+    if isinstance(arquivo, (bytes, bytearray, memoryview)):
+        if detectar_formato(bytes(arquivo[:4])) != "texto":
+            return None
+        return hash_buffer(arquivo)
+
+    if hasattr(arquivo, "getbuffer"):
+        with arquivo.getbuffer() as buffer:
+            if detectar_formato(bytes(buffer[:4])) != "texto":
+                return None
+            return hash_buffer(buffer)
+
+    return None
+
+
+def carregar_sped_lazy(arquivo: Any, nome: str = "") -> List[SpedLazy]:
+    """
+    Carrega escriturações como LazyFrames.
+
+    Se o conteúdo já foi processado, abre direto do cache Parquet; caso
+    contrário, faz o parse (gravando o cache) e abre o resultado.
+
+    Args:
+        arquivo: Caminho, bytes ou upload (texto ou compactado)
+        nome: Nome original do arquivo
+
+    Returns:
+        Lista de SpedLazy (um zip pode conter várias escriturações)
+    """
+
+    hash_conteudo = _hash_previo(arquivo)
+    if hash_conteudo and existe_parquet(hash_conteudo):
+        return [abrir_sped_lazy(hash_conteudo)]
+
+    resultado = []
+    for processado in processar_arquivos_sped(arquivo, nome):
+        if "✅" not in processado.status:
+            continue
+
+        if existe_parquet(processado.hash_conteudo):
+            resultado.append(abrir_sped_lazy(processado.hash_conteudo))
+        else:
+            # Cache indisponível: LazyFrames sobre os dados em memória
+            resultado.append(SpedLazy(
+                hash_conteudo=processado.hash_conteudo,
+                empresa=processado.empresa,
+                plano=processado.df_plano.lazy(),
+                saldos=processado.df_saldos.drop(COLUNAS_ENRIQUECIMENTO, strict=False).lazy(),
+            ))
+
+    return resultado
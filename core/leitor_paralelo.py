@@ -0,0 +1,162 @@
+"""
+Leitor Paralelo de SPED ECD
+Audiper - Sistema de Auditoria Digital
+
+Divide o arquivo em N fatias de bytes alinhadas a quebras de linha e faz o
+parse de cada fatia em um processo separado. O contexto que atravessa as
+fatias (período I150 vigente) fica nulo no worker; cada fatia devolve também
+o último I150 que contém (mesmo sem I155 depois dele), e os saldos iniciais
+da fatia seguinte recebem esse período após a concatenação.
+
+O resultado é determinístico e idêntico ao de processar_sped_ecd_arquivo.
+"""
+
+import io
+import os
+import mmap
+import multiprocessing
+import polars as pl
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+from typing import List, Tuple, Optional, Dict
+
+from .leitor_sped import (
+    DadosEmpresa,
+    REGISTROS_ECD,
+    registros_ecd,
+    criar_decodificador,
+    detectar_codificacao,
+    finalizar_resultado,
+    processar_sped_ecd_arquivo,
+)
+from .indice_sped import ler_faixas
+from .layouts import compilar_plano
+
+
+# Abaixo deste tamanho o custo de iniciar processos supera o ganho
+TAMANHO_MINIMO_PARALELO = 16 * 1024 * 1024
+
+MAXIMO_PROCESSOS = 16
+
+# Período (início, fim) de um I150
+Periodo = Tuple[Optional[date], Optional[date]]
+
+
+def dividir_em_fatias(mapa: mmap.mmap, quantidade: int) -> List[Tuple[int, int]]:
+    """Divide o arquivo em fatias [início, fim) terminando sempre em '\\n'"""
+
+    tamanho = len(mapa)
+    passo = max(1, tamanho // quantidade)
+    fatias = []
+    inicio = 0
+
+    while inicio < tamanho:
+        fim = min(inicio + passo, tamanho)
+        if fim < tamanho:
+            quebra = mapa.find(b"\n", fim - 1)
+            fim = tamanho if quebra == -1 else quebra + 1
+        fatias.append((inicio, fim))
+        inicio = fim
+
+    return fatias
+
+
+def _serializar(df: pl.DataFrame) -> bytes:
+    buffer = io.BytesIO()
+    df.write_ipc(buffer)
+    return buffer.getvalue()
+
+
+def _processar_fatia(
+    caminho: str,
+    inicio: int,
+    fim: int,
+    codificacao: str,
+) -> Tuple[Optional[Dict[str, str]], bytes, bytes, Optional[Periodo]]:
+    """
+    Worker: parse de uma fatia, devolvendo os DataFrames em Arrow IPC e o
+    último período I150 da fatia (None se a fatia não tem I150)
+    """
+
+    with open(caminho, "rb") as arquivo, mmap.mmap(arquivo.fileno(), 0, access=mmap.ACCESS_READ) as mapa:
+        quadros = compilar_plano("ECD", REGISTROS_ECD + ("I150",)).coletar(
+            ler_faixas(mapa, [(inicio, fim)]),
+            criar_decodificador(codificacao),
+        )
+
+    empresa, df_plano, df_saldos = registros_ecd(quadros)
+    periodos = quadros["I150"]
+    ultimo_periodo = periodos.select("periodo_inicio", "periodo_fim").row(-1) if periodos.height else None
+
+    return (
+        empresa.to_dict() if empresa else None,
+        _serializar(df_plano),
+        _serializar(df_saldos),
+        ultimo_periodo,
+    )
+
+
+def processar_sped_ecd_paralelo(
+    caminho: str,
+    processos: Optional[int] = None,
+) -> Tuple[Optional[DadosEmpresa], pl.DataFrame, pl.DataFrame, str]:
+    """
+    Processa um SPED ECD em disco usando vários processos.
+
+    Args:
+        caminho: Arquivo SPED em texto (não compactado)
+        processos: Número de processos (padrão: núcleos disponíveis, até 16)
+
+    Returns:
+        Mesma tupla de processar_sped_ecd
+    """
+
+    processos = processos or min(os.cpu_count() or 1, MAXIMO_PROCESSOS)
+
+    if processos <= 1 or os.path.getsize(caminho) < TAMANHO_MINIMO_PARALELO:
+        return processar_sped_ecd_arquivo(caminho)
+
+    with open(caminho, "rb") as arquivo, mmap.mmap(arquivo.fileno(), 0, access=mmap.ACCESS_READ) as mapa:
+        codificacao = detectar_codificacao(mapa)
+        fatias = dividir_em_fatias(mapa, processos)
+
+    # spawn: processos limpos (fork de um processo com threads do Polars/Streamlit é inseguro)
+    contexto = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=processos, mp_context=contexto) as executor:
+        resultados = list(executor.map(
+            _processar_fatia,
+            [caminho] * len(fatias),
+            [inicio for inicio, _ in fatias],
+            [fim for _, fim in fatias],
+            [codificacao] * len(fatias),
+        ))
+
+    # Fatias são combinadas na ordem do arquivo (resultado determinístico)
+    dados_empresa = None
+    for empresa, _, _, _ in resultados:
+        if empresa is not None:
+            dados_empresa = DadosEmpresa(**empresa)
+
+    df_plano = pl.concat([pl.read_ipc(io.BytesIO(plano)) for _, plano, _, _ in resultados])
+
+    # Contexto entre fatias: saldos anteriores ao primeiro I150 de uma fatia
+    # (período nulo) pertencem ao último I150 das fatias anteriores
+    quadros_saldos = []
+    vigente: Optional[Periodo] = None
+    for _, _, saldos, ultimo_periodo in resultados:
+        df = pl.read_ipc(io.BytesIO(saldos))
+        if vigente is not None:
+            df = df.with_columns(
+                pl.col("periodo_inicio").fill_null(vigente[0]),
+                pl.col("periodo_fim").fill_null(vigente[1]),
+            )
+        quadros_saldos.append(df)
+        vigente = ultimo_periodo or vigente
+    df_saldos = pl.concat(quadros_saldos)
+
+    if df_plano.is_empty():
+        df_plano = pl.DataFrame()
+    if df_saldos.is_empty():
+        df_saldos = pl.DataFrame()
+
+    return finalizar_resultado(dados_empresa, df_plano, df_saldos)
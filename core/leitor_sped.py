@@ -5,13 +5,23 @@ Audiper - Sistema de Auditoria Digital
 Extrai registros:
 - 0000: Dados da empresa
 - I050: Plano de Contas
+- I150: Períodos dos saldos
 - I155: Saldos Periódicos (Balancete)
+
+Posições e tipos dos campos vêm dos leiautes declarados em layouts.py.
 """
 
 import polars as pl
 import io
+import os
+import re
+import mmap
+import codecs
 from dataclasses import dataclass
-from typing import Tuple, Optional, List, Dict, Any
+from typing import Tuple, Optional, Dict, Any, Callable, Iterable, Iterator
+
+from .classificador import classificar_plano
+from .layouts import compilar_plano
 
 
 @dataclass
@@ -53,6 +63,34 @@ def formatar_data(data: str) -> str:
     return data
 
 
+# Registros do ECD extraídos pelo leitor
+REGISTROS_ECD = ("0000", "I050", "I155")
+
+# Esquemas dos registros coletados
+ESQUEMA_PLANO = {
+    "cod_conta": pl.String,
+    "descricao": pl.String,
+    "cod_natureza": pl.String,
+    "natureza": pl.String,
+    "tipo_conta": pl.String,
+    "nivel": pl.String,
+    "conta_superior": pl.String,
+}
+
+ESQUEMA_SALDOS = {
+    "cod_conta": pl.String,
+    "centro_custo": pl.String,
+    "saldo_inicial": pl.Float64,
+    "ind_saldo_ini": pl.String,
+    "valor_debito": pl.Float64,
+    "valor_credito": pl.Float64,
+    "saldo_final": pl.Float64,
+    "ind_saldo_fin": pl.String,
+    "periodo_inicio": pl.Date,
+    "periodo_fim": pl.Date,
+}
+
+
 def processar_sped_ecd(conteudo: str) -> Tuple[Optional[DadosEmpresa], pl.DataFrame, pl.DataFrame, str]:
     """
     Processa arquivo SPED ECD e retorna dados estruturados.
@@ -64,67 +102,119 @@ def processar_sped_ecd(conteudo: str) -> Tuple[Optional[DadosEmpresa], pl.DataFr
         Tupla com (DadosEmpresa, DataFrame Plano, DataFrame Saldos, mensagem_status)
     """
     
-    linhas = conteudo.split("\n")
-    
-    # Estruturas para coleta
-    dados_empresa = None
-    registros_i050: List[Dict[str, Any]] = []
-    registros_i155: List[Dict[str, Any]] = []
-    
-    for linha in linhas:
-        if not linha.startswith("|"):
-            continue
-            
-        campos = linha.strip().split("|")
-        if len(campos) < 3:
-            continue
-            
-        registro = campos[1]
-        
-        # Registro 0000 - Abertura (dados da empresa)
-        if registro == "0000" and len(campos) >= 9:
-            dados_empresa = DadosEmpresa(
-                nome=limpar_campo(campos[6]) if len(campos) > 6 else "N/A",
-                cnpj=formatar_cnpj(limpar_campo(campos[7])) if len(campos) > 7 else "N/A",
-                uf=limpar_campo(campos[8]) if len(campos) > 8 else "N/A",
-                data_inicio=formatar_data(limpar_campo(campos[3])) if len(campos) > 3 else "N/A",
-                data_fim=formatar_data(limpar_campo(campos[4])) if len(campos) > 4 else "N/A",
-            )
+    return processar_sped_ecd_bytes(conteudo.encode("utf-8"), codificacao="utf-8")
+
+
+def processar_sped_ecd_bytes(
+    fonte: Any,
+    codificacao: Optional[str] = None,
+) -> Tuple[Optional[DadosEmpresa], pl.DataFrame, pl.DataFrame, str]:
+    """
+    Processa SPED ECD em bytes, sem decodificar o arquivo inteiro.
+    
+    As linhas são separadas e roteadas pelo código do registro ainda em bytes;
+    apenas os campos mantidos nos DataFrames são decodificados.
+    
+    Args:
+        fonte: bytes, mmap ou objeto com readline() (ex.: upload do Streamlit)
+        codificacao: Força a codificação; se None, é detectada no conteúdo
         
-        # Registro I050 - Plano de Contas
-        # Layout: |I050|DT_ALT|COD_NAT|IND_CTA|NIVEL|COD_CTA|COD_CTA_SUP|CTA|
-        elif registro == "I050" and len(campos) >= 9:
-            cod_nat = limpar_campo(campos[3])
-            registros_i050.append({
-                "cod_conta": limpar_campo(campos[6]),
-                "descricao": limpar_campo(campos[8]),
-                "cod_natureza": cod_nat,
-                "natureza": mapear_natureza(cod_nat),
-                "tipo_conta": limpar_campo(campos[4]),  # S=Sintética, A=Analítica
-                "nivel": limpar_campo(campos[5]),
-                "conta_superior": limpar_campo(campos[7]),
-            })
+    Returns:
+        Tupla com (DadosEmpresa, DataFrame Plano, DataFrame Saldos, mensagem_status)
+    """
+    
+    if codificacao is None:
+        codificacao = detectar_codificacao_fonte(fonte)
+    
+    registros = coletar_registros(iterar_linhas(fonte), criar_decodificador(codificacao))
+    return montar_resultado(*registros)
+
+
+def processar_sped_ecd_arquivo(caminho: str) -> Tuple[Optional[DadosEmpresa], pl.DataFrame, pl.DataFrame, str]:
+    """
+    Processa SPED ECD a partir de um arquivo em disco via memory-map.
+    
+    O conteúdo é lido diretamente das páginas mapeadas pelo sistema
+    operacional, sem cópia integral do arquivo para a memória do processo.
+    """
+    
+    with open(caminho, "rb") as arquivo:
+        if os.fstat(arquivo.fileno()).st_size == 0:
+            return montar_resultado(None, pl.DataFrame(), pl.DataFrame())
         
-        # Registro I155 - Saldos Periódicos
-        # Layout: |I155|COD_CTA|COD_CCUS|VL_SLD_INI|IND_DC_INI|VL_DEB|VL_CRED|VL_SLD_FIN|IND_DC_FIN|
-        elif registro == "I155" and len(campos) >= 10:
-            try:
-                registros_i155.append({
-                    "cod_conta": limpar_campo(campos[2]),
-                    "centro_custo": limpar_campo(campos[3]),
-                    "saldo_inicial": converter_valor(campos[4]),
-                    "ind_saldo_ini": limpar_campo(campos[5]),
-                    "valor_debito": converter_valor(campos[6]),
-                    "valor_credito": converter_valor(campos[7]),
-                    "saldo_final": converter_valor(campos[8]),
-                    "ind_saldo_fin": limpar_campo(campos[9]),
-                })
-            except (ValueError, IndexError):
-                continue  # Ignora linhas mal formatadas
-    
-    # Criar DataFrames Polars
-    df_plano = pl.DataFrame(registros_i050) if registros_i050 else pl.DataFrame()
-    df_saldos = pl.DataFrame(registros_i155) if registros_i155 else pl.DataFrame()
+        with mmap.mmap(arquivo.fileno(), 0, access=mmap.ACCESS_READ) as mapa:
+            return processar_sped_ecd_bytes(mapa)
+
+
+def coletar_registros(
+    linhas: Iterable[bytes],
+    decodificar: Callable[[bytes], str],
+) -> Tuple[Optional[DadosEmpresa], pl.DataFrame, pl.DataFrame]:
+    """
+    Percorre as linhas (bytes) e extrai os registros de interesse.
+    
+    A extração segue os leiautes declarados em layouts.py: a passada pelas
+    linhas só as separa por registro; campos, tipos e o período (I150) de
+    cada I155 são resolvidos depois, de forma vetorizada. Saldos anteriores
+    ao primeiro I150 ficam com período nulo (no parse paralelo por fatias,
+    resolvido após a concatenação).
+    
+    Args:
+        linhas: Linhas do arquivo em bytes
+        decodificar: Função de decodificação das linhas extraídas
+    """
+    
+    return registros_ecd(compilar_plano("ECD", REGISTROS_ECD).coletar(linhas, decodificar))
+
+
+def registros_ecd(
+    quadros: Dict[str, pl.DataFrame],
+) -> Tuple[Optional[DadosEmpresa], pl.DataFrame, pl.DataFrame]:
+    """Empresa, plano e saldos a partir dos quadros extraídos (0000, I050, I155)"""
+    
+    df_plano = quadros["I050"].with_columns(
+        pl.col("cod_natureza").replace_strict(NATUREZAS, default="N/A", return_dtype=pl.String).alias("natureza")
+    ).select(list(ESQUEMA_PLANO))
+    
+    return empresa_do_registro(quadros["0000"]), df_plano, quadros["I155"].select(list(ESQUEMA_SALDOS))
+
+
+def empresa_do_registro(df_0000: pl.DataFrame) -> Optional[DadosEmpresa]:
+    """Dados da empresa a partir do último registro 0000 extraído"""
+    
+    if df_0000.is_empty():
+        return None
+    
+    abertura = df_0000.row(-1, named=True)
+    return DadosEmpresa(
+        nome=abertura["nome"],
+        cnpj=formatar_cnpj(abertura["cnpj"]),
+        uf=abertura["uf"],
+        data_inicio=formatar_data(abertura["data_inicio"]),
+        data_fim=formatar_data(abertura["data_fim"]),
+    )
+
+
+def montar_resultado(
+    dados_empresa: Optional[DadosEmpresa],
+    df_plano: pl.DataFrame,
+    df_saldos: pl.DataFrame,
+) -> Tuple[Optional[DadosEmpresa], pl.DataFrame, pl.DataFrame, str]:
+    """Valida e enriquece os saldos extraídos com o plano"""
+    
+    # Registros ausentes resultam em DataFrames sem colunas
+    df_plano = pl.DataFrame() if df_plano.is_empty() else df_plano
+    df_saldos = pl.DataFrame() if df_saldos.is_empty() else df_saldos
+    
+    return finalizar_resultado(dados_empresa, df_plano, df_saldos)
+
+
+def finalizar_resultado(
+    dados_empresa: Optional[DadosEmpresa],
+    df_plano: pl.DataFrame,
+    df_saldos: pl.DataFrame,
+) -> Tuple[Optional[DadosEmpresa], pl.DataFrame, pl.DataFrame, str]:
+    """Valida e enriquece os saldos com o plano"""
     
     # Validações
     if df_plano.is_empty():
@@ -133,27 +223,32 @@ def processar_sped_ecd(conteudo: str) -> Tuple[Optional[DadosEmpresa], pl.DataFr
     if df_saldos.is_empty():
         return dados_empresa, df_plano, df_saldos, "⚠️ Nenhum Saldo (I155) encontrado"
     
-    # Enriquecer saldos com dados do plano
+    # Classificar retificadoras uma vez por plano e enriquecer os saldos
+    df_plano = classificar_plano(df_plano)
     df_saldos = df_saldos.join(
-        df_plano.select(["cod_conta", "descricao", "natureza", "tipo_conta"]),
+        df_plano.select(["cod_conta", "descricao", "natureza", "tipo_conta", "eh_retificadora"]),
         on="cod_conta",
-        how="left"
+        how="left",
+        maintain_order="left",
     )
     
     return dados_empresa, df_plano, df_saldos, "✅ Arquivo processado com sucesso"
 
 
+# Código de natureza (I050) -> descrição
+NATUREZAS = {
+    "01": "ATIVO",
+    "02": "PASSIVO",
+    "03": "PATRIMÔNIO LÍQUIDO",
+    "04": "RESULTADO",
+    "05": "COMPENSAÇÃO",
+    "09": "OUTRAS",
+}
+
+
 def mapear_natureza(codigo: str) -> str:
     """Mapeia código de natureza para descrição"""
-    mapa = {
-        "01": "ATIVO",
-        "02": "PASSIVO",
-        "03": "PATRIMÔNIO LÍQUIDO",
-        "04": "RESULTADO",
-        "05": "COMPENSAÇÃO",
-        "09": "OUTRAS",
-    }
-    return mapa.get(codigo, "N/A")
+    return NATUREZAS.get(codigo, "N/A")
 
 
 def converter_valor(valor_str: str) -> float:
@@ -171,6 +266,108 @@ def converter_valor(valor_str: str) -> float:
         return 0.0
 
 
+def converter_valor_bytes(valor: bytes) -> float:
+    """Converte valor SPED em bytes para float sem decodificar: b"1.234,56" -> 1234.56"""
+    valor = valor.strip()
+    if not valor:
+        return 0.0
+    
+    try:
+        return float(valor.replace(b".", b"").replace(b",", b"."))
+    except ValueError:
+        return 0.0
+
+
+# ============================================
+# CODIFICAÇÃO E LEITURA EM BYTES
+# ============================================
+
+# Bytes 0x80-0x9F só aparecem como texto em cp1252 (em latin-1 são controles)
+_RE_NAO_ASCII = re.compile(rb"[\x80-\xff]")
+_RE_FAIXA_CP1252 = re.compile(rb"[\x80-\x9f]")
+_RE_LINHA = re.compile(rb"[^\n]*\n|[^\n]+")
+
+TAMANHO_AMOSTRA_CODIFICACAO = 64 * 1024
+
+
+def detectar_codificacao(dados: Any) -> str:
+    """
+    Detecta a codificação (utf-8, cp1252 ou latin-1) de um buffer de bytes.
+    
+    Localiza o primeiro byte não-ASCII sem copiar o buffer e analisa apenas
+    uma janela a partir dele. Conteúdo puramente ASCII é tratado como utf-8.
+    """
+    
+    encontrado = _RE_NAO_ASCII.search(dados)
+    if encontrado is None:
+        return "utf-8"
+    
+    inicio = encontrado.start()
+    amostra = bytes(memoryview(dados)[inicio:inicio + TAMANHO_AMOSTRA_CODIFICACAO])
+    
+    try:
+        # final=False tolera um caractere multibyte cortado no fim da janela
+        codecs.getincrementaldecoder("utf-8")().decode(amostra, final=False)
+        return "utf-8"
+    except UnicodeDecodeError:
+        pass
+    
+    if _RE_FAIXA_CP1252.search(amostra):
+        return "cp1252"
+    return "latin-1"
+
+
+def detectar_codificacao_fonte(fonte: Any) -> str:
+    """Detecta a codificação de bytes, mmap ou objeto de upload (BytesIO)"""
+    
+    if hasattr(fonte, "getbuffer"):
+        with fonte.getbuffer() as buffer:
+            return detectar_codificacao(buffer)
+    
+    if hasattr(fonte, "readline"):
+        # Fluxos sem buffer acessível: utf-8 com fallback por campo
+        return "utf-8"
+    
+    return detectar_codificacao(fonte)
+
+
+def criar_decodificador(codificacao: str) -> Callable[[bytes], str]:
+    """Retorna a função de decodificação de campos para a codificação"""
+    
+    if codificacao.replace("_", "-").lower() in ("utf-8", "utf8"):
+        def decodificar(valor: bytes) -> str:
+            try:
+                return valor.decode("utf-8")
+            except UnicodeDecodeError:
+                return valor.decode("cp1252", errors="replace")
+        return decodificar
+    
+    def decodificar_simples(valor: bytes) -> str:
+        return valor.decode(codificacao, errors="replace")
+    return decodificar_simples
+
+
+def iterar_linhas(fonte: Any) -> Iterator[bytes]:
+    """
+    Itera as linhas de uma fonte em bytes sem copiar o conteúdo inteiro.
+    
+    Aceita objetos com readline() (arquivos, uploads, mmap), bytes
+    (encapsulados em BytesIO, que compartilha o buffer) e demais buffers
+    (bytearray, memoryview), percorridos com regex sobre o próprio buffer.
+    """
+    
+    if isinstance(fonte, (io.BytesIO, mmap.mmap)):
+        fonte.seek(0)
+    
+    if hasattr(fonte, "readline"):
+        return iter(fonte.readline, b"")
+    
+    if isinstance(fonte, bytes):
+        return iter(io.BytesIO(fonte).readline, b"")
+    
+    return (linha.group() for linha in _RE_LINHA.finditer(fonte))
+
+
 def carregar_arquivo_upload(arquivo_upload) -> str:
     """Carrega arquivo do upload do Streamlit"""
     return arquivo_upload.getvalue().decode("latin-1")
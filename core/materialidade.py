@@ -0,0 +1,194 @@
+"""
+Materialidade e Priorização de Achados
+Audiper - Sistema de Auditoria Digital
+
+Deriva a materialidade do cubo de saldos (core.cubo_saldos), como na NBC TA
+320: um percentual de uma base (por padrão, 1% do Ativo total) para a
+materialidade global e, por natureza, um percentual do total da própria
+natureza, limitado à global.
+
+Cada achado recebe uma pontuação:
+
+    |valor| / materialidade da natureza × peso da severidade
+
+e as listas exibidas e exportadas começam pelos achados mais materiais. A
+seleção dos N primeiros usa ordenação parcial (top_k), sem ordenar os
+milhões de achados de testes sobre lançamentos.
+"""
+
+import polars as pl
+from dataclasses import dataclass, field
+from datetime import date
+from typing import Dict, Optional
+
+from .cubo_saldos import CuboSaldos
+
+
+# Materialidade global: percentual da natureza usada como base
+BASE_PADRAO = "ATIVO"
+PERCENTUAL_GLOBAL = 0.01
+
+# Materialidade específica: percentual do total de cada natureza (o
+# RESULTADO do período faz as vezes do lucro antes dos tributos)
+PERCENTUAIS_NATUREZA = {
+    "ATIVO": 0.01,
+    "PASSIVO": 0.01,
+    "PATRIMÔNIO LÍQUIDO": 0.02,
+    "RESULTADO": 0.05,
+}
+
+# Evita divisão por zero em escriturações sem saldo na base
+MATERIALIDADE_MINIMA = 1.0
+
+PESOS_SEVERIDADE = {
+    "CRÍTICO": 3.0,
+    "ATENÇÃO": 2.0,
+    "INFO": 1.0,
+    "OK": 0.0,
+}
+
+
+@dataclass(frozen=True)
+class Materialidade:
+    """Materialidade global e por natureza de uma escrituração"""
+    geral: float
+    base: str
+    percentual: float
+    periodo_fim: Optional[date] = None
+    por_natureza: Dict[str, float] = field(default_factory=dict)
+
+    def da_natureza(self, natureza: Optional[str]) -> float:
+        return self.por_natureza.get(natureza, self.geral)
+
+    def expressao(self, natureza: pl.Expr) -> pl.Expr:
+        """Materialidade de cada linha conforme a natureza (demais: global)"""
+        return natureza.cast(pl.String).replace_strict(
+            self.por_natureza,
+            default=self.geral,
+            return_dtype=pl.Float64,
+        )
+
+    def tabela(self) -> pl.DataFrame:
+        """Tabela (natureza, materialidade) para exibição e exportação"""
+        return pl.DataFrame(
+            {
+                "natureza": ["GLOBAL", *self.por_natureza],
+                "materialidade": [self.geral, *self.por_natureza.values()],
+            },
+            schema={"natureza": pl.String, "materialidade": pl.Float64},
+        )
+
+
+def calcular_materialidade(
+    cubo: CuboSaldos,
+    percentual_global: float = PERCENTUAL_GLOBAL,
+    percentuais_natureza: Optional[Dict[str, float]] = None,
+    base: str = BASE_PADRAO,
+    periodo_fim: Optional[date] = None,
+) -> Materialidade:
+    """
+    Calcula a materialidade a partir dos totais por natureza do cubo.
+
+    Args:
+        cubo: Cubo de saldos (gerar_cubo_saldos)
+        percentual_global: Percentual da base para a materialidade global
+        percentuais_natureza: Percentual por natureza (padrão: PERCENTUAIS_NATUREZA)
+        base: Natureza usada como base da materialidade global; sem saldo
+            nela, usa a natureza de maior total
+        periodo_fim: Período dos totais (padrão: último período)
+
+    Returns:
+        Materialidade
+    """
+
+    if periodo_fim is None:
+        periodos = cubo.periodos.drop_nulls()
+        periodo_fim = periodos[-1] if len(periodos) else None
+
+    percentuais = PERCENTUAIS_NATUREZA if percentuais_natureza is None else percentuais_natureza
+    totais = {
+        natureza: abs(saldo or 0.0)
+        for natureza, saldo in cubo.por_natureza(periodo_fim).select("natureza", "saldo_final").iter_rows()
+        if natureza
+    }
+
+    if not totais.get(base) and totais:
+        base = max(totais, key=totais.get)
+    geral = max(totais.get(base, 0.0) * percentual_global, MATERIALIDADE_MINIMA)
+
+    por_natureza = {
+        natureza: round(max(min(totais[natureza] * percentual, geral), MATERIALIDADE_MINIMA), 2)
+        for natureza, percentual in percentuais.items()
+        if totais.get(natureza)
+    }
+
+    return Materialidade(
+        geral=round(geral, 2),
+        base=base,
+        percentual=percentual_global,
+        periodo_fim=periodo_fim,
+        por_natureza=por_natureza,
+    )
+
+
+def _peso_severidade() -> pl.Expr:
+    return pl.col("severidade").cast(pl.String).replace_strict(
+        PESOS_SEVERIDADE, default=1.0, return_dtype=pl.Float64
+    )
+
+
+def pontuar_achados(achados: pl.DataFrame, materialidade: Optional[Materialidade] = None) -> pl.DataFrame:
+    """
+    Acrescenta materialidade, material (|valor| >= materialidade) e
+    pontuacao a cada achado. Sem materialidade, a pontuação é o valor
+    absoluto ponderado pela severidade.
+    """
+
+    valor = pl.col("valor").abs().fill_null(0.0)
+
+    if materialidade is None:
+        return achados.with_columns((valor * _peso_severidade()).alias("pontuacao"))
+
+    natureza = pl.col("natureza") if "natureza" in achados.columns else pl.lit(None, dtype=pl.String)
+    return (
+        achados
+        .with_columns(materialidade.expressao(natureza).alias("materialidade"))
+        .with_columns(
+            (valor >= pl.col("materialidade")).alias("material"),
+            (valor / pl.col("materialidade") * _peso_severidade()).round(4).alias("pontuacao"),
+        )
+    )
+
+
+def principais_achados(
+    achados: pl.DataFrame,
+    materialidade: Optional[Materialidade] = None,
+    n: int = 50,
+) -> pl.DataFrame:
+    """
+    Os n achados de maior pontuação, do mais material ao menos material
+    (empates pela ordem original, id).
+
+    A seleção é uma ordenação parcial (top_k); só as n linhas selecionadas
+    são ordenadas.
+
+    Args:
+        achados: DataFrame de achados (modelo de core.achados)
+        materialidade: Materialidade da escrituração (calcular_materialidade)
+        n: Quantidade de achados
+
+    Returns:
+        DataFrame com as colunas de pontuar_achados
+    """
+
+    if achados.is_empty():
+        return achados
+
+    if materialidade is not None or "pontuacao" not in achados.columns:
+        achados = pontuar_achados(achados, materialidade)
+
+    ordem = {"by": ["pontuacao", "id"], "reverse": [False, True]}
+    if n < achados.height:
+        achados = achados.top_k(n, **ordem)
+
+    return achados.sort(ordem["by"], descending=[True, False])
@@ -0,0 +1,447 @@
+"""
+Monitor de Pastas
+Audiper - Sistema de Auditoria Digital
+
+Serviço que acompanha pastas compartilhadas e processa cada ECD depositada
+sem passar pela interface:
+
+- varredura periódica (polling, funciona também em compartilhamentos de
+  rede); um arquivo só entra na fila quando tamanho e data de modificação
+  ficam estáveis por TEMPO_ESTABILIDADE segundos (cópia concluída);
+- deduplicação pelo hash do conteúdo: o mesmo arquivo copiado com outro
+  nome, ou para outra pasta, não é processado de novo;
+- fila limitada sobre um pool de trabalhadores: parse, testes
+  (core.pipeline), cache em disco (original + Parquet) e armazém;
+- estado em JSON gravado de forma atômica a cada conclusão: após um
+  reinício, arquivos concluídos são ignorados e os que estavam em
+  processamento voltam para a fila.
+
+Uso:
+    python -m core.monitor_pasta /srv/ecd/entrada --trabalhadores 2
+"""
+
+import os
+import json
+import time
+import signal
+import logging
+import argparse
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Sequence, Union
+
+from . import EXTENSOES_ACEITAS
+from .cache import diretorio_cache, hash_arquivo
+
+
+# Intervalo entre varreduras (s)
+INTERVALO_VARREDURA = float(os.environ.get("AUDIPER_MONITOR_INTERVALO", "5"))
+
+# Tempo sem alteração de tamanho/data para considerar a cópia concluída (s)
+TEMPO_ESTABILIDADE = float(os.environ.get("AUDIPER_MONITOR_ESTABILIDADE", "10"))
+
+MAXIMO_TRABALHADORES = int(os.environ.get("AUDIPER_MONITOR_TRABALHADORES", "2"))
+
+# Arquivos aguardando ou em processamento, por trabalhador (o excedente
+# espera a próxima varredura)
+FILA_POR_TRABALHADOR = 2
+
+# Nomes ignorados: temporários de cópia e arquivos ocultos
+PREFIXOS_IGNORADOS = (".", "~$")
+SUFIXOS_IGNORADOS = (".tmp", ".part", ".crdownload", ".partial")
+
+# Situações de um arquivo no estado
+CONCLUIDO = "concluido"
+DUPLICADO = "duplicado"
+ERRO = "erro"
+PROCESSANDO = "processando"
+
+VERSAO_ESTADO = 1
+
+logger = logging.getLogger(__name__)
+
+
+def arquivo_estado_padrao() -> Path:
+    """Arquivo de estado do monitor, junto ao cache"""
+    return diretorio_cache() / "monitor" / "estado.json"
+
+
+def _agora() -> str:
+    return datetime.now().isoformat(timespec="seconds")
+
+
+def _assinatura(stat: os.stat_result) -> Dict[str, int]:
+    return {"tamanho": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def arquivo_aceito(caminho: Path) -> bool:
+    """Extensão aceita e nome que não seja temporário ou oculto"""
+    nome = caminho.name.lower()
+    if nome.startswith(PREFIXOS_IGNORADOS) or nome.endswith(SUFIXOS_IGNORADOS):
+        return False
+    return caminho.suffix.lower().lstrip(".") in EXTENSOES_ACEITAS
+
+
+class EstadoMonitor:
+    """
+    Estado persistente do monitor (JSON):
+
+        arquivos:  caminho -> assinatura, hash, situação, escriturações
+        conteudos: hash de arquivo concluído -> caminho processado
+
+    Cada alteração regrava o arquivo inteiro (temporário + os.replace).
+    """
+
+    def __init__(self, caminho: Optional[Union[str, Path]] = None):
+        self.caminho = Path(caminho or arquivo_estado_padrao())
+        self._trava = threading.Lock()
+        self.arquivos: Dict[str, Dict[str, Any]] = {}
+        self.conteudos: Dict[str, str] = {}
+        self._carregar()
+
+    def _carregar(self) -> None:
+        if not self.caminho.exists():
+            return
+        with open(self.caminho, encoding="utf-8") as arquivo:
+            dados = json.load(arquivo)
+        self.arquivos = dados.get("arquivos", {})
+        self.conteudos = dados.get("conteudos", {})
+
+        # Interrompidos por um reinício voltam para a fila
+        for registro in self.arquivos.values():
+            if registro.get("situacao") == PROCESSANDO:
+                registro["situacao"] = None
+
+    def _gravar(self) -> None:
+        self.caminho.parent.mkdir(parents=True, exist_ok=True)
+        dados = {"versao": VERSAO_ESTADO, "arquivos": self.arquivos, "conteudos": self.conteudos}
+
+        descritor, temporario = tempfile.mkstemp(dir=self.caminho.parent, suffix=".tmp")
+        try:
+            with os.fdopen(descritor, "w", encoding="utf-8") as arquivo:
+                json.dump(dados, arquivo, ensure_ascii=False, indent=1)
+                arquivo.flush()
+                os.fsync(arquivo.fileno())
+            os.replace(temporario, self.caminho)
+        except BaseException:
+            os.unlink(temporario)
+            raise
+
+    def pendente(self, caminho: str, assinatura: Dict[str, int]) -> bool:
+        """Arquivo novo, alterado desde o último processamento ou interrompido"""
+        with self._trava:
+            registro = self.arquivos.get(caminho)
+        if registro is None:
+            return True
+        mesma_versao = all(registro.get(c) == v for c, v in assinatura.items())
+        # Erros só são tentados de novo se o arquivo mudar
+        return not mesma_versao or registro.get("situacao") is None
+
+    def reservar(self, caminho: str, assinatura: Dict[str, int], hash_conteudo: str) -> Optional[str]:
+        """
+        Marca o arquivo como em processamento. Se o conteúdo já foi (ou está
+        sendo) processado, registra a duplicata e retorna o caminho de origem.
+        """
+        with self._trava:
+            original = self.conteudos.get(hash_conteudo)
+            anterior = self.arquivos.get(caminho, {})
+
+            # Mesmo arquivo só com a data alterada (ex.: copiado de novo)
+            if original == caminho and anterior.get("situacao") == CONCLUIDO:
+                anterior.update(assinatura, atualizado_em=_agora())
+                self._gravar()
+                return caminho
+
+            if original is None:
+                original = next(
+                    (c for c, r in self.arquivos.items()
+                     if c != caminho and r.get("hash") == hash_conteudo and r.get("situacao") == PROCESSANDO),
+                    None,
+                )
+
+            registro = {**assinatura, "hash": hash_conteudo, "atualizado_em": _agora()}
+            if original is not None and original != caminho:
+                registro.update(situacao=DUPLICADO, original=original)
+            else:
+                registro.update(situacao=PROCESSANDO)
+                original = None
+
+            self.arquivos[caminho] = registro
+            self._gravar()
+            return original
+
+    def concluir(self, caminho: str, escrituracoes: List[Dict[str, Any]]) -> None:
+        with self._trava:
+            registro = self.arquivos[caminho]
+            registro.update(situacao=CONCLUIDO, escrituracoes=escrituracoes, atualizado_em=_agora())
+            registro.pop("mensagem", None)
+            self.conteudos[registro["hash"]] = caminho
+            self._gravar()
+
+    def falhar(self, caminho: str, assinatura: Dict[str, int], mensagem: str) -> None:
+        with self._trava:
+            registro = self.arquivos.setdefault(caminho, {})
+            registro.update(assinatura, situacao=ERRO, mensagem=mensagem, atualizado_em=_agora())
+            self._gravar()
+
+    def resumo(self) -> Dict[str, int]:
+        """Quantidade de arquivos por situação"""
+        with self._trava:
+            contagem: Dict[str, int] = {}
+            for registro in self.arquivos.values():
+                situacao = registro.get("situacao") or "pendente"
+                contagem[situacao] = contagem.get(situacao, 0) + 1
+            return contagem
+
+
+def processar_arquivo(caminho: Path, armazem=None) -> List[Dict[str, Any]]:
+    """
+    Parse, testes e gravação (cache em disco + armazém) de todas as
+    escriturações de um arquivo.
+
+    Returns:
+        Uma entrada por escrituração: nome, hash, CNPJ, ano, status e achados
+    """
+
+    from .entrada import processar_arquivos_sped
+    from .pipeline import executar_testes
+    from .armazenamento import ArmazemAuditoria, somente_digitos, ano_referencia
+
+    armazem = armazem or ArmazemAuditoria()
+    escrituracoes = []
+
+    for processado in processar_arquivos_sped(caminho, caminho.name):
+        resultado = {"nome": processado.nome, "hash_conteudo": processado.hash_conteudo, "status": processado.status}
+
+        if "✅" in processado.status:
+            achados = executar_testes(
+                processado.hash_conteudo, processado.df_saldos, processado.df_plano,
+                demonstracoes=processado.demonstracoes,
+            )
+            resultado["achados"] = achados.height
+            if processado.empresa:
+                try:
+                    armazem.gravar(processado.empresa, processado.df_plano, processado.df_saldos, achados)
+                except ValueError as erro:
+                    # Cache e achados valem; só o armazém depende do ano
+                    resultado["status"] += f" (não gravado no armazém: {erro})"
+                else:
+                    resultado["cnpj"] = somente_digitos(processado.empresa.cnpj)
+                    resultado["ano"] = ano_referencia(processado.empresa)
+
+        escrituracoes.append(resultado)
+
+    return escrituracoes
+
+
+class MonitorPasta:
+    """
+    Monitora uma ou mais pastas e processa os arquivos SPED depositados.
+
+    Exemplo:
+        monitor = MonitorPasta(["/srv/ecd/entrada"], trabalhadores=2)
+        monitor.executar()          # até monitor.parar() ou SIGTERM
+
+        monitor.executar_ciclo()    # uma varredura (ex.: agendador externo)
+    """
+
+    def __init__(
+        self,
+        pastas: Sequence[Union[str, Path]],
+        estado: Optional[Union[str, Path, EstadoMonitor]] = None,
+        armazem=None,
+        trabalhadores: int = MAXIMO_TRABALHADORES,
+        intervalo: float = INTERVALO_VARREDURA,
+        estabilidade: float = TEMPO_ESTABILIDADE,
+        recursivo: bool = False,
+    ):
+        self.pastas = [Path(p).resolve() for p in pastas]
+        self.estado = estado if isinstance(estado, EstadoMonitor) else EstadoMonitor(estado)
+        self.armazem = armazem
+        self.trabalhadores = max(1, trabalhadores)
+        self.intervalo = intervalo
+        self.estabilidade = estabilidade
+        self.recursivo = recursivo
+
+        self._executor = ThreadPoolExecutor(max_workers=self.trabalhadores, thread_name_prefix="monitor")
+        self._em_andamento: Dict[str, Future] = {}
+        # caminho -> (assinatura, instante em que foi vista pela primeira vez)
+        self._observados: Dict[str, tuple] = {}
+        self._parar = threading.Event()
+
+    # ------------------------------------------
+    # Varredura
+    # ------------------------------------------
+    def _listar(self) -> List[Path]:
+        padrao = "**/*" if self.recursivo else "*"
+        arquivos = []
+        for pasta in self.pastas:
+            if pasta.is_dir():
+                arquivos.extend(p for p in pasta.glob(padrao) if arquivo_aceito(p))
+        return sorted(arquivos)
+
+    def varrer(self) -> List[tuple]:
+        """Arquivos pendentes cuja cópia terminou: [(caminho, assinatura)]"""
+
+        agora = time.monotonic()
+        vistos = set()
+        estaveis = []
+
+        for caminho in self._listar():
+            chave = str(caminho)
+            try:
+                stat = caminho.stat()
+            except OSError:
+                continue  # Removido entre a listagem e o stat
+            if not caminho.is_file():
+                continue
+
+            vistos.add(chave)
+            assinatura = _assinatura(stat)
+            if chave in self._em_andamento or not self.estado.pendente(chave, assinatura):
+                continue
+
+            anterior = self._observados.get(chave)
+            if anterior is None or anterior[0] != assinatura:
+                self._observados[chave] = (assinatura, agora)
+                continue
+            if agora - anterior[1] >= self.estabilidade:
+                estaveis.append((caminho, assinatura))
+
+        # Esquece arquivos que saíram da pasta
+        for chave in set(self._observados) - vistos:
+            del self._observados[chave]
+
+        return estaveis
+
+    # ------------------------------------------
+    # Processamento
+    # ------------------------------------------
+    def _processar(self, caminho: Path, assinatura: Dict[str, int]) -> None:
+        chave = str(caminho)
+        try:
+            hash_conteudo = hash_arquivo(chave)
+            if _assinatura(caminho.stat()) != assinatura:
+                return  # Alterado durante o hash: volta na próxima varredura
+
+            original = self.estado.reservar(chave, assinatura, hash_conteudo)
+            if original == chave:
+                logger.info("%s: conteúdo inalterado, ignorado", caminho.name)
+                return
+            if original is not None:
+                logger.info("%s: mesmo conteúdo de %s, ignorado", caminho.name, original)
+                return
+
+            inicio = time.perf_counter()
+            escrituracoes = processar_arquivo(caminho, self.armazem)
+            self.estado.concluir(chave, escrituracoes)
+            logger.info(
+                "%s: %d escrituração(ões) em %.1fs",
+                caminho.name, len(escrituracoes), time.perf_counter() - inicio,
+            )
+        except Exception as erro:
+            logger.exception("%s: falha no processamento", caminho.name)
+            self.estado.falhar(chave, assinatura, f"{type(erro).__name__}: {erro}")
+
+    def _recolher(self) -> None:
+        for chave, futuro in list(self._em_andamento.items()):
+            if futuro.done():
+                del self._em_andamento[chave]
+                self._observados.pop(chave, None)
+
+    def executar_ciclo(self) -> int:
+        """Uma varredura: enfileira os arquivos estáveis até o limite da fila"""
+
+        self._recolher()
+        vagas = self.trabalhadores * FILA_POR_TRABALHADOR - len(self._em_andamento)
+        enfileirados = 0
+
+        for caminho, assinatura in self.varrer():
+            if enfileirados >= vagas:
+                break
+            self._em_andamento[str(caminho)] = self._executor.submit(self._processar, caminho, assinatura)
+            enfileirados += 1
+
+        return enfileirados
+
+    def aguardar(self) -> None:
+        """Espera o término dos arquivos em processamento"""
+        for futuro in list(self._em_andamento.values()):
+            futuro.result()
+        self._recolher()
+
+    def processar_pendentes(self) -> Dict[str, int]:
+        """Processa os arquivos já presentes nas pastas e encerra o pool"""
+
+        # Duas observações separadas pelo tempo de estabilidade
+        self.varrer()
+        time.sleep(self.estabilidade)
+        try:
+            while self.executar_ciclo():
+                self.aguardar()
+        finally:
+            self._executor.shutdown(wait=True)
+        return self.estado.resumo()
+
+    def executar(self) -> None:
+        """Varre as pastas a cada intervalo até parar() (ou SIGINT/SIGTERM na CLI)"""
+
+        logger.info("Monitorando %s", ", ".join(map(str, self.pastas)))
+        try:
+            while not self._parar.is_set():
+                self.executar_ciclo()
+                self._parar.wait(self.intervalo)
+        finally:
+            # Termina os arquivos em andamento; os da fila voltam após o reinício
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            logger.info("Monitor encerrado: %s", self.estado.resumo())
+
+    def parar(self) -> None:
+        self._parar.set()
+
+
+def main(argumentos: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Processa as ECDs depositadas nas pastas monitoradas")
+    parser.add_argument("pastas", nargs="+", help="Pastas monitoradas")
+    parser.add_argument("--estado", help="Arquivo de estado (padrão: <cache>/monitor/estado.json)")
+    parser.add_argument("--armazem", help="Diretório do armazém (padrão: AUDIPER_ARMAZEM)")
+    parser.add_argument("--trabalhadores", type=int, default=MAXIMO_TRABALHADORES)
+    parser.add_argument("--intervalo", type=float, default=INTERVALO_VARREDURA)
+    parser.add_argument("--estabilidade", type=float, default=TEMPO_ESTABILIDADE)
+    parser.add_argument("--recursivo", action="store_true", help="Inclui subpastas")
+    parser.add_argument("--uma-vez", action="store_true", help="Processa os arquivos presentes e sai")
+    args = parser.parse_args(argumentos)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    armazem = None
+    if args.armazem:
+        from .armazenamento import ArmazemAuditoria
+        armazem = ArmazemAuditoria(args.armazem)
+
+    monitor = MonitorPasta(
+        args.pastas,
+        estado=args.estado,
+        armazem=armazem,
+        trabalhadores=args.trabalhadores,
+        intervalo=args.intervalo,
+        estabilidade=args.estabilidade,
+        recursivo=args.recursivo,
+    )
+
+    if args.uma_vez:
+        resumo = monitor.processar_pendentes()
+        logger.info("Concluído: %s", resumo)
+        return 1 if resumo.get(ERRO) else 0
+
+    for sinal in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sinal, lambda *_: monitor.parar())
+    monitor.executar()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
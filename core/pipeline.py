@@ -0,0 +1,79 @@
+"""
+Pipeline de Auditoria
+Audiper - Sistema de Auditoria Digital
+
+Sequência de testes executada sobre cada escrituração processada, comum à
+interface (upload) e ao monitor de pastas:
+
+- saldos invertidos (I155);
+- saldos invertidos e variação por centro de custo;
+- anomalias mês a mês (histórico da conta e contas do mesmo grupo);
+- conciliação J100/J150 × I155, com as demonstrações extraídas no parse
+  (ou gravadas no cache junto com ele);
+- regras declarativas do escritório (AUDIPER_REGRAS), quando configuradas.
+
+A escrituração inteira é uma etapa do orçamento de memória (core.execucao):
+acima do orçamento, agregações e filtros dos testes rodam no engine
+streaming, com os mesmos achados.
+"""
+
+import polars as pl
+from typing import Optional
+
+from .testes_auditoria import teste_saldos_invertidos
+from .centros_custo import (
+    gerar_cubo_centros_custo,
+    teste_saldos_invertidos_centro_custo,
+    teste_variacao_centro_custo,
+)
+from .anomalias import teste_anomalias_mensais
+from .demonstracoes import DemonstracoesContabeis, demonstracoes_do_cache, teste_conciliacao_demonstracoes
+from .regras import ConjuntoRegras, regras_padrao, teste_regras
+from .achados import combinar_achados
+from .execucao import execucao, tamanho_estimado
+
+
+def executar_testes(
+    hash_conteudo: str,
+    df_saldos: pl.DataFrame,
+    df_plano: pl.DataFrame,
+    regras: Optional[ConjuntoRegras] = None,
+    demonstracoes: Optional[DemonstracoesContabeis] = None,
+) -> pl.DataFrame:
+    """
+    Executa todos os testes de uma escrituração.
+
+    Args:
+        hash_conteudo: Hash do conteúdo (chave dos cubos e do cache do original)
+        df_saldos: DataFrame de saldos enriquecido (I155)
+        df_plano: DataFrame do plano de contas (I050)
+        regras: Regras declarativas (padrão: as de AUDIPER_REGRAS)
+        demonstracoes: J100/J150 já extraídos (ArquivoProcessado.demonstracoes);
+            se None, lidos do cache
+
+    Returns:
+        Achados combinados (modelo de core.achados)
+    """
+
+    with execucao(tamanho_estimado(df_saldos, df_plano)):
+        achados_saldos, _ = teste_saldos_invertidos(df_saldos)
+        cubo_cc = gerar_cubo_centros_custo(df_saldos, df_plano, chave=hash_conteudo)
+        achados_cc, _ = teste_saldos_invertidos_centro_custo(cubo_cc)
+        achados_variacao, _ = teste_variacao_centro_custo(cubo_cc)
+        achados_anomalias, _ = teste_anomalias_mensais(df_saldos, df_plano)
+        testes = [achados_saldos, achados_cc, achados_variacao, achados_anomalias]
+
+        if demonstracoes is None:
+            demonstracoes = demonstracoes_do_cache(hash_conteudo)
+        if demonstracoes is not None:
+            achados_demonstracoes, _ = teste_conciliacao_demonstracoes(
+                demonstracoes, df_saldos, df_plano, chave=hash_conteudo
+            )
+            testes.append(achados_demonstracoes)
+
+        regras = regras or regras_padrao()
+        if regras is not None:
+            achados_regras, _ = teste_regras(df_saldos, regras)
+            testes.append(achados_regras)
+
+    return combinar_achados(testes)
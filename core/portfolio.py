@@ -0,0 +1,432 @@
+"""
+Auditoria de Portfólio
+Audiper - Sistema de Auditoria Digital
+
+Processa as ECDs de um grupo econômico (dezenas de CNPJs) em paralelo, um
+arquivo por processo, e consolida o resultado:
+
+- achados por empresa (mesma sequência de testes do upload: core.pipeline);
+- totais por empresa e do grupo;
+- conciliação intercompany: as partidas (I250) em contas patrimoniais com
+  participante (0150) cujo CNPJ pertence ao portfólio são somadas por
+  contraparte; o saldo movimentado por A contra B deve espelhar o de B
+  contra A.
+
+Os processos devolvem os DataFrames em Arrow IPC (como o leitor paralelo):
+o processo principal só decodifica os buffers, sem reconstruir objetos
+Python linha a linha. Plano e saldos só voltam quando o principal vai
+gravá-los no armazém; cache e achados ficam prontos para o app.
+"""
+
+import io
+import os
+import time
+import multiprocessing
+import polars as pl
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Union
+
+from .leitor_sped import DadosEmpresa, criar_decodificador, detectar_codificacao_fonte, iterar_linhas
+from .cache import existe_bruto, abrir_bruto
+from .layouts import compilar_plano
+from .achados import combinar_achados, estatisticas_achados, achados_vazios
+
+
+MAXIMO_PROCESSOS = 16
+
+# Naturezas patrimoniais (I050.COD_NAT): 01 Ativo, 02 Passivo
+NATUREZAS_PATRIMONIAIS = ["01", "02"]
+
+# Diferença tolerada entre os dois lados de um par intercompany (R$)
+TOLERANCIA_INTERCOMPANY = 1.0
+
+# Colunas extraídas de 0150/I250: o histórico e os demais campos do diário
+# não são decodificados
+CAMPOS_PARTICIPANTES = {
+    "0150": ("cod_participante", "cnpj", "nome"),
+    "I250": ("cod_conta", "valor", "ind_dc", "cod_participante"),
+}
+
+ESQUEMA_PARTICIPANTES = {
+    "cnpj_contraparte": pl.String,
+    "nome_contraparte": pl.String,
+    "valor": pl.Float64,
+    "partidas": pl.UInt32,
+}
+
+
+def processos_disponiveis() -> int:
+    """Núcleos disponíveis para este processo (respeita limites do contêiner)"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:  # pragma: no cover - Windows/macOS
+        return os.cpu_count() or 1
+
+
+def _somente_digitos(valor: pl.Expr) -> pl.Expr:
+    return valor.str.replace_all(r"\D", "")
+
+
+# ============================================
+# PARTICIPANTES (0150 × I250)
+# ============================================
+
+def movimentos_participantes(hash_conteudo: str, df_plano: pl.DataFrame) -> pl.DataFrame:
+    """
+    Movimento líquido (D+/C-) das contas patrimoniais por participante com
+    CNPJ, a partir do original guardado no cache (vazio se indisponível).
+    O portfólio extrai 0150/I250 já na passada do parse
+    (participantes_dos_quadros); esta releitura serve aos demais chamadores.
+    """
+
+    if not existe_bruto(hash_conteudo) or "cod_natureza" not in df_plano.columns:
+        return pl.DataFrame(schema=ESQUEMA_PARTICIPANTES)
+
+    try:
+        with abrir_bruto(hash_conteudo) as fluxo:
+            decodificar = criar_decodificador(detectar_codificacao_fonte(fluxo))
+            quadros = compilar_plano("ECD", tuple(CAMPOS_PARTICIPANTES)).coletar(
+                iterar_linhas(fluxo), decodificar, CAMPOS_PARTICIPANTES
+            )
+    except (ImportError, OSError):
+        return pl.DataFrame(schema=ESQUEMA_PARTICIPANTES)
+
+    return participantes_dos_quadros(quadros, df_plano)
+
+
+def participantes_dos_quadros(quadros: Dict[str, pl.DataFrame], df_plano: pl.DataFrame) -> pl.DataFrame:
+    """Movimento por participante a partir dos quadros 0150 e I250 já extraídos"""
+
+    if "cod_natureza" not in df_plano.columns:
+        return pl.DataFrame(schema=ESQUEMA_PARTICIPANTES)
+
+    participantes = (
+        quadros["0150"].lazy()
+        .select(
+            "cod_participante",
+            _somente_digitos(pl.col("cnpj")).alias("cnpj_contraparte"),
+            pl.col("nome").alias("nome_contraparte"),
+        )
+        .filter(pl.col("cnpj_contraparte").str.len_chars() == 14)
+        .unique("cod_participante", keep="last")
+    )
+    patrimoniais = (
+        df_plano.lazy()
+        .filter(pl.col("cod_natureza").is_in(NATUREZAS_PATRIMONIAIS))
+        .select("cod_conta")
+        .unique()
+    )
+
+    return (
+        quadros["I250"].lazy()
+        .filter(pl.col("cod_participante").fill_null("") != "")
+        .join(patrimoniais, on="cod_conta", how="semi")
+        .join(participantes, on="cod_participante", how="inner")
+        .group_by("cnpj_contraparte")
+        .agg(
+            pl.col("nome_contraparte").first(),
+            pl.when(pl.col("ind_dc") == "C").then(-pl.col("valor")).otherwise(pl.col("valor"))
+            .sum().round(2).alias("valor"),
+            pl.len().cast(pl.UInt32).alias("partidas"),
+        )
+        .sort("cnpj_contraparte")
+        .collect()
+    )
+
+
+# ============================================
+# PROCESSAMENTO (WORKER)
+# ============================================
+
+def _serializar(df: pl.DataFrame) -> bytes:
+    buffer = io.BytesIO()
+    df.write_ipc(buffer)
+    return buffer.getvalue()
+
+
+def _ler(dados: Optional[bytes]) -> pl.DataFrame:
+    return pl.read_ipc(io.BytesIO(dados)) if dados else pl.DataFrame()
+
+
+def _auditar_arquivo(caminho: str, enviar_dados: bool) -> List[Dict[str, Any]]:
+    """
+    Worker: parse, testes e participantes de todas as escriturações de um
+    arquivo, com os DataFrames em Arrow IPC. Erros viram status da
+    escrituração: um arquivo com problema não interrompe o portfólio.
+    """
+
+    from .entrada import processar_arquivos_sped
+    from .pipeline import executar_testes
+
+    resultados = []
+    try:
+        for processado in processar_arquivos_sped(caminho, Path(caminho).name, extras=CAMPOS_PARTICIPANTES):
+            resultado = {
+                "arquivo": caminho,
+                "nome": processado.nome,
+                "hash_conteudo": processado.hash_conteudo,
+                "status": processado.status,
+                "empresa": processado.empresa.to_dict() if processado.empresa else None,
+            }
+
+            if "✅" in processado.status:
+                achados = executar_testes(
+                    processado.hash_conteudo, processado.df_saldos, processado.df_plano,
+                    demonstracoes=processado.demonstracoes,
+                )
+                resultado.update(
+                    qtd_contas=processado.df_plano.height,
+                    qtd_saldos=processado.df_saldos.height,
+                    achados=_serializar(achados),
+                    participantes=_serializar(
+                        participantes_dos_quadros(processado.extras, processado.df_plano)
+                    ),
+                )
+                if enviar_dados:
+                    resultado.update(
+                        plano=_serializar(processado.df_plano),
+                        saldos=_serializar(processado.df_saldos),
+                    )
+
+            resultados.append(resultado)
+    except Exception as erro:
+        resultados.append({
+            "arquivo": caminho,
+            "nome": Path(caminho).name,
+            "hash_conteudo": "",
+            "status": f"❌ Erro ao processar: {erro}",
+            "empresa": None,
+        })
+
+    return resultados
+
+
+# ============================================
+# RESULTADO
+# ============================================
+
+@dataclass
+class EmpresaPortfolio:
+    """Uma escrituração do portfólio"""
+
+    nome: str
+    hash_conteudo: str
+    status: str
+    empresa: Optional[DadosEmpresa] = None
+    achados: pl.DataFrame = field(default_factory=achados_vazios)
+    participantes: pl.DataFrame = field(default_factory=lambda: pl.DataFrame(schema=ESQUEMA_PARTICIPANTES))
+    qtd_contas: int = 0
+    qtd_saldos: int = 0
+
+    @property
+    def sucesso(self) -> bool:
+        return "✅" in self.status
+
+    @property
+    def cnpj(self) -> str:
+        return "".join(c for c in self.empresa.cnpj if c.isdigit()) if self.empresa else ""
+
+
+@dataclass
+class ResultadoPortfolio:
+    """Escriturações do portfólio (na ordem dos arquivos) e consolidações"""
+
+    empresas: List[EmpresaPortfolio]
+    segundos: float = 0.0
+    processos: int = 1
+
+    @property
+    def processadas(self) -> List[EmpresaPortfolio]:
+        return [e for e in self.empresas if e.sucesso]
+
+    def achados(self) -> pl.DataFrame:
+        """Achados de todas as empresas, com CNPJ e razão social"""
+        return combinar_achados([
+            e.achados.with_columns(
+                pl.lit(e.cnpj).alias("cnpj"),
+                pl.lit(e.empresa.nome if e.empresa else e.nome).alias("empresa"),
+            )
+            for e in self.processadas
+        ])
+
+    def totais(self) -> pl.DataFrame:
+        """Uma linha por escrituração: situação, volume e achados por severidade"""
+
+        linhas = []
+        for e in self.empresas:
+            stats = estatisticas_achados(e.achados)
+            linhas.append({
+                "cnpj": e.cnpj,
+                "empresa": e.empresa.nome if e.empresa else "",
+                "arquivo": e.nome,
+                "periodo": f"{e.empresa.data_inicio} a {e.empresa.data_fim}" if e.empresa else "",
+                "status": e.status,
+                "contas": e.qtd_contas,
+                "saldos": e.qtd_saldos,
+                "achados": stats["total"],
+                "criticos": stats["criticos"],
+                "atencao": stats["atencao"],
+                "info": stats["info"],
+                "valor_achados": float(e.achados["valor"].abs().sum()) if not e.achados.is_empty() else 0.0,
+            })
+
+        return pl.DataFrame(linhas, schema={
+            "cnpj": pl.String, "empresa": pl.String, "arquivo": pl.String, "periodo": pl.String,
+            "status": pl.String, "contas": pl.Int64, "saldos": pl.Int64, "achados": pl.Int64,
+            "criticos": pl.Int64, "atencao": pl.Int64, "info": pl.Int64, "valor_achados": pl.Float64,
+        })
+
+    def intercompany(self, tolerancia: float = TOLERANCIA_INTERCOMPANY) -> pl.DataFrame:
+        """
+        Pares de empresas do portfólio com movimento entre si: o valor
+        lançado por A contra B somado ao de B contra A deve ser zero (o
+        débito de um é o crédito do outro).
+        """
+
+        cnpjs = [e.cnpj for e in self.processadas]
+        lados = [
+            e.participantes.lazy().select(
+                pl.lit(e.cnpj).alias("cnpj"),
+                "cnpj_contraparte",
+                "valor",
+                "partidas",
+            )
+            for e in self.processadas
+        ]
+        if not lados:
+            return pl.DataFrame()
+
+        movimentos = (
+            pl.concat(lados)
+            .filter(pl.col("cnpj_contraparte").is_in(cnpjs) & (pl.col("cnpj") != pl.col("cnpj_contraparte")))
+            .group_by("cnpj", "cnpj_contraparte")
+            .agg(pl.col("valor").sum(), pl.col("partidas").sum())
+        )
+        espelho = movimentos.select(
+            pl.col("cnpj").alias("cnpj_contraparte"),
+            pl.col("cnpj_contraparte").alias("cnpj"),
+            pl.col("valor").alias("valor_contraparte"),
+            pl.col("partidas").alias("partidas_contraparte"),
+        )
+        nomes = pl.DataFrame(
+            {
+                "cnpj": cnpjs,
+                "empresa": [e.empresa.nome if e.empresa else e.nome for e in self.processadas],
+            },
+            schema={"cnpj": pl.String, "empresa": pl.String},
+        ).unique("cnpj").lazy()
+
+        return (
+            movimentos
+            .join(espelho, on=["cnpj", "cnpj_contraparte"], how="full", coalesce=True)
+            # Cada par uma vez (A < B)
+            .filter(pl.col("cnpj") < pl.col("cnpj_contraparte"))
+            .with_columns(
+                pl.col("valor").fill_null(0.0),
+                pl.col("valor_contraparte").fill_null(0.0),
+                pl.col("partidas").fill_null(0),
+                pl.col("partidas_contraparte").fill_null(0),
+            )
+            .with_columns((pl.col("valor") + pl.col("valor_contraparte")).round(2).alias("diferenca"))
+            .with_columns((pl.col("diferenca").abs() <= tolerancia).alias("conciliado"))
+            .join(nomes, on="cnpj", how="left")
+            .join(nomes.rename({"cnpj": "cnpj_contraparte", "empresa": "empresa_contraparte"}),
+                  on="cnpj_contraparte", how="left")
+            .select(
+                "cnpj", "empresa", "cnpj_contraparte", "empresa_contraparte",
+                "valor", "valor_contraparte", "diferenca", "conciliado",
+                "partidas", "partidas_contraparte",
+            )
+            .sort(pl.col("diferenca").abs(), "cnpj", "cnpj_contraparte", descending=[True, False, False])
+            .collect()
+        )
+
+
+# ============================================
+# AUDITORIA DO PORTFÓLIO
+# ============================================
+
+def auditar_portfolio(
+    arquivos: Sequence[Union[str, Path]],
+    processos: Optional[int] = None,
+    armazem=None,
+    ao_concluir: Optional[Callable[[int, int, str], None]] = None,
+) -> ResultadoPortfolio:
+    """
+    Audita várias ECDs em paralelo.
+
+    Args:
+        arquivos: Caminhos dos arquivos (texto ou compactados; um .zip pode
+            conter várias escriturações)
+        processos: Tamanho do pool (padrão: núcleos disponíveis, até 16 e
+            até o número de arquivos)
+        armazem: ArmazemAuditoria onde gravar plano, saldos e achados de cada
+            empresa (None: não grava)
+        ao_concluir: Chamada a cada arquivo concluído com (concluídos,
+            total, nome), ex.: barra de progresso
+
+    Returns:
+        ResultadoPortfolio com as escriturações na ordem dos arquivos
+    """
+
+    inicio = time.perf_counter()
+    arquivos = [str(a) for a in arquivos]
+    processos = max(1, min(processos or processos_disponiveis(), MAXIMO_PROCESSOS, len(arquivos) or 1))
+    enviar_dados = armazem is not None
+
+    # Maiores primeiro: o último arquivo a começar é pequeno e o pool não
+    # fica esperando por um processo só
+    ordem = sorted(range(len(arquivos)), key=lambda i: -os.path.getsize(arquivos[i]))
+    resultados: List[List[Dict[str, Any]]] = [[] for _ in arquivos]
+
+    def receber(indice: int, itens: List[Dict[str, Any]], concluidos: int) -> None:
+        resultados[indice] = [_montar_empresa(item, armazem) for item in itens]
+        if ao_concluir is not None:
+            ao_concluir(concluidos, len(arquivos), Path(arquivos[indice]).name)
+
+    if processos == 1:
+        for concluidos, indice in enumerate(ordem, start=1):
+            receber(indice, _auditar_arquivo(arquivos[indice], enviar_dados), concluidos)
+    else:
+        # spawn: processos limpos (fork de um processo com threads do Polars/Streamlit é inseguro)
+        contexto = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=processos, mp_context=contexto) as executor:
+            futuros = {
+                executor.submit(_auditar_arquivo, arquivos[indice], enviar_dados): indice
+                for indice in ordem
+            }
+            for concluidos, futuro in enumerate(as_completed(futuros), start=1):
+                receber(futuros[futuro], futuro.result(), concluidos)
+
+    return ResultadoPortfolio(
+        empresas=[empresa for itens in resultados for empresa in itens],
+        segundos=time.perf_counter() - inicio,
+        processos=processos,
+    )
+
+
+def _montar_empresa(item: Dict[str, Any], armazem) -> EmpresaPortfolio:
+    """Decodifica o resultado do worker e grava no armazém, se pedido"""
+
+    empresa = DadosEmpresa(**item["empresa"]) if item.get("empresa") else None
+    resultado = EmpresaPortfolio(
+        nome=item["nome"],
+        hash_conteudo=item["hash_conteudo"],
+        status=item["status"],
+        empresa=empresa,
+        qtd_contas=item.get("qtd_contas", 0),
+        qtd_saldos=item.get("qtd_saldos", 0),
+    )
+    if "achados" in item:
+        resultado.achados = _ler(item["achados"])
+        resultado.participantes = _ler(item["participantes"])
+
+    if armazem is not None and empresa is not None and resultado.sucesso:
+        try:
+            armazem.gravar(empresa, _ler(item.get("plano")), _ler(item.get("saldos")), resultado.achados)
+        except (OSError, ValueError) as erro:
+            resultado.status += f" (não gravado no armazém: {erro})"
+
+    return resultado
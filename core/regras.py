@@ -0,0 +1,548 @@
+"""
+Regras Declarativas de Auditoria
+Audiper - Sistema de Auditoria Digital
+
+Regras definidas em JSON ou YAML (sem código Python), compiladas uma vez em
+expressões Polars e avaliadas em lote sobre os saldos (I155 enriquecido):
+
+    {
+      "teste": "Regras do Cliente X",
+      "condicoes": {"tipo_conta": "A"},
+      "regras": [
+        {
+          "id": "CLX-01",
+          "achado": "Caixa com saldo credor",
+          "severidade": "CRÍTICO",
+          "recomendacao": "Verificar lançamentos de saída sem suprimento.",
+          "condicoes": {
+            "conta": {"prefixo": "1.01.01"},
+            "descricao": {"contem": ["caixa"]},
+            "ind_saldo_fin": "C",
+            "saldo_final": {">=": 1000}
+          }
+        }
+      ]
+    }
+
+Condições (todas devem valer; "qualquer" aceita uma lista de grupos
+alternativos):
+
+- valor simples (igualdade) ou lista (pertence à lista);
+- operadores: =, !=, >, >=, <, <=, entre [mín, máx], em, fora, prefixo,
+  contem / nao_contem (sem acentos e sem distinção de maiúsculas), regex,
+  nulo; "absoluto": true compara o valor absoluto;
+- colunas derivadas de variação entre períodos (saldo com sinal D+/C-):
+  saldo_anterior, variacao e variacao_percentual.
+
+Todas as regras de um conjunto são avaliadas em uma única passada: cada
+regra vira uma coluna booleana da mesma consulta e as linhas verdadeiras de
+cada coluna viram achados. Os conjuntos compilados são memorizados pelo
+hash da definição e as regras entram na tabela de regras (textos e
+severidade dos achados).
+
+Os ids são exclusivos: um conjunto não pode reutilizar o id de uma regra
+interna (SI-01, AM-02...) nem o de outro conjunto já carregado no processo;
+só o mesmo arquivo, recarregado após edição, substitui as próprias regras.
+"""
+
+import os
+import json
+import threading
+import polars as pl
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import date
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set, Tuple, Union
+
+from .achados import (
+    Regra,
+    Severidade,
+    registrar_regra,
+    obter_regra,
+    severidade_da_regra,
+    estatisticas_achados,
+    frame_achados,
+    achados_vazios,
+)
+from .cache import novo_hash
+from .classificador import normalizar_texto
+from .cubo_saldos import saldo_com_sinal, saldo_periodo_anterior
+from .execucao import coletar, tamanho_estimado
+
+try:
+    import yaml
+except ImportError:  # pragma: no cover - opcional, só para regras em YAML
+    yaml = None
+
+
+# Arquivo de regras aplicado a todas as escriturações (JSON ou YAML)
+ARQUIVO_REGRAS = os.environ.get("AUDIPER_REGRAS", "")
+
+# Extensões dos arquivos de regras (um texto sem elas nunca é caminho)
+EXTENSOES_REGRAS = (".json", ".yaml", ".yml")
+
+TESTE_PADRAO = "Regras Personalizadas"
+
+# Conjuntos compilados mantidos em memória (LRU)
+MAXIMO_CONJUNTOS_MEMORIZADOS = 32
+
+# Nomes alternativos aceitos nas condições
+ALIASES = {
+    "conta": "cod_conta",
+    "indicador": "ind_saldo_fin",
+    "dc": "ind_saldo_fin",
+    "saldo": "saldo_final",
+    "retificadora": "eh_retificadora",
+}
+
+COLUNAS_VARIACAO = {"saldo_anterior", "variacao", "variacao_percentual"}
+
+# Descrição normalizada, calculada uma vez por lote quando alguma regra a usa
+_TEXTO_NORMALIZADO = "_{}_normalizada"
+
+COLUNAS_ACHADO = ["cod_conta", "descricao", "natureza"]
+COLUNAS_CONTEXTO = ["centro_custo", "periodo_fim"]
+
+_SEVERIDADES = {s.name: s.value for s in Severidade} | {s.value: s.value for s in Severidade}
+
+_conjuntos: "OrderedDict[str, ConjuntoRegras]" = OrderedDict()
+
+# regra_id -> hash do conjunto que o registrou; arquivo -> hash carregado
+_donos_regras: Dict[str, str] = {}
+_conjunto_por_arquivo: Dict[str, str] = {}
+_trava_conjuntos = threading.Lock()
+
+# Conjunto de AUDIPER_REGRAS: ((arquivo, mtime_ns, tamanho), conjunto)
+_regras_padrao: Optional[Tuple[Tuple[str, int, int], "ConjuntoRegras"]] = None
+
+
+# ============================================
+# COMPILAÇÃO DAS CONDIÇÕES
+# ============================================
+
+def _normalizar_termos(termos: Union[str, List[str]]) -> List[str]:
+    termos = [termos] if isinstance(termos, str) else list(termos)
+    return pl.select(normalizar_texto(pl.lit(pl.Series(termos, dtype=pl.String)))).to_series().to_list()
+
+
+def _lista(valor: Any) -> List[Any]:
+    return list(valor) if isinstance(valor, (list, tuple)) else [valor]
+
+
+def _operacao(coluna: str, operador: str, valor: Any, absoluto: bool, textos: Set[str]) -> pl.Expr:
+    """Expressão de um operador sobre uma coluna"""
+
+    expr = pl.col(coluna).abs() if absoluto else pl.col(coluna)
+
+    if operador in ("=", "=="):
+        return expr == valor
+    if operador == "!=":
+        return expr != valor
+    if operador == ">":
+        return expr > valor
+    if operador == ">=":
+        return expr >= valor
+    if operador == "<":
+        return expr < valor
+    if operador == "<=":
+        return expr <= valor
+    if operador == "entre":
+        minimo, maximo = valor
+        return expr.is_between(minimo, maximo, closed="both")
+    if operador == "em":
+        return expr.is_in(_lista(valor))
+    if operador == "fora":
+        return ~expr.is_in(_lista(valor))
+    if operador == "prefixo":
+        return pl.any_horizontal([expr.str.starts_with(p) for p in _lista(valor)])
+    if operador in ("contem", "nao_contem"):
+        textos.add(coluna)
+        contem = pl.col(_TEXTO_NORMALIZADO.format(coluna)).str.contains_any(_normalizar_termos(valor))
+        return contem if operador == "contem" else ~contem
+    if operador == "regex":
+        return expr.str.contains(valor)
+    if operador == "nulo":
+        return expr.is_null() if valor else expr.is_not_null()
+
+    raise ValueError(f"Operador desconhecido: {operador!r}")
+
+
+def _condicao(campo: str, especificacao: Any, colunas: Set[str], textos: Set[str]) -> pl.Expr:
+    """Expressão de uma condição {campo: especificação}"""
+
+    coluna = ALIASES.get(campo, campo)
+    colunas.add(coluna)
+
+    if isinstance(especificacao, dict):
+        especificacao = dict(especificacao)
+        absoluto = bool(especificacao.pop("absoluto", False))
+        if not especificacao:
+            raise ValueError(f"Condição sem operador em {campo!r}")
+        return pl.all_horizontal([
+            _operacao(coluna, operador, valor, absoluto, textos)
+            for operador, valor in especificacao.items()
+        ])
+    if isinstance(especificacao, (list, tuple)):
+        return pl.col(coluna).is_in(list(especificacao))
+    return pl.col(coluna) == especificacao
+
+
+def _grupo(condicoes: Dict[str, Any], colunas: Set[str], textos: Set[str]) -> pl.Expr:
+    """Conjunção das condições de um grupo"""
+    if not condicoes:
+        return pl.lit(True)
+    return pl.all_horizontal([_condicao(c, e, colunas, textos) for c, e in condicoes.items()])
+
+
+# ============================================
+# CONJUNTO DE REGRAS
+# ============================================
+
+@dataclass
+class ConjuntoRegras:
+    """Regras compiladas, prontas para avaliação em lote"""
+
+    hash_definicao: str
+    teste: str
+    regras: List[Regra]
+    # Uma expressão booleana por regra, na ordem de regras
+    condicoes: List[pl.Expr]
+    # Coluna reportada como valor do achado, por regra
+    colunas_valor: List[str]
+    # Condições comuns a todas as regras
+    filtro: Optional[pl.Expr]
+    colunas: Set[str]
+    textos: Set[str]
+
+    @property
+    def usa_variacao(self) -> bool:
+        return bool(self.colunas & COLUNAS_VARIACAO)
+
+    def registrar(self) -> None:
+        """
+        Garante os textos e severidades do conjunto na tabela de regras
+        (apenas para os ids que pertencem a este conjunto)
+        """
+        for regra in self.regras:
+            if _donos_regras.get(regra.regra_id) == self.hash_definicao and obter_regra(regra.regra_id) != regra:
+                registrar_regra(regra)
+
+    def avaliar(
+        self,
+        df_saldos: Union[pl.DataFrame, pl.LazyFrame],
+        periodo_fim: Optional[date] = None,
+    ) -> pl.DataFrame:
+        """Achados do conjunto: uma linha por (saldo, regra atendida)"""
+
+        if not self.regras:
+            return achados_vazios()
+
+        saldos = df_saldos.lazy()
+        disponiveis = set(saldos.collect_schema().names())
+        if self.usa_variacao:
+            saldos = _com_variacao(saldos, disponiveis)
+            disponiveis |= COLUNAS_VARIACAO
+
+        faltantes = sorted(self.colunas - disponiveis)
+        if faltantes:
+            raise ValueError(f"Colunas usadas pelas regras e ausentes nos saldos: {', '.join(faltantes)}")
+
+        if self.textos:
+            saldos = saldos.with_columns(
+                normalizar_texto(pl.col(c)).alias(_TEXTO_NORMALIZADO.format(c)) for c in self.textos
+            )
+
+        filtros = [] if self.filtro is None else [self.filtro]
+        if periodo_fim is not None:
+            filtros.append(pl.col("periodo_fim") == periodo_fim)
+        if filtros:
+            saldos = saldos.filter(pl.all_horizontal(filtros))
+
+        # Passada única: colunas do achado, valores e uma marca booleana por
+        # regra (bits compactados, mesmo com centenas de regras)
+        saida = [c for c in COLUNAS_ACHADO + COLUNAS_CONTEXTO if c in disponiveis]
+        valores = list(dict.fromkeys(self.colunas_valor))
+        colunas = list(dict.fromkeys(saida + valores))
+        marcas = coletar(
+            saldos.select(
+                *colunas,
+                *[condicao.alias(f"_regra_{i}") for i, condicao in enumerate(self.condicoes)],
+            ),
+            tamanho_estimado(df_saldos),
+        )
+
+        # Linhas atendidas por regra, em ordem de regra e de saldo
+        linhas = [marcas.get_column(f"_regra_{i}").arg_true() for i in range(len(self.regras))]
+        indice = pl.concat([
+            pl.repeat(i, len(l), dtype=pl.UInt32, eager=True) for i, l in enumerate(linhas)
+        ]).alias("_regra")
+        achados = marcas.select(colunas)[pl.concat(linhas)].with_columns(indice)
+
+        regra = pl.col("_regra")
+        valor = None
+        for coluna in valores:
+            indices = [i for i, c in enumerate(self.colunas_valor) if c == coluna]
+            valor = (pl.when(regra.is_in(indices)) if valor is None else valor.when(regra.is_in(indices))).then(pl.col(coluna))
+
+        regra_id = regra.replace_strict(
+            {i: r.regra_id for i, r in enumerate(self.regras)}, return_dtype=pl.String
+        )
+
+        return (
+            achados
+            .select(
+                regra_id.alias("regra_id"),
+                *[pl.col(c) if c in disponiveis else pl.lit(None, dtype=pl.String).alias(c) for c in COLUNAS_ACHADO],
+                valor.cast(pl.Float64).alias("valor"),
+                severidade_da_regra(regra_id).alias("severidade"),
+                *[c for c in COLUNAS_CONTEXTO if c in disponiveis],
+            )
+            .with_row_index("id", offset=1)
+        )
+
+
+def _com_variacao(saldos: pl.LazyFrame, disponiveis: Set[str]) -> pl.LazyFrame:
+    """
+    Saldo do período anterior e variação por conta (e centro de custo), como
+    no cubo de centros de custo
+    """
+
+    chaves = [c for c in ["cod_conta", "centro_custo"] if c in disponiveis]
+    saldo = saldo_com_sinal("saldo_final", "ind_saldo_fin")
+    anterior = pl.col("saldo_anterior")
+    return saldo_periodo_anterior(saldos, chaves, saldo).with_columns(
+        (saldo - anterior.fill_null(0.0)).alias("variacao"),
+        pl.when(anterior.fill_null(0.0) != 0)
+        .then((saldo - anterior) / anterior.abs())
+        .otherwise(None)
+        .alias("variacao_percentual"),
+    )
+
+
+def _hash_definicao(definicao: Any) -> str:
+    hasher = novo_hash()
+    hasher.update(json.dumps(definicao, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8"))
+    return hasher.hexdigest()
+
+
+def _reservar_ids(definicao: Dict[str, Any], chave: str, substitui: Optional[str]) -> None:
+    """
+    Recusa ids de regras internas ou de outro conjunto carregado; o conjunto
+    em substitui (versão anterior do mesmo arquivo) cede os seus ids.
+    """
+
+    # Os módulos dos testes internos registram as suas regras ao serem importados
+    from . import testes_auditoria, centros_custo, anomalias, demonstracoes  # noqa: F401
+
+    for item in definicao.get("regras", []):
+        regra_id = item.get("id")
+        if not regra_id:
+            continue
+        dono = _donos_regras.get(regra_id)
+        if dono is None and obter_regra(regra_id) is not None:
+            raise ValueError(f"Regra {regra_id}: id reservado para uma regra interna do Audiper")
+        if dono is not None and dono not in (chave, substitui):
+            raise ValueError(f"Regra {regra_id}: id já usado por outro conjunto de regras carregado")
+
+
+def compilar_regras(definicao: Union[Dict[str, Any], List[Dict[str, Any]]]) -> ConjuntoRegras:
+    """
+    Compila (ou recupera da memória) um conjunto de regras.
+
+    Args:
+        definicao: Dicionário {"teste", "condicoes", "regras"} ou lista de regras
+
+    Returns:
+        ConjuntoRegras, já registrado na tabela de regras
+
+    Raises:
+        ValueError: definição inválida (regra sem id/achado, severidade ou
+            operador desconhecido, id repetido ou já usado por uma regra
+            interna ou por outro conjunto)
+    """
+    return _compilar_conjunto(definicao, substitui=None)
+
+
+def _compilar_conjunto(
+    definicao: Union[Dict[str, Any], List[Dict[str, Any]]],
+    substitui: Optional[str],
+) -> ConjuntoRegras:
+    if isinstance(definicao, list):
+        definicao = {"regras": definicao}
+
+    chave = _hash_definicao(definicao)
+    with _trava_conjuntos:
+        _reservar_ids(definicao, chave, substitui)
+        conjunto = _conjuntos.get(chave) or _montar_conjunto(definicao, chave)
+
+        # Ids da versão anterior do arquivo deixam de ter dono
+        if substitui is not None and substitui != chave:
+            for regra_id, dono in list(_donos_regras.items()):
+                if dono == substitui:
+                    del _donos_regras[regra_id]
+        for regra in conjunto.regras:
+            _donos_regras[regra.regra_id] = chave
+
+        conjunto.registrar()
+        _conjuntos[chave] = conjunto
+        _conjuntos.move_to_end(chave)
+        if len(_conjuntos) > MAXIMO_CONJUNTOS_MEMORIZADOS:
+            _conjuntos.popitem(last=False)
+
+    return conjunto
+
+
+def _montar_conjunto(definicao: Dict[str, Any], chave: str) -> ConjuntoRegras:
+    """Compila as condições da definição em expressões Polars"""
+
+    teste = definicao.get("teste", TESTE_PADRAO)
+    colunas: Set[str] = set()
+    textos: Set[str] = set()
+    filtro = _grupo(definicao["condicoes"], colunas, textos) if definicao.get("condicoes") else None
+
+    regras, condicoes, colunas_valor = [], [], []
+    for posicao, item in enumerate(definicao.get("regras", []), start=1):
+        regra_id = item.get("id")
+        if not regra_id or not item.get("achado"):
+            raise ValueError(f"Regra {posicao}: 'id' e 'achado' são obrigatórios")
+        if any(r.regra_id == regra_id for r in regras):
+            raise ValueError(f"Regra {regra_id}: id repetido no conjunto")
+
+        severidade = _SEVERIDADES.get(str(item.get("severidade", Severidade.ATENCAO.value)).upper())
+        if severidade is None:
+            raise ValueError(f"Regra {regra_id}: severidade desconhecida {item.get('severidade')!r}")
+
+        try:
+            condicao = _grupo(item.get("condicoes", {}), colunas, textos)
+            if item.get("qualquer"):
+                condicao = condicao & pl.any_horizontal([_grupo(g, colunas, textos) for g in item["qualquer"]])
+        except (ValueError, TypeError) as erro:
+            raise ValueError(f"Regra {regra_id}: {erro}") from erro
+
+        coluna_valor = ALIASES.get(item.get("valor", "saldo_final"), item.get("valor", "saldo_final"))
+        colunas.add(coluna_valor)
+
+        regras.append(Regra(
+            regra_id=regra_id,
+            teste=item.get("teste", teste),
+            severidade=severidade,
+            achado=item["achado"],
+            recomendacao=item.get("recomendacao", ""),
+        ))
+        condicoes.append(condicao)
+        colunas_valor.append(coluna_valor)
+
+    return ConjuntoRegras(
+        hash_definicao=chave,
+        teste=teste,
+        regras=regras,
+        condicoes=condicoes,
+        colunas_valor=colunas_valor,
+        filtro=filtro,
+        colunas=colunas,
+        textos=textos,
+    )
+
+
+def carregar_regras(fonte: Union[str, Path, bytes, Dict[str, Any], List[Dict[str, Any]]]) -> ConjuntoRegras:
+    """
+    Lê e compila regras de um arquivo (.json, .yaml, .yml), de um texto
+    JSON/YAML (ex.: upload) ou de um dicionário já carregado.
+
+    Um texto é conteúdo se começar por "{", "[" ou "-" ou tiver mais de uma
+    linha; caso contrário, só é lido como arquivo se terminar em uma das
+    EXTENSOES_REGRAS. Objetos Path são sempre arquivos.
+    """
+
+    if isinstance(fonte, (dict, list)):
+        return compilar_regras(fonte)
+
+    caminho = None
+    if isinstance(fonte, Path) or (
+        isinstance(fonte, str)
+        and not _eh_conteudo(fonte)
+        and fonte.strip().lower().endswith(EXTENSOES_REGRAS)
+    ):
+        caminho = Path(fonte.strip() if isinstance(fonte, str) else fonte)
+        texto = caminho.read_text(encoding="utf-8")
+        eh_yaml = caminho.suffix.lower() in (".yaml", ".yml")
+    else:
+        texto = fonte.decode("utf-8") if isinstance(fonte, bytes) else fonte
+        eh_yaml = not texto.lstrip().startswith(("{", "["))
+
+    if eh_yaml:
+        if yaml is None:
+            raise ImportError("Regras em YAML requerem o pacote 'pyyaml' (pip install pyyaml)")
+        definicao = yaml.safe_load(texto)
+    else:
+        definicao = json.loads(texto)
+
+    if caminho is None:
+        return compilar_regras(definicao)
+
+    # O mesmo arquivo, editado, substitui a própria versão anterior
+    origem = str(caminho.resolve())
+    conjunto = _compilar_conjunto(definicao, substitui=_conjunto_por_arquivo.get(origem))
+    _conjunto_por_arquivo[origem] = conjunto.hash_definicao
+    return conjunto
+
+
+def _eh_conteudo(texto: str) -> bool:
+    """Texto JSON/YAML em linha (e não um caminho de arquivo)"""
+    return "\n" in texto.strip() or texto.lstrip().startswith(("{", "[", "-"))
+
+
+def regras_padrao() -> Optional[ConjuntoRegras]:
+    """
+    Conjunto configurado em AUDIPER_REGRAS (None se não configurado). O
+    arquivo só é relido e recompilado quando muda (mtime ou tamanho).
+    """
+
+    global _regras_padrao
+    if not ARQUIVO_REGRAS:
+        return None
+
+    caminho = Path(ARQUIVO_REGRAS)
+    estado = caminho.stat()
+    assinatura = (str(caminho.resolve()), estado.st_mtime_ns, estado.st_size)
+
+    memorizado = _regras_padrao
+    if memorizado is not None and memorizado[0] == assinatura:
+        return memorizado[1]
+
+    conjunto = carregar_regras(caminho)
+    _regras_padrao = (assinatura, conjunto)
+    return conjunto
+
+
+# ============================================
+# TESTE
+# ============================================
+
+def teste_regras(
+    df_saldos: Union[pl.DataFrame, pl.LazyFrame],
+    regras: Union[ConjuntoRegras, Dict[str, Any], List[Dict[str, Any]], str, Path],
+    periodo_fim: Optional[date] = None,
+) -> Tuple[pl.DataFrame, Dict[str, int]]:
+    """
+    TESTE: Regras declarativas
+
+    Args:
+        df_saldos: Saldos enriquecidos (DataFrame ou LazyFrame)
+        regras: Conjunto compilado ou definição (dicionário, lista, arquivo)
+        periodo_fim: Se informado, avalia apenas os saldos desse período
+            (a variação continua calculada sobre o período anterior)
+
+    Returns:
+        Tupla com (DataFrame de achados, estatísticas)
+    """
+
+    conjunto = regras if isinstance(regras, ConjuntoRegras) else carregar_regras(regras)
+    conjunto.registrar()
+
+    if isinstance(df_saldos, pl.DataFrame) and df_saldos.is_empty():
+        return achados_vazios(), estatisticas_achados(achados_vazios())
+
+    achados = frame_achados(conjunto.avaliar(df_saldos, periodo_fim))
+    return achados, estatisticas_achados(achados)
@@ -5,45 +5,77 @@ Audiper - Sistema de Auditoria Digital
 Testes implementados:
 - Saldos Invertidos (Ativo Credor / Passivo Devedor)
 
-Arquitetura JSON-first: todos os testes retornam List[Dict] para flexibilidade no frontend.
+Todos os testes retornam achados no modelo colunar de core.achados
+(DataFrame tipado + tabela de regras); a formatação fica para a exibição.
 """
 
 import polars as pl
-from typing import List, Dict, Any, Tuple
-from enum import Enum
+from datetime import date
+from typing import Dict, Any, Tuple, Optional, Union
 
+from .achados import (
+    Regra,
+    Severidade,
+    registrar_regra,
+    severidade_da_regra,
+    estatisticas_achados,
+    frame_achados,
+    achados_vazios,
+    formatar_moeda,
+    TIPO_INDICADOR,
+)
+from .cubo_saldos import gerar_cubo_saldos, resumo_por_natureza
+from .classificador import classificador_padrao, COLUNA_RETIFICADORA
+from .execucao import coletar, tamanho_estimado
 
-class Severidade(Enum):
-    """Níveis de severidade dos achados"""
-    CRITICO = "CRÍTICO"
-    ATENCAO = "ATENÇÃO"
-    INFO = "INFO"
-    OK = "OK"
 
+TESTE_SALDOS_INVERTIDOS = "Saldos Invertidos"
 
-def get_cor_severidade(severidade: str) -> str:
-    """Retorna cor para exibição baseado na severidade"""
-    cores = {
-        "CRÍTICO": "#DC2626",   # Vermelho
-        "ATENÇÃO": "#F59E0B",   # Amarelo
-        "INFO": "#3B82F6",      # Azul
-        "OK": "#10B981",        # Verde
-    }
-    return cores.get(severidade, "#6B7280")
+for _regra in [
+    Regra(
+        regra_id="SI-01",
+        teste=TESTE_SALDOS_INVERTIDOS,
+        severidade=Severidade.CRITICO.value,
+        achado="Conta do ATIVO com saldo CREDOR",
+        recomendacao="Verificar se há erro de classificação ou lançamento incorreto. Pode indicar pagamento a maior ou estorno indevido.",
+    ),
+    Regra(
+        regra_id="SI-02",
+        teste=TESTE_SALDOS_INVERTIDOS,
+        severidade=Severidade.CRITICO.value,
+        achado="Conta do PASSIVO com saldo DEVEDOR",
+        recomendacao="Possível pagamento a maior, adiantamento não classificado ou erro de lançamento.",
+    ),
+    Regra(
+        regra_id="SI-03",
+        teste=TESTE_SALDOS_INVERTIDOS,
+        severidade=Severidade.ATENCAO.value,
+        achado="Conta do PL com saldo DEVEDOR",
+        recomendacao="Verificar se é Prejuízo Acumulado (normal) ou erro de classificação.",
+    ),
+    Regra(
+        regra_id="SI-04",
+        teste=TESTE_SALDOS_INVERTIDOS,
+        severidade=Severidade.INFO.value,
+        achado="Saldo em natureza não usual",
+        recomendacao="Analisar razão contábil para verificar origem.",
+    ),
+]:
+    registrar_regra(_regra)
 
 
-def get_emoji_severidade(severidade: str) -> str:
-    """Retorna emoji para exibição"""
-    emojis = {
-        "CRÍTICO": "🔴",
-        "ATENÇÃO": "🟡",
-        "INFO": "🔵",
-        "OK": "🟢",
-    }
-    return emojis.get(severidade, "⚪")
+# Saldo esperado por natureza (RESULTADO depende se é receita ou despesa)
+SALDO_ESPERADO = {
+    "ATIVO": "D",
+    "PASSIVO": "C",
+    "PATRIMÔNIO LÍQUIDO": "C",
+}
 
 
-def teste_saldos_invertidos(df_saldos: pl.DataFrame) -> Tuple[List[Dict[str, Any]], Dict[str, int]]:
+def teste_saldos_invertidos(
+    df_saldos: Union[pl.DataFrame, pl.LazyFrame],
+    periodo_fim: Optional[date] = None,
+) -> Tuple[pl.DataFrame, Dict[str, int]]:
     """
     TESTE: Saldos com Natureza Invertida
     
@@ -59,159 +91,131 @@ def teste_saldos_invertidos(df_saldos: pl.DataFrame) -> Tuple[List[Dict[str, Any
     - Provisões (PDD, etc)
     - Prejuízos Acumulados
     
+    Args:
+        df_saldos: Saldos enriquecidos (DataFrame ou LazyFrame)
+        periodo_fim: Se informado, testa apenas os saldos desse período (I150)
+    
     Returns:
-        Tupla com (lista de achados em JSON, estatísticas)
+        Tupla com (DataFrame de achados, estatísticas)
     """
     
-    if df_saldos.is_empty():
-        return [], {"total": 0, "criticos": 0, "atencao": 0, "info": 0}
+    if isinstance(df_saldos, pl.DataFrame) and df_saldos.is_empty():
+        return achados_vazios(), estatisticas_achados(achados_vazios())
     
     # Filtrar apenas contas analíticas com saldo
-    df_analiticas = df_saldos.filter(
-        (pl.col("tipo_conta") == "A") & 
-        (pl.col("saldo_final") != 0)
+    # (em LazyFrames, filtro e projeção são empurrados para a leitura)
+    filtro = (pl.col("tipo_conta") == "A") & (pl.col("saldo_final") != 0)
+    if periodo_fim is not None:
+        filtro = filtro & (pl.col("periodo_fim") == periodo_fim)
+    
+    natureza = pl.col("natureza")
+    saldo_fin = pl.col("ind_saldo_fin")
+    esperado = natureza.replace_strict(SALDO_ESPERADO, default=None)
+    
+    # Retificadoras são exceção conhecida: usa a classificação feita uma vez
+    # por plano (coluna eh_retificadora); saldos sem a coluna são
+    # classificados apenas pela descrição
+    lf = df_saldos.lazy()
+    if COLUNA_RETIFICADORA in lf.collect_schema().names():
+        eh_retificadora = pl.col(COLUNA_RETIFICADORA).fill_null(False)
+    else:
+        eh_retificadora = classificador_padrao().expressao("descricao")
+    
+    consulta = (
+        lf
+        .filter(filtro)
+        .with_columns(eh_retificadora.alias(COLUNA_RETIFICADORA))
+        .select(["cod_conta", "descricao", "natureza", "saldo_final", "ind_saldo_fin", COLUNA_RETIFICADORA])
+        .with_row_index("id", offset=1)
+        .filter(
+            esperado.is_not_null()
+            & (saldo_fin.fill_null("") != "")
+            & (saldo_fin != esperado)
+            & ~pl.col(COLUNA_RETIFICADORA)
+        )
+        .with_columns(
+            pl.when((natureza == "ATIVO") & (saldo_fin == "C")).then(pl.lit("SI-01"))
+            .when((natureza == "PASSIVO") & (saldo_fin == "D")).then(pl.lit("SI-02"))
+            .when((natureza == "PATRIMÔNIO LÍQUIDO") & (saldo_fin == "D")).then(pl.lit("SI-03"))
+            .otherwise(pl.lit("SI-04"))
+            .alias("regra_id"),
+        )
+        .select(
+            "id",
+            "regra_id",
+            "cod_conta",
+            "descricao",
+            "natureza",
+            esperado.cast(TIPO_INDICADOR).alias("ind_esperado"),
+            # Indicador fora de D/C é tratado como credor, como no relatório anterior
+            pl.when(saldo_fin == "D").then(pl.lit("D")).otherwise(pl.lit("C"))
+            .cast(TIPO_INDICADOR).alias("ind_encontrado"),
+            pl.col("saldo_final").alias("valor"),
+            severidade_da_regra(pl.col("regra_id")).alias("severidade"),
+        )
     )
     
-    if df_analiticas.is_empty():
-        return [], {"total": 0, "criticos": 0, "atencao": 0, "info": 0}
-    
-    # Definir saldo esperado por natureza
-    saldo_esperado = {
-        "ATIVO": "D",
-        "PASSIVO": "C",
-        "PATRIMÔNIO LÍQUIDO": "C",
-        "RESULTADO": None,  # Depende se é receita ou despesa
-        "COMPENSAÇÃO": None,
-        "OUTRAS": None,
-    }
-    
-    # Termos que identificam contas retificadoras
-    termos_retificadoras = [
-        "DEPRECIA", "AMORTIZA", "EXAUST", "PROVISÃO", "PERDAS",
-        "(-)", "RETIFICADORA", "DEVEDORES DUVIDOSOS", "PREJUÍZO",
-        "AJUSTE", "REDUÇÃO"
-    ]
-    
-    achados: List[Dict[str, Any]] = []
-    
-    # Converter para Python dict para iteração
-    registros = df_analiticas.to_dicts()
-    
-    for idx, row in enumerate(registros):
-        natureza = row.get("natureza", "N/A")
-        saldo_fin = row.get("ind_saldo_fin", "")
-        valor_saldo = row.get("saldo_final", 0)
-        descricao = (row.get("descricao") or "").upper()
-        cod_conta = row.get("cod_conta", "")
-        
-        # Verificar se é conta retificadora
-        eh_retificadora = any(termo in descricao for termo in termos_retificadoras)
-        
-        # Obter saldo esperado
-        esperado = saldo_esperado.get(natureza)
-        
-        # Se não há expectativa definida, pular
-        if esperado is None:
-            continue
-            
-        # Verificar se há inversão
-        if saldo_fin and saldo_fin != esperado:
-            # Retificadoras são exceção conhecida
-            if eh_retificadora:
-                continue
-            
-            # Determinar severidade e mensagem
-            if natureza == "ATIVO" and saldo_fin == "C":
-                severidade = Severidade.CRITICO.value
-                achado_msg = "Conta do ATIVO com saldo CREDOR"
-                recomendacao = "Verificar se há erro de classificação ou lançamento incorreto. Pode indicar pagamento a maior ou estorno indevido."
-                
-            elif natureza == "PASSIVO" and saldo_fin == "D":
-                severidade = Severidade.CRITICO.value
-                achado_msg = "Conta do PASSIVO com saldo DEVEDOR"
-                recomendacao = "Possível pagamento a maior, adiantamento não classificado ou erro de lançamento."
-                
-            elif natureza == "PATRIMÔNIO LÍQUIDO" and saldo_fin == "D":
-                severidade = Severidade.ATENCAO.value
-                achado_msg = "Conta do PL com saldo DEVEDOR"
-                recomendacao = "Verificar se é Prejuízo Acumulado (normal) ou erro de classificação."
-                
-            else:
-                severidade = Severidade.INFO.value
-                achado_msg = "Saldo em natureza não usual"
-                recomendacao = "Analisar razão contábil para verificar origem."
-            
-            achados.append({
-                "id": str(idx + 1),
-                "cod_conta": cod_conta,
-                "descricao": row.get("descricao", "N/A"),
-                "natureza": natureza,
-                "saldo_esperado": "Devedor" if esperado == "D" else "Credor",
-                "saldo_encontrado": "Devedor" if saldo_fin == "D" else "Credor",
-                "valor": valor_saldo,
-                "valor_formatado": formatar_moeda(valor_saldo),
-                "severidade": severidade,
-                "emoji": get_emoji_severidade(severidade),
-                "cor": get_cor_severidade(severidade),
-                "achado": achado_msg,
-                "recomendacao": recomendacao,
-            })
-    
-    # Estatísticas
-    stats = {
-        "total": len(achados),
-        "criticos": len([a for a in achados if a["severidade"] == "CRÍTICO"]),
-        "atencao": len([a for a in achados if a["severidade"] == "ATENÇÃO"]),
-        "info": len([a for a in achados if a["severidade"] == "INFO"]),
-    }
+    # Em memória ou no engine streaming, conforme o orçamento (core.execucao)
+    achados = frame_achados(coletar(consulta, tamanho_estimado(df_saldos)))
     
-    return achados, stats
-
-
-def formatar_moeda(valor: float) -> str:
-    """Formata valor para moeda brasileira"""
-    return f"R$ {valor:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
+    return achados, estatisticas_achados(achados)
 
 
-def gerar_resumo_balancete(df_saldos: pl.DataFrame) -> Dict[str, Any]:
+def gerar_resumo_balancete(
+    df_saldos: Union[pl.DataFrame, pl.LazyFrame],
+    df_plano: Optional[pl.DataFrame] = None,
+    chave: Optional[str] = None,
+) -> Dict[str, Any]:
     """
     Gera resumo estatístico do balancete para o dashboard.
     
+    Os totais vêm do cubo de saldos (core.cubo_saldos): saldos com sinal
+    (D positivo, C negativo) no último período, agregados em uma única passada
+    e memorizados por conjunto de dados. As contagens também são do último
+    período: contas distintas (total_contas) e contas analíticas distintas.
+    
+    Args:
+        df_saldos: Saldos enriquecidos (DataFrame ou LazyFrame)
+        df_plano: Plano de contas (habilita Balanço/DRE por conta sintética)
+        chave: Hash do conjunto de dados, se já conhecido
+    
     Returns:
-        Dict com totais por natureza e métricas gerais
+        Dict com totais por natureza, métricas gerais e o cubo
     """
     
-    if df_saldos.is_empty():
-        return {
-            "total_contas": 0,
-            "contas_analiticas": 0,
-            "por_natureza": {},
+    vazio = {
+        "total_contas": 0,
+        "contas_analiticas": 0,
+        "por_natureza": {},
+    }
+    if isinstance(df_saldos, pl.DataFrame) and df_saldos.is_empty():
+        return vazio
+    
+    cubo = gerar_cubo_saldos(df_saldos, df_plano, chave=chave)
+    
+    # Contagens no mesmo período dos totais, agregadas sem coletar os saldos
+    periodos = cubo.periodos.drop_nulls()
+    saldos = df_saldos.lazy()
+    base = cubo.base.lazy()
+    if len(periodos):
+        saldos = saldos.filter(pl.col("periodo_fim") == periodos[-1])
+        base = base.filter(pl.col("periodo_fim") == periodos[-1])
+    total_contas = coletar(saldos.select(pl.col("cod_conta").n_unique()), tamanho_estimado(df_saldos)).item()
+    if not total_contas:
+        return vazio
+    contas_analiticas = base.select(pl.col("cod_conta").n_unique()).collect().item()
+    
+    resumo_natureza = {
+        natureza: {
+            **valores,
+            "total_formatado": formatar_moeda(abs(valores["total"])),
         }
-    
-    # Filtrar analíticas
-    df_analiticas = df_saldos.filter(pl.col("tipo_conta") == "A")
-    
-    # Agrupar por natureza
-    resumo_natureza = {}
-    
-    naturezas = ["ATIVO", "PASSIVO", "PATRIMÔNIO LÍQUIDO", "RESULTADO"]
-    
-    for nat in naturezas:
-        df_nat = df_analiticas.filter(pl.col("natureza") == nat)
-        
-        if not df_nat.is_empty():
-            # Somar valores considerando D como positivo e C como negativo para o total
-            total = df_nat.select(pl.col("saldo_final").sum()).item()
-            qtd = df_nat.height
-            
-            resumo_natureza[nat] = {
-                "quantidade": qtd,
-                "total": total,
-                "total_formatado": formatar_moeda(abs(total)),
-            }
+        for natureza, valores in resumo_por_natureza(cubo).items()
+    }
     
     return {
-        "total_contas": df_saldos.height,
-        "contas_analiticas": df_analiticas.height,
+        "total_contas": total_contas,
+        "contas_analiticas": contas_analiticas,
         "por_natureza": resumo_natureza,
+        "cubo": cubo,
     }
@@ -7,8 +7,10 @@ não há arquivo SPED real disponível.
 """
 
 import polars as pl
+from datetime import date
 from typing import Tuple
 from core.leitor_sped import DadosEmpresa
+from core.classificador import classificar_plano
 
 
 def gerar_dados_demonstracao() -> Tuple[DadosEmpresa, pl.DataFrame, pl.DataFrame]:
@@ -129,19 +131,25 @@ def gerar_dados_demonstracao() -> Tuple[DadosEmpresa, pl.DataFrame, pl.DataFrame
         # Resultado
         {"cod_conta": "4.1.01", "saldo_final": 480000.00, "ind_saldo_fin": "C", "valor_debito": 0.00, "valor_credito": 480000.00, "saldo_inicial": 0.0, "ind_saldo_ini": "C", "centro_custo": ""},
         {"cod_conta": "4.1.02", "saldo_final": 120000.00, "ind_saldo_fin": "C", "valor_debito": 0.00, "valor_credito": 120000.00, "saldo_inicial": 0.0, "ind_saldo_ini": "C", "centro_custo": ""},
-        {"cod_conta": "5.1.01", "saldo_final": 288000.00, "ind_saldo_fin": "D", "valor_debito": 288000.00, "valor_credito": 0.00, "saldo_inicial": 0.0, "ind_saldo_ini": "D", "centro_custo": ""},
-        {"cod_conta": "5.2.01", "saldo_final": 144000.00, "ind_saldo_fin": "D", "valor_debito": 144000.00, "valor_credito": 0.00, "saldo_inicial": 0.0, "ind_saldo_ini": "D", "centro_custo": ""},
+        # Custos e despesas com pessoal rateados por centro de custo
+        {"cod_conta": "5.1.01", "saldo_final": 200000.00, "ind_saldo_fin": "D", "valor_debito": 200000.00, "valor_credito": 0.00, "saldo_inicial": 0.0, "ind_saldo_ini": "D", "centro_custo": "CC100"},
+        {"cod_conta": "5.1.01", "saldo_final": 88000.00, "ind_saldo_fin": "D", "valor_debito": 88000.00, "valor_credito": 0.00, "saldo_inicial": 0.0, "ind_saldo_ini": "D", "centro_custo": "CC200"},
+        {"cod_conta": "5.2.01", "saldo_final": 60000.00, "ind_saldo_fin": "D", "valor_debito": 60000.00, "valor_credito": 0.00, "saldo_inicial": 0.0, "ind_saldo_ini": "D", "centro_custo": "CC100"},
+        {"cod_conta": "5.2.01", "saldo_final": 84000.00, "ind_saldo_fin": "D", "valor_debito": 84000.00, "valor_credito": 0.00, "saldo_inicial": 0.0, "ind_saldo_ini": "D", "centro_custo": "CC300"},
         {"cod_conta": "5.2.02", "saldo_final": 72000.00, "ind_saldo_fin": "D", "valor_debito": 72000.00, "valor_credito": 0.00, "saldo_inicial": 0.0, "ind_saldo_ini": "D", "centro_custo": ""},
         {"cod_conta": "5.2.03", "saldo_final": 19000.00, "ind_saldo_fin": "D", "valor_debito": 19000.00, "valor_credito": 0.00, "saldo_inicial": 0.0, "ind_saldo_ini": "D", "centro_custo": ""},
     ]
     
     # Criar DataFrames
-    df_plano = pl.DataFrame(plano_contas_data)
-    df_saldos = pl.DataFrame(saldos_data)
+    df_plano = classificar_plano(pl.DataFrame(plano_contas_data))
+    df_saldos = pl.DataFrame(saldos_data).with_columns(
+        pl.lit(date(2024, 1, 1)).alias("periodo_inicio"),
+        pl.lit(date(2024, 12, 31)).alias("periodo_fim"),
+    )
     
     # Enriquecer saldos com dados do plano
     df_saldos = df_saldos.join(
-        df_plano.select(["cod_conta", "descricao", "natureza", "tipo_conta"]),
+        df_plano.select(["cod_conta", "descricao", "natureza", "tipo_conta", "eh_retificadora"]),
         on="cod_conta",
         how="left"
     )
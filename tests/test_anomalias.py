@@ -0,0 +1,45 @@
+"""
+Testes das Anomalias Mensais
+Audiper - Sistema de Auditoria Digital
+"""
+
+from datetime import date
+
+import polars as pl
+
+from core import anomalias
+
+
+MESES = [date(2024, m, 1) for m in range(1, 8)]
+
+
+def _saldos(linhas) -> pl.DataFrame:
+    return pl.DataFrame(
+        linhas,
+        schema=["cod_conta", "periodo_fim", "valor_debito", "saldo_final", "ind_saldo_fin"],
+        orient="row",
+    ).with_columns(
+        pl.col("periodo_fim").dt.month_end(),
+        pl.lit(0.0).alias("valor_credito"),
+        pl.lit("A").alias("tipo_conta"),
+        pl.lit("CONTA").alias("descricao"),
+        pl.lit("ATIVO").alias("natureza"),
+    )
+
+
+def test_meses_sem_i155_contam_como_dormentes_e_nao_como_anteriores():
+    # Conta X: saldo devedor em janeiro, sem I155 de fevereiro a abril e
+    # credora a partir de maio; conta Y cobre todos os meses da escrituração
+    linhas = [
+        ("X", MESES[0], 50.0, 50_000.0, "D"),
+        ("X", MESES[4], 20_000.0, 60_000.0, "C"),
+        ("X", MESES[5], 10.0, 60_000.0, "C"),
+    ]
+    linhas += [("Y", mes, 1.0, 1.0, "D") for mes in MESES]
+
+    achados, _ = anomalias.teste_anomalias_mensais(_saldos(linhas))
+    regras = achados.filter(pl.col("cod_conta") == "X").get_column("regra_id").cast(pl.String).to_list()
+
+    # Maio volta a movimentar após três meses sem movimento (AM-03), mas não
+    # é comparado com o saldo de janeiro, que não é o mês anterior (AM-02)
+    assert regras == ["AM-03"]
@@ -0,0 +1,61 @@
+"""
+Testes da Conciliação das Demonstrações
+Audiper - Sistema de Auditoria Digital
+"""
+
+import io
+
+from core import demonstracoes as modulo
+from core.leitor_sped import processar_sped_ecd
+
+
+# ECD no leiaute 6.00: J100 sem IND_COD_AGL/COD_AGL_SUP e J150 com IND_VL
+ECD_LEIAUTE_6 = "\n".join([
+    "|0000|LECD|01012023|31122023|EMPRESA TESTE LTDA|12345678000190|SP|",
+    "|I010|G|6.00|",
+    "|I050|01012023|01|S|1|1||ATIVO|",
+    "|I050|01012023|01|A|2|1.1|1|CAIXA|",
+    "|I052||1.01|",
+    "|I050|01012023|01|A|2|1.2|1|CLIENTES|",
+    "|I052||1.02|",
+    "|I050|01012023|02|S|1|2||PASSIVO|",
+    "|I050|01012023|02|A|2|2.1|2|FORNECEDORES|",
+    "|I052||2.01|",
+    "|I050|01012023|04|S|1|3||RESULTADO|",
+    "|I050|01012023|04|A|2|3.1|3|RECEITA DE VENDAS|",
+    "|I052||3.01|",
+    "|I050|01012023|04|A|2|3.2|3|DESPESAS GERAIS|",
+    "|I052||3.02|",
+    "|I150|01122023|31122023|",
+    "|I155|1.1||0,00|D|700,00|0,00|700,00|D|",
+    "|I155|1.2||0,00|D|300,00|0,00|300,00|D|",
+    "|I155|2.1||0,00|C|0,00|600,00|600,00|C|",
+    "|I155|3.1||0,00|C|0,00|1.000,00|1.000,00|C|",
+    "|I155|3.2||0,00|D|600,00|0,00|600,00|D|",
+    "|I350|31122023|",
+    "|I355|3.1||1.000,00|C|",
+    "|I355|3.2||600,00|D|",
+    "|J005|01012023|31122023|1||",
+    "|J100|1|1|A|ATIVO|1.000,00|D|0,00|D||",
+    "|J100|1.01|2|A|CAIXA|700,00|D|0,00|D||",
+    "|J100|1.02|2|A|CLIENTES|300,00|D|0,00|D||",
+    "|J100|2|1|P|PASSIVO|600,00|C|0,00|C||",
+    "|J100|2.01|2|P|FORNECEDORES|600,00|C|0,00|C||",
+    "|J150|3.01|1|RECEITA DE VENDAS|1.000,00|R|0,00|R||",
+    "|J150|3.02|1|DESPESAS GERAIS|600,00|D|0,00|D||",
+    "|J150|3.99|1|RESULTADO DO EXERCICIO|400,00|P|0,00|P||",
+]) + "\n"
+
+
+def test_leiaute_6_concilia_sem_divergencias():
+    _, df_plano, df_saldos, _ = processar_sped_ecd(ECD_LEIAUTE_6)
+    demonstracoes = modulo.processar_demonstracoes(io.BytesIO(ECD_LEIAUTE_6.encode("utf-8")))
+
+    # IND_VL R/P são credores, D devedor; totalizadores sobem pelo NIVEL_AGL
+    dre = dict(demonstracoes.dre.select("cod_agl", "ind_dc_fin").iter_rows())
+    assert dre == {"3.01": "C", "3.02": "D", "3.99": "C"}
+    balanco = dict(demonstracoes.balanco.select("cod_agl", "cod_agl_sup").iter_rows())
+    assert balanco == {"1": None, "1.01": "1", "1.02": "1", "2": None, "2.01": "2"}
+
+    achados, _ = modulo.teste_conciliacao_demonstracoes(demonstracoes, df_saldos, df_plano, chave="leiaute-6")
+    assert achados.is_empty()
@@ -0,0 +1,50 @@
+"""
+Testes do Leitor Paralelo
+Audiper - Sistema de Auditoria Digital
+"""
+
+from core import leitor_paralelo
+from core.leitor_paralelo import processar_sped_ecd_paralelo
+from core.leitor_sped import processar_sped_ecd_arquivo
+
+
+MESES = [("01012023", "31012023"), ("01022023", "28022023"), ("01032023", "31032023")]
+
+
+def _escrever_ecd(caminho) -> bytes:
+    """ECD com 3 períodos I150 de 5 saldos I155 cada"""
+    linhas = [
+        "|0000|LECD|01012023|31122023|EMPRESA TESTE LTDA|12345678000190|SP|",
+        "|I010|G|9.00|",
+        "|I050|01012023|01|S|1|1||ATIVO|",
+    ]
+    linhas += [f"|I050|01012023|01|A|2|1.{i}|1|CONTA {i}|" for i in range(5)]
+    for inicio, fim in MESES:
+        linhas.append(f"|I150|{inicio}|{fim}|")
+        linhas += [f"|I155|1.{i}||100,00|D|10,00|5,00|105,00|D|" for i in range(5)]
+    conteudo = ("\n".join(linhas) + "\n").encode("utf-8")
+    caminho.write_bytes(conteudo)
+    return conteudo
+
+
+def test_fatia_iniciada_apos_i150_mantem_periodo(tmp_path, monkeypatch):
+    caminho = tmp_path / "ecd.txt"
+    conteudo = _escrever_ecd(caminho)
+
+    # Corte logo após o I150 de fevereiro: os I155 de fevereiro começam a
+    # segunda fatia sem nenhum I150 antes deles
+    marcador = b"|I150|01022023|28022023|\n"
+    corte = conteudo.index(marcador) + len(marcador)
+    monkeypatch.setattr(leitor_paralelo, "TAMANHO_MINIMO_PARALELO", 0)
+    monkeypatch.setattr(
+        leitor_paralelo,
+        "dividir_em_fatias",
+        lambda mapa, quantidade: [(0, corte), (corte, len(mapa))],
+    )
+
+    _, plano_paralelo, saldos_paralelo, _ = processar_sped_ecd_paralelo(str(caminho), processos=2)
+    _, plano_serial, saldos_serial, _ = processar_sped_ecd_arquivo(str(caminho))
+
+    assert saldos_paralelo.equals(saldos_serial)
+    assert plano_paralelo.equals(plano_serial)
+    assert saldos_paralelo.group_by("periodo_fim").len().get_column("len").to_list() == [5, 5, 5]